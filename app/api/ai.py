@@ -132,6 +132,7 @@ SYSTEM_PROMPT = """你是一个专业的OKX多因子量化交易策略生成助
 【注意】
 1. 必须同时包含 buy_groups 和 sell_groups（买入与卖出逻辑）。
 2. indicator_type 与 signal_type 必须完全使用上述定义的大写枚举名称，不能随意编写其他名称。
+3. 如需多周期共振，可在条件上增加可选字段 "timeframe"（如 "4H"、"1D"，必须大于策略执行周期），表示该条件在大周期上计算。
 """
 
 
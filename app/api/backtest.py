@@ -1,21 +1,36 @@
 from __future__ import annotations
 
 import json
+import time
 import traceback
-from datetime import datetime
-from typing import Any, List
+from typing import Any, Dict, List, Literal, Tuple
 
 import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.models import Backtest, Kline, Strategy
-from app.schemas import Backtest as BacktestSchema, BacktestCreate
-from app.services.backtest_engine import run_backtest
+from app.models import Backtest, Strategy, Symbol
+from app.schemas import Backtest as BacktestSchema, BacktestBatchCreate, BacktestCreate, MonteCarloRequest
+from app.services.backtest_jobs import (
+    BACKTEST_FINISHED,
+    BACKTEST_PENDING,
+    BACKTEST_RUNNING,
+    BacktestTask,
+    backtest_jobs,
+    store_backtest_result,
+)
+from app.services.batch_backtest import BatchCell, run_backtest_batch
+from app.services.equity_curve import DISPLAY_MAX_POINTS, downsample_curves, unpack_curves
+from app.services.kline_store import load_klines
+from app.services.monte_carlo import run_monte_carlo, trades_list_pnls
+from app.services.result_cache import backtest_cache_key, query_fingerprint, result_cache
 
 router = APIRouter(prefix="/backtests", tags=["backtests"])
 
+# 批量回测的单次请求最多回测数量（策略数 × 品种数 × 周期数）
+MAX_BATCH_BACKTESTS = 500
+
 
 @router.get("/", response_model=List[BacktestSchema])
 def list_backtests(db: Session = Depends(get_db)) -> List[BacktestSchema]:
@@ -24,6 +39,70 @@ def list_backtests(db: Session = Depends(get_db)) -> List[BacktestSchema]:
     return backtests
 
 
+@router.get("/{backtest_id}/equity")
+def get_backtest_equity(
+    backtest_id: int,
+    resolution: Literal["display", "full"] = "display",
+    max_points: int = Query(DISPLAY_MAX_POINTS, ge=10, le=100000),
+    db: Session = Depends(get_db),
+) -> dict:
+    """获取回测净值 / 基准曲线：默认返回降采样后的展示版本，resolution=full 时返回全分辨率曲线"""
+    backtest = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+    if not backtest:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+
+    if backtest.equity_blob:
+        equity_curve, benchmark_curve = unpack_curves(backtest.equity_blob)
+        total_points = len(equity_curve)
+        if resolution == "display":
+            equity_curve, benchmark_curve = downsample_curves(equity_curve, benchmark_curve, max_points)
+        return {
+            "backtest_id": backtest_id,
+            "resolution": resolution,
+            "total_points": total_points,
+            "equity_curve": equity_curve.to_points(),
+            "benchmark_curve": benchmark_curve.to_points(),
+        }
+
+    # 历史回测记录没有压缩副本，直接返回 result_json 中保存的曲线
+    result = json.loads(backtest.result_json) if backtest.result_json else {}
+    equity_points = result.get("equity_curve") or []
+    return {
+        "backtest_id": backtest_id,
+        "resolution": resolution,
+        "total_points": len(equity_points),
+        "equity_curve": equity_points,
+        "benchmark_curve": result.get("benchmark_curve") or [],
+    }
+
+
+@router.post("/{backtest_id}/monte-carlo")
+def run_backtest_monte_carlo(backtest_id: int, payload: MonteCarloRequest, db: Session = Depends(get_db)) -> dict:
+    """对回测的逐笔交易做蒙特卡洛重抽样，返回总收益率 / 最大回撤的分位数分布与权益分位数带"""
+    backtest = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+    if not backtest:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+
+    result = json.loads(backtest.result_json) if backtest.result_json else {}
+    try:
+        summary = run_monte_carlo(
+            trades_list_pnls(result.get("trades_list") or []),
+            backtest.initial_balance,
+            n_paths=payload.n_paths,
+            method=payload.method,
+            n_trades=payload.n_trades,
+            seed=payload.seed,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "backtest_id": backtest_id,
+        "initial_balance": backtest.initial_balance,
+        **summary.to_dict(),
+    }
+
+
 @router.delete("/{backtest_id}")
 def delete_backtest(backtest_id: int, db: Session = Depends(get_db)) -> dict:
     """删除回测记录"""
@@ -38,102 +117,216 @@ def delete_backtest(backtest_id: int, db: Session = Depends(get_db)) -> dict:
 
 @router.post("/", response_model=BacktestSchema)
 def create_backtest(payload: BacktestCreate, db: Session = Depends(get_db)) -> Any:
-    try:
-        strategy = db.query(Strategy).filter(Strategy.id == payload.strategy_id).first()
-        if not strategy:
-            raise HTTPException(status_code=404, detail="Strategy not found")
+    """创建回测并加入任务队列，立即返回 PENDING 状态的回测记录；进度通过 /{id}/progress 查询"""
+    strategy = db.query(Strategy).filter(Strategy.id == payload.strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
 
-        query = db.query(Kline).filter(
-            Kline.symbol_id == strategy.symbol_id,
-            Kline.timeframe == strategy.timeframe,
-        )
-        if payload.start_ts:
-            query = query.filter(Kline.ts >= payload.start_ts)
-        if payload.end_ts:
-            query = query.filter(Kline.ts <= payload.end_ts)
-
-        klines = query.order_by(Kline.ts.asc()).all()
-        if not klines:
-            raise HTTPException(status_code=400, detail="未找到对应的K线回测数据，请先下载该周期的K线数据")
-
-        actual_start_ts = payload.start_ts or klines[0].ts
-        actual_end_ts = payload.end_ts or klines[-1].ts
-
-        bt = Backtest(
-            strategy_id=strategy.id,
-            start_ts=actual_start_ts,
-            end_ts=actual_end_ts,
-            initial_balance=payload.initial_balance,
-            status="RUNNING",
-        )
-        db.add(bt)
-        db.commit()
-        db.refresh(bt)
+    fingerprint = query_fingerprint(db, strategy.symbol_id, strategy.timeframe, payload.start_ts, payload.end_ts)
+    if not fingerprint["count"]:
+        raise HTTPException(status_code=400, detail="未找到对应的K线回测数据，请先下载该周期的K线数据")
 
-        df = pd.DataFrame(
-            [
-                {
-                    "ts": k.ts,
-                    "open": k.open,
-                    "high": k.high,
-                    "low": k.low,
-                    "close": k.close,
-                    "volume": k.volume,
-                }
-                for k in klines
-            ]
+    bt = Backtest(
+        strategy_id=strategy.id,
+        symbol_id=strategy.symbol_id,
+        timeframe=strategy.timeframe,
+        start_ts=payload.start_ts or fingerprint["start"],
+        end_ts=payload.end_ts or fingerprint["end"],
+        initial_balance=payload.initial_balance,
+        status=BACKTEST_PENDING,
+    )
+
+    # 相同规则、参数与 K 线数据的回测已完成过时，直接复制其结果，不再入队
+    cache_key = backtest_cache_key(
+        "backtest",
+        json.loads(strategy.config_json),
+        fingerprint,
+        payload.initial_balance,
+        stop_loss_pct=strategy.stop_loss_pct,
+        take_profit_pct=strategy.take_profit_pct,
+        trailing_stop_pct=strategy.trailing_stop_pct,
+        fee_rate=payload.fee_rate,
+        slippage_pct=payload.slippage_pct,
+    )
+    cached_id = result_cache.get(cache_key)
+    if cached_id is not None:
+        source = db.query(Backtest).filter(Backtest.id == cached_id).first()
+        if source is not None and source.status == BACKTEST_FINISHED:
+            bt.result_json = source.result_json
+            bt.equity_blob = source.equity_blob
+            bt.status = BACKTEST_FINISHED
+            db.add(bt)
+            db.commit()
+            db.refresh(bt)
+            return bt
+        result_cache.discard(cache_key)
+
+    db.add(bt)
+    db.commit()
+    db.refresh(bt)
+
+    backtest_id = bt.id
+    dataset = (strategy.symbol_id, strategy.timeframe)
+
+    def remember(status: str) -> None:
+        if status == BACKTEST_FINISHED:
+            result_cache.put(cache_key, backtest_id, dataset=dataset, size=256)
+
+    backtest_jobs.submit(
+        BacktestTask(backtest_id=bt.id, fee_rate=payload.fee_rate, slippage_pct=payload.slippage_pct),
+        on_done=remember,
+    )
+    return bt
+
+
+@router.get("/{backtest_id}", response_model=BacktestSchema)
+def get_backtest(backtest_id: int, db: Session = Depends(get_db)) -> Any:
+    """获取单条回测记录"""
+    backtest = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+    if not backtest:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+    return backtest
+
+
+@router.get("/{backtest_id}/progress")
+def get_backtest_progress(backtest_id: int, db: Session = Depends(get_db)) -> dict:
+    """查询回测状态与进度（已处理 Bar 的百分比）"""
+    backtest = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+    if not backtest:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+
+    progress = backtest_jobs.progress(backtest_id)
+    if progress is None:
+        progress = 100.0 if backtest.status == BACKTEST_FINISHED else 0.0
+    return {"backtest_id": backtest_id, "status": backtest.status, "progress": progress}
+
+
+@router.post("/{backtest_id}/cancel")
+def cancel_backtest(backtest_id: int, db: Session = Depends(get_db)) -> dict:
+    """取消排队中或运行中的回测"""
+    backtest = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+    if not backtest:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+    if backtest.status not in (BACKTEST_PENDING, BACKTEST_RUNNING) or not backtest_jobs.cancel(backtest_id):
+        raise HTTPException(status_code=400, detail=f"回测当前状态为 {backtest.status}，无法取消")
+    return {"backtest_id": backtest_id, "message": "已请求取消回测"}
+
+
+@router.post("/batch")
+def create_backtest_batch(payload: BacktestBatchCreate, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """批量回测（策略 × 品种 × 周期）：每个 (品种, 周期) 的 K 线只加载一次、指标只计算一次，全部回测并行执行，
+    每个回测照常保存为回测记录，返回精简的对比表"""
+    start_time = time.time()
+
+    found = {s.id: s for s in db.query(Strategy).filter(Strategy.id.in_(payload.strategy_ids)).all()}
+    missing = [i for i in payload.strategy_ids if i not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Strategy not found: {missing}")
+
+    matrix: List[Tuple[Strategy, int, str]] = []
+    for strategy_id in dict.fromkeys(payload.strategy_ids):
+        strategy = found[strategy_id]
+        for symbol_id in dict.fromkeys(payload.symbol_ids or [strategy.symbol_id]):
+            for timeframe in dict.fromkeys(payload.timeframes or [strategy.timeframe]):
+                matrix.append((strategy, symbol_id, timeframe))
+    if not matrix:
+        raise HTTPException(status_code=400, detail="请至少选择一个策略")
+    if len(matrix) > MAX_BATCH_BACKTESTS:
+        raise HTTPException(status_code=400, detail=f"单次批量回测最多 {MAX_BATCH_BACKTESTS} 个，当前 {len(matrix)} 个")
+
+    symbol_ids = {symbol_id for _, symbol_id, _ in matrix}
+    symbols = {s.id: s for s in db.query(Symbol).filter(Symbol.id.in_(symbol_ids)).all()}
+    missing = sorted(symbol_ids - set(symbols))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Symbol not found: {missing}")
+
+    # 每个 (品种, 周期) 只加载一次 K 线
+    datasets: List[pd.DataFrame] = []
+    dataset_index: Dict[Tuple[int, str], int] = {}
+    rows: List[Dict[str, Any]] = []
+    cells: List[BatchCell] = []
+    cell_rows: List[int] = []
+    for strategy, symbol_id, timeframe in matrix:
+        key = (symbol_id, timeframe)
+        if key not in dataset_index:
+            dataset_index[key] = len(datasets)
+            datasets.append(load_klines(db, symbol_id, timeframe, payload.start_ts, payload.end_ts))
+        df = datasets[dataset_index[key]]
+        rows.append(
+            {
+                "strategy_id": strategy.id,
+                "strategy_name": strategy.name,
+                "symbol_id": symbol_id,
+                "inst_id": symbols[symbol_id].inst_id,
+                "timeframe": timeframe,
+                "kline_count": len(df),
+                "backtest_id": None,
+                "error": None if len(df) else "未找到对应的K线回测数据，请先下载该周期的K线数据",
+            }
         )
+        if len(df):
+            cells.append(
+                BatchCell(
+                    dataset=dataset_index[key],
+                    rule_set=json.loads(strategy.config_json),
+                    stop_loss_pct=strategy.stop_loss_pct,
+                    take_profit_pct=strategy.take_profit_pct,
+                    trailing_stop_pct=strategy.trailing_stop_pct,
+                )
+            )
+            cell_rows.append(len(rows) - 1)
 
-        rule_set = json.loads(strategy.config_json)
-        result = run_backtest(
-            df=df,
-            rule_set=rule_set,
+    try:
+        stored: List[Tuple[int, Backtest]] = []
+        for index, result in run_backtest_batch(
+            datasets,
+            cells,
             initial_balance=payload.initial_balance,
-            stop_loss_pct=strategy.stop_loss_pct,
-            take_profit_pct=strategy.take_profit_pct,
-            trailing_stop_pct=strategy.trailing_stop_pct,
             fee_rate=payload.fee_rate,
             slippage_pct=payload.slippage_pct,
-        )
-
-
-        bt.status = "FINISHED"
-        bt.result_json = json.dumps({
-            "equity_curve": result.equity_curve,
-            "benchmark_curve": result.benchmark_curve,
-            "trades_list": result.trades_list,
-            "trade_count": result.trade_count,
-            "win_count": result.win_count,
-            "loss_count": result.loss_count,
-            "total_return": result.total_return,
-            "benchmark_return": result.benchmark_return,
-            "win_rate": result.win_rate,
-            "sharpe_ratio": result.sharpe_ratio,
-            "max_drawdown": result.max_drawdown,
-            "profit_factor": result.profit_factor,
-            "avg_trade_pnl": result.avg_trade_pnl,
-            "max_win": result.max_win,
-            "max_loss": result.max_loss,
-            "stop_loss_pct": strategy.stop_loss_pct,
-            "take_profit_pct": strategy.take_profit_pct,
-            "trailing_stop_pct": strategy.trailing_stop_pct,
-        })
+            workers=payload.workers,
+        ):
+            strategy, symbol_id, timeframe = matrix[cell_rows[index]]
+            df = datasets[cells[index].dataset]
+            bt = Backtest(
+                strategy_id=strategy.id,
+                symbol_id=symbol_id,
+                timeframe=timeframe,
+                start_ts=payload.start_ts or df["ts"].iat[0].to_pydatetime(),
+                end_ts=payload.end_ts or df["ts"].iat[-1].to_pydatetime(),
+                initial_balance=payload.initial_balance,
+                status="FINISHED",
+            )
+            store_backtest_result(bt, result, strategy)
+            db.add(bt)
+            stored.append((cell_rows[index], bt))
+            rows[cell_rows[index]].update(
+                {
+                    "total_return": round(result.total_return, 2),
+                    "benchmark_return": round(result.benchmark_return, 2),
+                    "annual_return": round(result.annual_return, 2),
+                    "sharpe_ratio": round(result.sharpe_ratio, 3),
+                    "sortino_ratio": round(result.sortino_ratio, 3),
+                    "max_drawdown": round(result.max_drawdown, 2),
+                    "win_rate": round(result.win_rate, 2),
+                    "profit_factor": round(result.profit_factor, 2),
+                    "trade_count": result.trade_count,
+                    "exposure": round(result.exposure, 2),
+                }
+            )
         db.commit()
-        db.refresh(bt)
-
-        return bt
-
-        
-    except HTTPException:
-        raise
     except Exception as e:
-        print(f"回测错误: {e}")
+        db.rollback()
+        print(f"批量回测错误: {e}")
         traceback.print_exc()
-        
-        # 更新回测状态为失败
-        if 'bt' in locals():
-            bt.status = "FAILED"
-            bt.result_json = json.dumps({"error": str(e)})
-            db.commit()
-        
-        raise HTTPException(status_code=500, detail=f"回测执行失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量回测执行失败: {str(e)}")
+
+    for row_index, bt in stored:
+        rows[row_index]["backtest_id"] = bt.id
+
+    return {
+        "elapsed_seconds": round(time.time() - start_time, 2),
+        "dataset_count": len(datasets),
+        "backtest_ids": [bt.id for _, bt in sorted(stored, key=lambda item: item[0])],
+        "results": rows,
+    }
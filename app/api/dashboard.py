@@ -8,6 +8,7 @@ from app.db.session import get_db
 from app.models import AccountEquitySnapshot, LiveTrade
 from app.core.config import settings
 from app.services.okx_client import OkxClient
+from app.services.timings import phase_histograms
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
@@ -122,3 +123,16 @@ async def get_account_balance() -> dict:
             "total_equity": 0,
             "balances": []
         }
+
+
+@router.get("/timings")
+def get_phase_timings() -> dict:
+    """进程级耗时统计：回测 / 寻优 / 组合回测各阶段的耗时直方图，以及各 SignalType 的求值次数与耗时"""
+    return phase_histograms.snapshot()
+
+
+@router.delete("/timings")
+def reset_phase_timings() -> dict:
+    """清空耗时统计"""
+    phase_histograms.reset()
+    return {"message": "耗时统计已清空"}
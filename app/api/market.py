@@ -12,6 +12,19 @@ from sqlalchemy import func, and_
 from app.core.config import settings
 from app.db.session import get_db
 from app.models import Kline, Symbol
+from app.services.kline_coverage import (
+    coverage_intervals,
+    data_gaps,
+    kline_count,
+    missing_intervals,
+    naive_utc,
+    record_coverage,
+    remove_coverage,
+)
+from app.services.kline_downloader import DEFAULT_CONCURRENCY, download_klines
+from app.services.kline_ingest import bulk_insert_klines, decode_candles
+from app.services.kline_store import kline_store
+from app.services.result_cache import result_cache
 
 router = APIRouter(prefix="/market", tags=["market"])
 
@@ -58,164 +71,173 @@ async def sync_klines(payload: KlineSyncRequest, db: Session = Depends(get_db))
 
     base_url = settings.okx_base_url.rstrip("/")
 
+    # 只请求覆盖索引中尚未同步的区间，已同步的时间段不再重复下载
+    gaps = [
+        (gap_start.replace(tzinfo=timezone.utc), gap_end.replace(tzinfo=timezone.utc))
+        for gap_start, gap_end in missing_intervals(db, symbol.id, payload.timeframe, start_ts, end_ts)
+    ]
+    db.commit()
+    print(f"[K线下载] 未同步区间 {len(gaps)} 段: " + ", ".join(f"{a.isoformat()} ~ {b.isoformat()}" for a, b in gaps))
+
+    inserted = 0
+    fetch_count = 0
+    max_fetch_attempts = 100  # 增加到100次，支持更长时间范围
+    aborted = False
+
     async with httpx.AsyncClient(base_url=base_url, timeout=60.0, trust_env=True) as client:
         # 关键修复：使用 history-candles 接口获取历史数据，而不是 candles 接口
         # history-candles 支持更长时间范围的历史数据，candles 只返回最近13天
         # 使用 after 参数从新到旧下载，after 表示获取该时间之前的数据
-        after_ms: Optional[int] = int(end_ts.timestamp() * 1000)  # 从结束时间开始
-        inserted = 0
-        fetch_count = 0
-        max_fetch_attempts = 100  # 增加到100次，支持更长时间范围
-
-        while fetch_count < max_fetch_attempts:
-            params: dict[str, Any] = {
-                "instId": payload.inst_id,
-                "bar": payload.timeframe,
-                "limit": str(payload.limit_per_call),
-            }
-            # 使用 after 参数，获取在该时间之前的数据
-            params["after"] = str(after_ms)
-            
-            fetch_count += 1
-            after_dt = datetime.fromtimestamp(after_ms / 1000.0, tz=timezone.utc)
-            print(f"[K线下载] 第{fetch_count}次请求, 已插入{inserted}条, after={after_dt.isoformat()}")
-            print(f"[K线下载] 请求参数: {params}")
-            
-            try:
-                # 关键：使用 history-candles 接口
-                resp = await client.get("/api/v5/market/history-candles", params=params)
-                print(f"[K线下载] HTTP响应状态码: {resp.status_code}")
-                resp.raise_for_status()
-                data = resp.json()
-                print(f"[K线下载] API响应 code: {data.get('code')}, msg: {data.get('msg')}")
-            except httpx.TimeoutException as e:
-                print(f"[K线下载] 请求超时: {str(e)}，已下载{inserted}条")
-                break
-            except httpx.HTTPStatusError as e:
-                print(f"[K线下载] HTTP错误: {e.response.status_code} - {e.response.text}")
-                break
-            except Exception as e:
-                print(f"[K线下载] 请求异常: {type(e).__name__}: {str(e)}")
-                import traceback
-                print(f"[K线下载] 详细错误:\n{traceback.format_exc()}")
-                break
-            
-            rows: List[list[Any]] = data.get("data", [])
-            print(f"[K线下载] 获取到 {len(rows)} 条原始数据")
-            
-            if not rows:
-                print(f"[K线下载] 没有更多数据")
-                break
+        for gap_start, gap_end in gaps:
+            after_ms: Optional[int] = int(gap_end.timestamp() * 1000) + 1  # 从区间终点（含）开始
+            covered_from: Optional[datetime] = None  # 本区间已确认同步到的最早时间
 
-            # OKX API返回的数据是从新到旧排列，最后一条是最旧的
-            # 打印原始顺序的第一条和最后一条
-            first_raw_ts = datetime.fromtimestamp(int(rows[0][0]) / 1000.0, tz=timezone.utc)
-            last_raw_ts = datetime.fromtimestamp(int(rows[-1][0]) / 1000.0, tz=timezone.utc)
-            print(f"[K线下载] API返回数据: {last_raw_ts.isoformat()}(旧) ~ {first_raw_ts.isoformat()}(新)")
+            while fetch_count < max_fetch_attempts:
+                params: dict[str, Any] = {
+                    "instId": payload.inst_id,
+                    "bar": payload.timeframe,
+                    "limit": str(payload.limit_per_call),
+                }
+                # 使用 after 参数，获取在该时间之前的数据
+                params["after"] = str(after_ms)
             
-            # 按时间升序排列用于存储
-            rows_sorted = sorted(rows, key=lambda r: int(r[0]))
+                fetch_count += 1
+                after_dt = datetime.fromtimestamp(after_ms / 1000.0, tz=timezone.utc)
+                print(f"[K线下载] 第{fetch_count}次请求, 已插入{inserted}条, after={after_dt.isoformat()}")
+                print(f"[K线下载] 请求参数: {params}")
             
-            # 删除这个重复的调试输出，已经在上面打印过了
-            # if rows_sorted:
-            #     first_ts = datetime.fromtimestamp(int(rows_sorted[0][0]) / 1000.0, tz=timezone.utc)
-            #     last_ts = datetime.fromtimestamp(int(rows_sorted[-1][0]) / 1000.0, tz=timezone.utc)
-            #     print(f"[K线下载] 本批数据时间: {first_ts.isoformat()} ~ {last_ts.isoformat()}")
+                try:
+                    # 关键：使用 history-candles 接口
+                    resp = await client.get("/api/v5/market/history-candles", params=params)
+                    print(f"[K线下载] HTTP响应状态码: {resp.status_code}")
+                    resp.raise_for_status()
+                    data = resp.json()
+                    print(f"[K线下载] API响应 code: {data.get('code')}, msg: {data.get('msg')}")
+                except httpx.TimeoutException as e:
+                    print(f"[K线下载] 请求超时: {str(e)}，已下载{inserted}条")
+                    aborted = True
+                    break
+                except httpx.HTTPStatusError as e:
+                    print(f"[K线下载] HTTP错误: {e.response.status_code} - {e.response.text}")
+                    aborted = True
+                    break
+                except Exception as e:
+                    print(f"[K线下载] 请求异常: {type(e).__name__}: {str(e)}")
+                    import traceback
+                    print(f"[K线下载] 详细错误:\n{traceback.format_exc()}")
+                    aborted = True
+                    break
+
+                # 错误响应的 data 同样为空，不能当作"没有更多数据"登记覆盖，否则该区间以后永远不会再下载
+                if data.get("code") != "0":
+                    print(f"[K线下载] OKX 返回错误 code={data.get('code')} msg={data.get('msg')}，停止下载")
+                    aborted = True
+                    break
+
+                rows: List[list[Any]] = data.get("data", [])
+                print(f"[K线下载] 获取到 {len(rows)} 条原始数据")
             
-            skipped_early = 0
-            skipped_late = 0
-            skipped_exists = 0
-            batch_inserted = 0  # 本批次插入数量
-
-            for item in rows_sorted:
-                ts_ms = int(item[0])
-                ts = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
-                
-                # 跳过超出时间范围的数据（太早的数据）
-                if ts < start_ts:
-                    skipped_early += 1
-                    continue
-                
-                # 跳过超出时间范围的数据（太晚的数据）
-                if ts > end_ts:
-                    skipped_late += 1
-                    continue
-
-                open_price = float(item[1])
-                high = float(item[2])
-                low = float(item[3])
-                close = float(item[4])
-                vol = float(item[5])
-
-                exists = (
-                    db.query(Kline)
-                    .filter(
-                        Kline.symbol_id == symbol.id,
-                        Kline.timeframe == payload.timeframe,
-                        Kline.ts == ts,
-                    )
-                    .first()
-                )
-                if exists:
-                    skipped_exists += 1
-                    continue
+                if not rows:
+                    print(f"[K线下载] 没有更多数据")
+                    covered_from = gap_start
+                    break
 
-                k = Kline(
-                    symbol_id=symbol.id,
-                    timeframe=payload.timeframe,
-                    ts=ts,
-                    open=open_price,
-                    high=high,
-                    low=low,
-                    close=close,
-                    volume=vol,
-                    quote_volume=None,
-                )
-                db.add(k)
-                inserted += 1
-                batch_inserted += 1
+                # OKX API返回的数据是从新到旧排列，最后一条是最旧的
+                # 打印原始顺序的第一条和最后一条
+                first_raw_ts = datetime.fromtimestamp(int(rows[0][0]) / 1000.0, tz=timezone.utc)
+                last_raw_ts = datetime.fromtimestamp(int(rows[-1][0]) / 1000.0, tz=timezone.utc)
+                print(f"[K线下载] API返回数据: {last_raw_ts.isoformat()}(旧) ~ {first_raw_ts.isoformat()}(新)")
             
-            print(f"[K线下载] 过滤统计: 太早{skipped_early}条, 太晚{skipped_late}条, 已存在{skipped_exists}条, 本批插入{batch_inserted}条, 总计{inserted}条")
+                # 整页解码为列数组（按时间升序、过滤时间范围外的数据），一条 INSERT ... ON CONFLICT DO NOTHING 批量写入
+                page = decode_candles(rows, gap_start, gap_end)
+                skipped_early = page.skipped_early
+                skipped_late = page.skipped_late
+                batch_inserted = bulk_insert_klines(db, symbol.id, payload.timeframe, page)
+                skipped_exists = len(page) - batch_inserted
+                inserted += batch_inserted
 
-            db.commit()
+                print(f"[K线下载] 过滤统计: 太早{skipped_early}条, 太晚{skipped_late}条, 已存在{skipped_exists}条, 本批插入{batch_inserted}条, 总计{inserted}条")
+
+                db.commit()
+                if batch_inserted:
+                    kline_store.append(db, symbol.id, payload.timeframe, page)
             
-            # 关键检查：如果本批所有数据都"too late"（太晚），说明after参数设置有问题
-            # 这通常意味着end_ts已经是过去时间，API只能返回更新的数据
-            if skipped_late == len(rows) and skipped_late > 0:
-                print(f"[K线下载] 本批所有数据都超过end_ts，无法获取更早数据，停止下载")
-                print(f"[K线下载] 提示：end_ts={end_ts.isoformat()}可能是过去时间，请检查时间范围设置")
-                break
+                # 关键检查：如果本批所有数据都"too late"（太晚），说明after参数设置有问题
+                # 这通常意味着end_ts已经是过去时间，API只能返回更新的数据
+                if skipped_late == len(rows) and skipped_late > 0:
+                    print(f"[K线下载] 本批所有数据都超过end_ts，无法获取更早数据，停止下载")
+                    print(f"[K线下载] 提示：end_ts={gap_end.isoformat()}可能是过去时间，请检查时间范围设置")
+                    aborted = True
+                    break
             
-            # 如果本批数据全部已存在或被过滤，说明这个时间段的数据已经下载过了
-            if batch_inserted == 0 and len(rows) > 0:
-                print(f"[K线下载] 本批无新数据插入，可能是重复请求或数据已存在")
-                # 但仍需继续往更早的时间下载，不要直接break
-
-            # 使用最旧的数据作为下次请求的 after 参数
-            # OKX API返回的数据是从新到旧，最后一条是最旧的
-            oldest_ts_ms = int(rows[-1][0])
-            oldest_ts = datetime.fromtimestamp(oldest_ts_ms / 1000.0, tz=timezone.utc)
+                # 如果本批数据全部已存在或被过滤，说明这个时间段的数据已经下载过了
+                if batch_inserted == 0 and len(rows) > 0:
+                    print(f"[K线下载] 本批无新数据插入，可能是重复请求或数据已存在")
+                    # 但仍需继续往更早的时间下载，不要直接break
+
+                # 使用最旧的数据作为下次请求的 after 参数
+                # OKX API返回的数据是从新到旧，最后一条是最旧的
+                oldest_ts_ms = int(rows[-1][0])
+                oldest_ts = datetime.fromtimestamp(oldest_ts_ms / 1000.0, tz=timezone.utc)
+                covered_from = max(oldest_ts, gap_start)
             
-            print(f"[K线下载] 本批最旧数据: {oldest_ts.isoformat()}")
-            print(f"[K线下载] 下一次after参数: {oldest_ts.isoformat()}")
+                print(f"[K线下载] 本批最旧数据: {oldest_ts.isoformat()}")
+                print(f"[K线下载] 下一次after参数: {oldest_ts.isoformat()}")
             
-            # 如果最旧的数据已经比start_ts还早，停止下载
-            if oldest_ts < start_ts:
-                print(f"[K线下载] 已达到起始时间，停止下载")
-                break
+                # 如果最旧的数据已达到区间起点，本区间下载完成
+                if oldest_ts <= gap_start:
+                    print(f"[K线下载] 已达到起始时间，停止下载")
+                    break
             
-            # 如果时间戳没有变化，说明API没有返回更早的数据了
-            if oldest_ts_ms >= after_ms:
-                print(f"[K线下载] 时间戳未前进（{oldest_ts_ms} >= {after_ms}），API可能无更早数据")
-                break
+                # 如果时间戳没有变化，说明API没有返回更早的数据了
+                if oldest_ts_ms >= after_ms:
+                    print(f"[K线下载] 时间戳未前进（{oldest_ts_ms} >= {after_ms}），API可能无更早数据")
+                    covered_from = gap_start
+                    break
             
-            # 更新after参数为本批最旧的时间戳
-            after_ms = oldest_ts_ms
+                # 更新after参数为本批最旧的时间戳
+                after_ms = oldest_ts_ms
+
+            # 登记本区间已同步的部分：[covered_from, gap_end]
+            if covered_from is not None:
+                record_coverage(db, symbol.id, payload.timeframe, covered_from, gap_end)
+                db.commit()
+            if aborted:
+                break
 
     print(f"[K线下载] 完成，总计插入{inserted}条")
+    if inserted:
+        # 数据已变化，清除基于该品种周期旧数据的回测缓存
+        result_cache.invalidate(symbol.id, payload.timeframe)
     return {"inserted": inserted}
 
 
+class KlineBatchSyncItem(BaseModel):
+    inst_id: str = Field(..., description="OKX 交易对，例如 BTC-USDT-SWAP")
+    timeframe: str = Field(..., description="K线周期，如 1m/5m/1H/4H/1D")
+    start_ts: datetime = Field(..., description="开始时间，UTC 时间")
+    end_ts: Optional[datetime] = Field(None, description="结束时间，UTC 时间，不填为当前时间")
+
+
+class KlineBatchSyncRequest(BaseModel):
+    jobs: List[KlineBatchSyncItem] = Field(..., min_length=1, max_length=200)
+    concurrency: int = Field(DEFAULT_CONCURRENCY, ge=1, le=32, description="并发请求数（总速率仍受 OKX 限频约束）")
+
+
+@router.post("/klines/sync-batch")
+async def sync_klines_batch(payload: KlineBatchSyncRequest) -> dict:
+    """批量并发下载多个品种 / 周期的K线：各时间段并发拉取、统一限频、单连接写库，返回各任务统计与每秒K线数"""
+    report = await download_klines(
+        [(job.inst_id, job.timeframe, job.start_ts, job.end_ts) for job in payload.jobs],
+        concurrency=payload.concurrency,
+    )
+    print(
+        f"[K线批量下载] 完成 {len(payload.jobs)} 个任务: 请求{report['requests']}次, 获取{report['fetched']}条, "
+        f"插入{report['inserted']}条, 用时{report['elapsed_seconds']}秒, {report['candles_per_sec']}条/秒"
+    )
+    return report
+
+
 class KlineDataInfo(BaseModel):
     """K线数据统计信息"""
     symbol_id: int
@@ -269,6 +291,42 @@ def get_kline_stats(db: Session = Depends(get_db)) -> List[KlineDataInfo]:
     return results
 
 
+@router.get("/klines/gaps")
+def get_kline_gaps(
+    inst_id: str = Query(..., description="交易对"),
+    timeframe: str = Query(..., description="K线周期"),
+    start_ts: Optional[datetime] = Query(None, description="开始时间（UTC），不填为最早的已同步时间"),
+    end_ts: Optional[datetime] = Query(None, description="结束时间（UTC），不填为当前时间"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    查询K线缺口
+    - coverage：已与交易所同步过的连续时间段
+    - missing：查询范围内尚未同步的时间段（下次同步只会请求这些时间段）
+    - data_gaps：本地K线中相邻两根间隔超过一个周期的空洞（交易所停机或未同步）
+    """
+    symbol = db.query(Symbol).filter(Symbol.inst_id == inst_id).first()
+    if not symbol:
+        raise HTTPException(status_code=404, detail=f"交易对 {inst_id} 不存在")
+
+    coverage = coverage_intervals(db, symbol.id, timeframe)
+    db.commit()
+    start = naive_utc(start_ts) if start_ts else (coverage[0][0] if coverage else None)
+    end = naive_utc(end_ts) if end_ts else datetime.utcnow()
+    missing = missing_intervals(db, symbol.id, timeframe, start, end) if start is not None and start <= end else []
+
+    return {
+        "inst_id": inst_id,
+        "timeframe": timeframe,
+        "start_ts": start,
+        "end_ts": end,
+        "kline_count": kline_count(db, symbol.id, timeframe),
+        "coverage": [{"start_ts": a, "end_ts": b} for a, b in coverage],
+        "missing": [{"start_ts": a, "end_ts": b} for a, b in missing],
+        "data_gaps": data_gaps(db, symbol.id, timeframe, start, end),
+    }
+
+
 @router.delete("/klines/clean")
 def clean_klines(
     inst_id: Optional[str] = Query(None, description="交易对，不填则清空所有"),
@@ -293,7 +351,11 @@ def clean_klines(
             query = query.filter(Kline.timeframe == timeframe)
     
     deleted_count = query.delete()
+    remove_coverage(db, symbol.id if inst_id else None, timeframe if inst_id else None)
     db.commit()
+    kline_store.drop(symbol.id if inst_id else None, timeframe if inst_id else None)
+    if deleted_count:
+        result_cache.invalidate(symbol.id if inst_id else None, timeframe if inst_id else None)
     
     return {
         "deleted": deleted_count,
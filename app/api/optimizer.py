@@ -1,20 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.models import Kline, Strategy
+from app.models import Strategy
+from app.services.kline_store import load_klines
 from app.services.optimizer import run_grid_search
+from app.services.optimizer_jobs import PROGRESS_INTERVAL, TERMINAL_STATUSES, OptimizerJob, optimizer_jobs
+from app.services.param_search import SEARCH_MODES
+from app.services.timings import PhaseTimer, phase_histograms
+from app.services.walk_forward import run_walk_forward
 
 router = APIRouter(prefix="/optimizer", tags=["optimizer"])
 
+SSE_KEEPALIVE_SECONDS = 15.0
+
 
 class OptimizerRunRequest(BaseModel):
     strategy_id: int
@@ -23,6 +33,19 @@ class OptimizerRunRequest(BaseModel):
     initial_balance: float = 10000.0
     param_grid: Dict[str, List[Any]]
     max_combinations: int = 80
+    workers: Optional[int] = None  # 工作进程数，为空时按组合数与 CPU 核数自动选择
+    search_mode: str = "grid"  # grid / random / lhs（拉丁超立方）/ halving（逐次减半）
+    n_samples: Optional[int] = None  # random / lhs / halving 的抽样组合数，为空时同 max_combinations
+    seed: Optional[int] = None  # 随机种子，固定后抽样结果可复现
+    top_k: int = 100  # 结果排行榜保留的条数
+    halving_eta: int = 3  # 逐次减半每轮保留 1/eta 的组合
+
+
+class WalkForwardRequest(OptimizerRunRequest):
+    n_folds: int = 5  # 测试折数
+    train_test_ratio: float = 3.0  # 训练折长度 / 测试折长度（rolling 模式）
+    anchored: bool = False  # True 时训练折均从区间起点开始（扩张窗口）
+    purge_bars: int = 0  # 训练折与测试折之间的隔离 K 线数
 
 
 class ApplyBestParamsRequest(BaseModel):
@@ -30,64 +53,176 @@ class ApplyBestParamsRequest(BaseModel):
     params: Dict[str, Any]
 
 
-@router.post("/run")
-def run_optimization(payload: OptimizerRunRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
-    """对指定策略在历史 K 线数据上运行网格参数寻优"""
+def _load_search_inputs(
+    payload: OptimizerRunRequest, db: Session, timer: PhaseTimer
+) -> Tuple[Strategy, pd.DataFrame, Dict[str, Any]]:
+    """校验请求并读取策略、K 线与规则，K 线读取耗时记入 timer"""
     strategy = db.query(Strategy).filter(Strategy.id == payload.strategy_id).first()
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
+    if payload.search_mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"search_mode 只能是 {', '.join(SEARCH_MODES)}")
 
     start_dt = datetime.fromisoformat(payload.start_ts.replace("Z", "+00:00")).replace(tzinfo=None)
     end_dt = datetime.fromisoformat(payload.end_ts.replace("Z", "+00:00")).replace(tzinfo=None)
 
-    klines = (
-        db.query(Kline)
-        .filter(
-            Kline.symbol_id == strategy.symbol_id,
-            Kline.timeframe == strategy.timeframe,
-            Kline.ts >= start_dt,
-            Kline.ts <= end_dt,
-        )
-        .order_by(Kline.ts.asc())
-        .all()
-    )
-
-    if not klines:
+    df = load_klines(db, strategy.symbol_id, strategy.timeframe, start_dt, end_dt, timer=timer)
+    if df.empty:
         raise HTTPException(status_code=400, detail="所选时间段内无已下载的K线数据，请先前往数据管理下载")
 
-    df = pd.DataFrame(
-        [
-            {
-                "ts": k.ts,
-                "open": k.open,
-                "high": k.high,
-                "low": k.low,
-                "close": k.close,
-                "volume": k.volume,
-            }
-            for k in klines
-        ]
-    )
-
     rule_set = json.loads(strategy.config_json)
+    return strategy, df, rule_set
+
+
+def _search_kwargs(payload: OptimizerRunRequest) -> Dict[str, Any]:
+    return {
+        "param_grid": payload.param_grid,
+        "initial_balance": payload.initial_balance,
+        "max_combinations": payload.max_combinations,
+        "workers": payload.workers,
+        "search_mode": payload.search_mode,
+        "n_samples": payload.n_samples,
+        "seed": payload.seed,
+        "top_k": payload.top_k,
+        "halving_eta": payload.halving_eta,
+    }
 
-    search_result = run_grid_search(
-        df=df,
-        base_rule_set=rule_set,
-        param_grid=payload.param_grid,
-        initial_balance=payload.initial_balance,
-        max_combinations=payload.max_combinations,
-    )
 
+def _strategy_meta(strategy: Strategy, df: pd.DataFrame) -> Dict[str, Any]:
     return {
         "strategy_id": strategy.id,
         "strategy_name": strategy.name,
         "timeframe": strategy.timeframe,
-        "kline_count": len(klines),
+        "kline_count": len(df),
+    }
+
+
+def _get_job(job_id: str) -> OptimizerJob:
+    job = optimizer_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Optimizer job not found")
+    return job
+
+
+@router.post("/run")
+def run_optimization(payload: OptimizerRunRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """对指定策略在历史 K 线数据上运行参数寻优（网格 / 随机 / 拉丁超立方 / 逐次减半），完成后一次性返回结果"""
+    timer = PhaseTimer()
+    strategy, df, rule_set = _load_search_inputs(payload, db, timer)
+
+    search_result = run_grid_search(df=df, base_rule_set=rule_set, timer=timer, **_search_kwargs(payload))
+    phase_histograms.record("optimizer", search_result["timings"])
+
+    return {
+        **_strategy_meta(strategy, df),
         **search_result,
     }
 
 
+@router.post("/walk-forward")
+def run_walk_forward_optimization(payload: WalkForwardRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """滚动前推寻优：各训练折寻优、紧随其后的测试折做样本外回测，返回逐折结果与拼接后的样本外净值"""
+    strategy, df, rule_set = _load_search_inputs(payload, db, PhaseTimer())
+
+    try:
+        result = run_walk_forward(
+            df=df,
+            base_rule_set=rule_set,
+            param_grid=payload.param_grid,
+            initial_balance=payload.initial_balance,
+            n_folds=payload.n_folds,
+            train_test_ratio=payload.train_test_ratio,
+            anchored=payload.anchored,
+            purge_bars=payload.purge_bars,
+            workers=payload.workers,
+            max_combinations=payload.max_combinations,
+            search_mode=payload.search_mode,
+            n_samples=payload.n_samples,
+            seed=payload.seed,
+            halving_eta=payload.halving_eta,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        **_strategy_meta(strategy, df),
+        **result,
+    }
+
+
+@router.post("/jobs")
+def create_optimization_job(payload: OptimizerRunRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """创建后台寻优任务并立即返回任务 id；进度通过 /optimizer/jobs/{job_id}/events 订阅"""
+    timer = PhaseTimer()
+    strategy, df, rule_set = _load_search_inputs(payload, db, timer)
+    meta = _strategy_meta(strategy, df)
+    search_kwargs = _search_kwargs(payload)
+
+    def run(job: OptimizerJob) -> Dict[str, Any]:
+        search_result = run_grid_search(
+            df=df,
+            base_rule_set=rule_set,
+            progress=job.on_progress,
+            cancel_event=job.cancel_event,
+            timer=timer,
+            **search_kwargs,
+        )
+        phase_histograms.record("optimizer", search_result["timings"])
+        return {**meta, **search_result}
+
+    job = optimizer_jobs.submit(meta, run)
+    return job.snapshot()
+
+
+@router.get("/jobs")
+def list_optimization_jobs() -> List[Dict[str, Any]]:
+    """列出内存中的寻优任务（不含最终结果）"""
+    return [job.snapshot() for job in reversed(optimizer_jobs.list())]
+
+
+@router.get("/jobs/{job_id}")
+def get_optimization_job(job_id: str) -> Dict[str, Any]:
+    """查询寻优任务状态；任务结束后 result 为完整结果（与 /optimizer/run 的返回相同）"""
+    return _get_job(job_id).snapshot(include_result=True)
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_optimization_job(job_id: str) -> Dict[str, Any]:
+    """取消寻优任务；运行中的任务保留已完成组合的结果"""
+    _get_job(job_id)
+    return optimizer_jobs.cancel(job_id).snapshot()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_optimization_job(job_id: str) -> StreamingResponse:
+    """以 SSE 推送寻优进度：状态或排行榜变化时发送 progress 事件，任务结束时发送 done 事件后关闭"""
+    job = _get_job(job_id)
+
+    async def events():
+        last_version = -1
+        last_sent = time.time()
+        while True:
+            snapshot = job.snapshot()
+            if snapshot["version"] != last_version:
+                last_version = snapshot["version"]
+                last_sent = time.time()
+                yield f"event: progress\ndata: {json.dumps(snapshot, ensure_ascii=False, default=str)}\n\n"
+            elif time.time() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                # 注释行保持连接，避免反向代理因空闲超时断开
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            if snapshot["status"] in TERMINAL_STATUSES:
+                yield f"event: done\ndata: {json.dumps({'job_id': job.id, 'status': snapshot['status']})}\n\n"
+                return
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/apply-best")
 def apply_best_params(payload: ApplyBestParamsRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """将寻优出的最优参数一键更新回策略"""
@@ -4,14 +4,15 @@ import json
 from datetime import datetime
 from typing import Any, Dict, List
 
-import pandas as pd
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.models import Kline, Strategy
+from app.models import Strategy
+from app.services.kline_store import load_klines
 from app.services.portfolio_engine import PortfolioStrategyConfig, run_portfolio_backtest
+from app.services.timings import PhaseTimer, phase_histograms
 
 router = APIRouter(prefix="/portfolio", tags=["portfolio"])
 
@@ -37,6 +38,7 @@ def run_portfolio_simulation(
         raise HTTPException(status_code=400, detail="请至少选择一个策略参与投资组合")
 
     configs: List[PortfolioStrategyConfig] = []
+    timer = PhaseTimer()
 
     for alloc in payload.allocations:
         strategy = db.query(Strategy).filter(Strategy.id == alloc.strategy_id).first()
@@ -46,35 +48,10 @@ def run_portfolio_simulation(
         start_dt = datetime.fromisoformat(alloc.start_ts.replace("Z", "+00:00")).replace(tzinfo=None)
         end_dt = datetime.fromisoformat(alloc.end_ts.replace("Z", "+00:00")).replace(tzinfo=None)
 
-        klines = (
-            db.query(Kline)
-            .filter(
-                Kline.symbol_id == strategy.symbol_id,
-                Kline.timeframe == strategy.timeframe,
-                Kline.ts >= start_dt,
-                Kline.ts <= end_dt,
-            )
-            .order_by(Kline.ts.asc())
-            .all()
-        )
-
-        if not klines:
+        df = load_klines(db, strategy.symbol_id, strategy.timeframe, start_dt, end_dt, timer=timer)
+        if df.empty:
             continue
 
-        df = pd.DataFrame(
-            [
-                {
-                    "ts": k.ts,
-                    "open": k.open,
-                    "high": k.high,
-                    "low": k.low,
-                    "close": k.close,
-                    "volume": k.volume,
-                }
-                for k in klines
-            ]
-        )
-
         try:
             rule_set = json.loads(strategy.config_json)
         except Exception:
@@ -99,6 +76,9 @@ def run_portfolio_simulation(
     result = run_portfolio_backtest(
         strategies=configs,
         initial_balance=payload.initial_balance,
+        timer=timer,
     )
+    if "timings" in result:
+        phase_histograms.record("portfolio", result["timings"])
 
     return result
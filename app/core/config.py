@@ -50,6 +50,26 @@ class Settings(BaseSettings):
         validation_alias=AliasChoices("ai_model", "AI_MODEL", "ai_model_name", "AI_MODEL_NAME"),
     )
 
+    # 回测结果缓存（LRU）：最多缓存条数与估算内存上限(MB)
+    result_cache_max_entries: int = Field(
+        default=2048,
+        validation_alias=AliasChoices("result_cache_max_entries", "RESULT_CACHE_MAX_ENTRIES"),
+    )
+    result_cache_max_mb: int = Field(
+        default=256,
+        validation_alias=AliasChoices("result_cache_max_mb", "RESULT_CACHE_MAX_MB"),
+    )
+
+    # K 线存储后端：sql（直接查询 klines 表）/ npy（内存映射列存文件，klines 表仍为权威来源）
+    kline_store_backend: str = Field(
+        default="sql",
+        validation_alias=AliasChoices("kline_store_backend", "KLINE_STORE_BACKEND"),
+    )
+    kline_store_dir: str = Field(
+        default="./data/klines",
+        validation_alias=AliasChoices("kline_store_dir", "KLINE_STORE_DIR"),
+    )
+
     model_config = SettingsConfigDict(
         env_file=(".env", "/app/.env"),
         env_file_encoding="utf-8",
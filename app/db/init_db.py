@@ -28,6 +28,15 @@ def init_db() -> None:
                 conn.execute(text("ALTER TABLE symbols ADD COLUMN is_custom BOOLEAN DEFAULT 0"))
             if "created_at" not in sym_cols:
                 conn.execute(text("ALTER TABLE symbols ADD COLUMN created_at DATETIME"))
+            # 自动补充 backtests 表新增字段
+            bt_info = conn.execute(text("PRAGMA table_info(backtests)"))
+            bt_cols = [row[1] for row in bt_info.fetchall()]
+            if "equity_blob" not in bt_cols:
+                conn.execute(text("ALTER TABLE backtests ADD COLUMN equity_blob BLOB"))
+            if "symbol_id" not in bt_cols:
+                conn.execute(text("ALTER TABLE backtests ADD COLUMN symbol_id INTEGER"))
+            if "timeframe" not in bt_cols:
+                conn.execute(text("ALTER TABLE backtests ADD COLUMN timeframe VARCHAR(16)"))
 
             # 预置 TradFi 大宗商品、美股指数与加密货币标的列表
             preset_symbols = [
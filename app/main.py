@@ -10,12 +10,18 @@ from app.db.init_db import init_db
 from app.api import api_router
 from app.workers.live_trading import start_scheduler, shutdown_scheduler
 from app.services.okx_ws import okx_ws_client
+from app.services.backtest_jobs import backtest_jobs
+from app.services.optimizer_jobs import optimizer_jobs
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 初始化数据库（如果表不存在）
     init_db()
+    # 上次未执行完的回测已无进程在运行，标记为失败
+    interrupted = backtest_jobs.fail_interrupted()
+    if interrupted:
+        print(f"[回测] {interrupted} 个未完成的回测已标记为 FAILED")
     # 启动调度器（用于实盘策略执行等）
     start_scheduler()
     # 启动 OKX WebSocket 行情接收
@@ -35,6 +41,12 @@ async def lifespan(app: FastAPI):
         shutdown_scheduler()
     except Exception:
         pass
+    # 取消未完成的寻优与回测任务
+    try:
+        optimizer_jobs.shutdown()
+        backtest_jobs.shutdown()
+    except Exception:
+        pass
 
 
 def create_app() -> FastAPI:
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String, Text, UniqueConstraint, ForeignKey
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, LargeBinary, String, Text, UniqueConstraint, ForeignKey
 from sqlalchemy.orm import relationship
 
 from app.db.session import Base
@@ -68,6 +68,18 @@ class Kline(Base):
     quote_volume = Column(Float, nullable=True)
 
 
+class KlineCoverage(Base):
+    """已与交易所同步过的连续时间段 [start_ts, end_ts]（UTC），同一品种周期的区间互不重叠、互不相邻"""
+
+    __tablename__ = "kline_coverage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    symbol_id = Column(Integer, ForeignKey("symbols.id"), nullable=False, index=True)
+    timeframe = Column(String(16), nullable=False)
+    start_ts = Column(DateTime, nullable=False)
+    end_ts = Column(DateTime, nullable=False)
+
+
 class Strategy(Base):
     __tablename__ = "strategies"
 
@@ -94,11 +106,14 @@ class Backtest(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     strategy_id = Column(Integer, ForeignKey("strategies.id"), nullable=False)
+    symbol_id = Column(Integer, ForeignKey("symbols.id"), nullable=True)  # 回测品种（为空时为策略的默认品种）
+    timeframe = Column(String(16), nullable=True)  # 回测周期（为空时为策略的默认周期）
     start_ts = Column(DateTime, nullable=False)
     end_ts = Column(DateTime, nullable=False)
     initial_balance = Column(Float, nullable=False)
     status = Column(String(32), default="PENDING")  # PENDING/RUNNING/FINISHED/FAILED
-    result_json = Column(Text, nullable=True)
+    result_json = Column(Text, nullable=True)  # 统计指标、交易明细与降采样后的展示曲线
+    equity_blob = Column(LargeBinary, nullable=True)  # 压缩的全分辨率净值 / 基准曲线
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -154,8 +154,29 @@ class BacktestCreate(BacktestBase):
     pass
 
 
+class MonteCarloRequest(BaseModel):
+    n_paths: int = 1000  # 模拟路径数
+    method: str = "bootstrap"  # bootstrap（有放回抽样）/ shuffle（随机重排）
+    n_trades: Optional[int] = None  # 每条路径的交易数（仅 bootstrap），默认与原始交易数相同
+    seed: Optional[int] = None  # 随机种子
+
+
+class BacktestBatchCreate(BaseModel):
+    strategy_ids: List[int]
+    symbol_ids: Optional[List[int]] = None  # 为空时各策略使用自己的品种
+    timeframes: Optional[List[str]] = None  # 为空时各策略使用自己的周期
+    start_ts: Optional[datetime] = None
+    end_ts: Optional[datetime] = None
+    initial_balance: float = 10000.0
+    fee_rate: float = 0.0
+    slippage_pct: float = 0.0
+    workers: Optional[int] = None  # 工作进程数，为空时按回测数量与 CPU 核数自动选择
+
+
 class Backtest(BacktestBase):
     id: int
+    symbol_id: Optional[int] = None
+    timeframe: Optional[str] = None
     start_ts: datetime
     end_ts: datetime
     status: str
@@ -1,116 +1,358 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Dict, List
+import re
+import time
+import weakref
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
 from app.models import BacktestTrade
+from app.services.equity_curve import EquityCurve
+from app.services.metrics import compute_metrics
+from app.services.trade_log import LONG, SHORT, TradeLog
+from app.services.multi_timeframe import attach_higher_timeframe, split_timeframe_column
+from app.services.rolling import rolling_mad, rolling_max, rolling_mean, rolling_min, rolling_std
 from app.services.strategy_engine import (
+    KLINE_COLUMNS,
+    CompiledRuleSet,
     StrategyRuleSet,
-    should_buy,
-    should_sell,
-    should_open_long,
-    should_close_long,
-    should_open_short,
-    should_close_short,
+    boll_columns,
+    cci_column,
+    compile_rule_set,
+    kdj_columns,
+    ma_column,
+    macd_columns,
+    rsi_column,
+    timeframe_column,
 )
+from app.services.timings import (
+    PHASE_INDICATORS,
+    PHASE_SIGNALS,
+    PHASE_SIMULATION,
+    PHASE_STATISTICS,
+    PhaseTimer,
+)
+
+
+
+IndicatorBuilder = Callable[[pd.DataFrame], None]
 
+# 指标缓存键：(指标名, 参数元组)，如 ("macd", (12, 26, 9))、("ma", (21,))
+IndicatorKey = Tuple[str, Tuple[Any, ...]]
 
 
-def compute_indicators(df: pd.DataFrame) -> pd.DataFrame:
-    """计算所有技术指标（包含高精度 Wilder RSI、完整 MA 均线族、MACD、KDJ、BOLL、BBI、CCI 等）"""
-    close = df["close"].astype(float)
-    high = df["high"].astype(float)
-    low = df["low"].astype(float)
-    open_price = df["open"].astype(float)
+def _macd_builder(fast: int, slow: int, signal: int) -> IndicatorBuilder:
+    macd_col, signal_col, hist_col = macd_columns(fast, slow, signal)
 
-    # 1. MACD (DIF, DEA, HIST)
-    ema12 = close.ewm(span=12, adjust=False).mean()
-    ema26 = close.ewm(span=26, adjust=False).mean()
-    macd = ema12 - ema26
-    macd_signal = macd.ewm(span=9, adjust=False).mean()
-    macd_hist = macd - macd_signal
+    # MACD (DIF, DEA, HIST)
+    def build(df: pd.DataFrame) -> None:
+        close = df["close"].astype(float)
+        ema_fast = close.ewm(span=fast, adjust=False).mean()
+        ema_slow = close.ewm(span=slow, adjust=False).mean()
+        macd = ema_fast - ema_slow
+        macd_signal = macd.ewm(span=signal, adjust=False).mean()
+        df[macd_col] = macd
+        df[signal_col] = macd_signal
+        df[hist_col] = macd - macd_signal
 
-    df["macd"] = macd
-    df["macd_signal"] = macd_signal
-    df["macd_hist"] = macd_hist
+    return build
 
-    # 2. RSI (Wilder RMA 平滑法，支持 6, 12, 14, 24 周期及金叉死叉判断)
-    delta = close.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
 
-    for w in [6, 12, 14, 24]:
-        avg_gain = gain.ewm(alpha=1.0 / w, min_periods=w, adjust=False).mean()
-        avg_loss = loss.ewm(alpha=1.0 / w, min_periods=w, adjust=False).mean()
+def _rsi_builder(period: int) -> IndicatorBuilder:
+    # RSI (Wilder RMA 平滑法)
+    def build(df: pd.DataFrame) -> None:
+        delta = df["close"].astype(float).diff()
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        avg_gain = gain.ewm(alpha=1.0 / period, min_periods=period, adjust=False).mean()
+        avg_loss = loss.ewm(alpha=1.0 / period, min_periods=period, adjust=False).mean()
         rs = avg_gain / avg_loss.replace(0, np.nan)
         rsi_series = 100.0 - (100.0 / (1.0 + rs))
-        df[f"rsi{w}"] = rsi_series.fillna(50.0)
+        df[rsi_column(period)] = rsi_series.fillna(50.0)
+
+    return build
+
+
+def _build_rsi_alias(df: pd.DataFrame) -> None:
     df["rsi"] = df["rsi14"]
 
-    # 3. KDJ (中国交易所标准 9, 3, 3)
-    low_9 = low.rolling(window=9, min_periods=1).min()
-    high_9 = high.rolling(window=9, min_periods=1).max()
-    rsv = (close - low_9) / (high_9 - low_9).replace(0, np.nan) * 100.0
-    rsv = rsv.fillna(50.0)
-    k = rsv.ewm(com=2, adjust=False).mean()
-    d = k.ewm(com=2, adjust=False).mean()
-    j = 3.0 * k - 2.0 * d
-    df["kdj_k"] = k
-    df["kdj_d"] = d
-    df["kdj_j"] = j
-
-    # 4. 布林带 (BOLL, 20, 2)
-    ma20 = close.rolling(window=20, min_periods=1).mean()
-    std20 = close.rolling(window=20, min_periods=1).std(ddof=0).fillna(0.0)
-    boll_upper = ma20 + 2.0 * std20
-    boll_middle = ma20
-    boll_lower = ma20 - 2.0 * std20
-    boll_width = (boll_upper - boll_lower) / boll_middle.replace(0, np.nan)
-    df["boll_upper"] = boll_upper
-    df["boll_middle"] = boll_middle
-    df["boll_lower"] = boll_lower
-    df["boll_width"] = boll_width.fillna(0.0)
-
-    # 5. BBI (多空指标 3, 6, 12, 24)
-    ma3 = close.rolling(window=3, min_periods=1).mean()
-    ma6 = close.rolling(window=6, min_periods=1).mean()
-    ma12 = close.rolling(window=12, min_periods=1).mean()
-    ma24 = close.rolling(window=24, min_periods=1).mean()
-    df["bbi"] = (ma3 + ma6 + ma12 + ma24) / 4.0
-
-    # 6. CCI (顺势指标 14)
-    tp = (high + low + close) / 3.0
-    ma_tp = tp.rolling(window=14, min_periods=1).mean()
-    md = tp.rolling(window=14, min_periods=1).apply(lambda x: np.abs(x - x.mean()).mean(), raw=True)
-    cci = (tp - ma_tp) / (0.015 * md.replace(0, np.nan))
-    df["cci"] = cci.fillna(0.0)
-
-    # 7. 均线族 (MA)
-    df["ma3"] = ma3
-    df["ma5"] = close.rolling(window=5, min_periods=1).mean()
-    df["ma6"] = ma6
-    df["ma10"] = close.rolling(window=10, min_periods=1).mean()
-    df["ma12"] = ma12
-    df["ma15"] = close.rolling(window=15, min_periods=1).mean()
-    df["ma20"] = ma20
-    df["ma24"] = ma24
-    df["ma30"] = close.rolling(window=30, min_periods=1).mean()
-    df["ma60"] = close.rolling(window=60, min_periods=1).mean()
-    df["ma120"] = close.rolling(window=120, min_periods=1).mean()
 
+def _kdj_builder(n: int, m1: int, m2: int) -> IndicatorBuilder:
+    k_col, d_col, j_col = kdj_columns(n, m1, m2)
+
+    # KDJ (中国交易所标准 9, 3, 3；M 日平滑即 com = M - 1 的 EMA)
+    def build(df: pd.DataFrame) -> None:
+        close = df["close"].astype(float)
+        low_n = pd.Series(rolling_min(df["low"].to_numpy(dtype=float), n), index=df.index)
+        high_n = pd.Series(rolling_max(df["high"].to_numpy(dtype=float), n), index=df.index)
+        rsv = (close - low_n) / (high_n - low_n).replace(0, np.nan) * 100.0
+        rsv = rsv.fillna(50.0)
+        k = rsv.ewm(com=m1 - 1, adjust=False).mean()
+        d = k.ewm(com=m2 - 1, adjust=False).mean()
+        df[k_col] = k
+        df[d_col] = d
+        df[j_col] = 3.0 * k - 2.0 * d
+
+    return build
+
+
+def _boll_builder(period: int, std: float) -> IndicatorBuilder:
+    upper_col, middle_col, lower_col, width_col = boll_columns(period, std)
+
+    # 布林带 (BOLL, 20, 2)，中轨即同周期均线
+    def build(df: pd.DataFrame) -> None:
+        middle = df[ma_column(period)]
+        close_std = pd.Series(rolling_std(df["close"].to_numpy(dtype=float), period), index=df.index)
+        boll_upper = middle + std * close_std
+        boll_lower = middle - std * close_std
+        boll_width = (boll_upper - boll_lower) / middle.replace(0, np.nan)
+        df[upper_col] = boll_upper
+        df[middle_col] = middle
+        df[lower_col] = boll_lower
+        df[width_col] = boll_width.fillna(0.0)
+
+    return build
+
+
+def _build_bbi(df: pd.DataFrame) -> None:
+    # BBI (多空指标 3, 6, 12, 24)
+    df["bbi"] = (df["ma3"] + df["ma6"] + df["ma12"] + df["ma24"]) / 4.0
+
+
+def _cci_builder(period: int) -> IndicatorBuilder:
+    # CCI (顺势指标 14)
+    def build(df: pd.DataFrame) -> None:
+        tp = (df["high"].astype(float) + df["low"].astype(float) + df["close"].astype(float)) / 3.0
+        tp_values = tp.to_numpy()
+        ma_tp = pd.Series(rolling_mean(tp_values, period), index=df.index)
+        md = pd.Series(rolling_mad(tp_values, period), index=df.index)
+        cci = (tp - ma_tp) / (0.015 * md.replace(0, np.nan))
+        df[cci_column(period)] = cci.fillna(0.0)
+
+    return build
+
+
+def _ma_builder(period: int) -> IndicatorBuilder:
+    def build(df: pd.DataFrame) -> None:
+        df[ma_column(period)] = df["close"].astype(float).rolling(window=period, min_periods=1).mean()
+
+    return build
+
+
+@dataclass(frozen=True)
+class IndicatorNode:
+    """指标依赖图中的一个计算节点：同一 (指标, 参数) 只对应一个节点，一次产出 columns 中的全部列"""
+
+    key: IndicatorKey
+    deps: Tuple[str, ...]
+    build: IndicatorBuilder
+    columns: Tuple[str, ...]
+
+
+@lru_cache(maxsize=None)
+def _indicator_node_for(name: str, params: Tuple[Any, ...]) -> IndicatorNode:
+    key = (name, params)
+    if name == "macd":
+        return IndicatorNode(key, (), _macd_builder(*params), macd_columns(*params))
+    if name == "rsi":
+        return IndicatorNode(key, (), _rsi_builder(*params), (rsi_column(*params),))
+    if name == "rsi_alias":
+        return IndicatorNode(key, ("rsi14",), _build_rsi_alias, ("rsi",))
+    if name == "kdj":
+        return IndicatorNode(key, (), _kdj_builder(*params), kdj_columns(*params))
+    if name == "boll":
+        return IndicatorNode(key, (ma_column(params[0]),), _boll_builder(*params), boll_columns(*params))
+    if name == "bbi":
+        return IndicatorNode(key, ("ma3", "ma6", "ma12", "ma24"), _build_bbi, ("bbi",))
+    if name == "cci":
+        return IndicatorNode(key, (), _cci_builder(*params), (cci_column(*params),))
+    if name == "ma":
+        return IndicatorNode(key, (), _ma_builder(*params), (ma_column(*params),))
+    raise ValueError(f"未知指标: {name}")
+
+
+# 指标列名 -> (指标名, 参数解析)；默认参数的列沿用原有列名，自定义参数的列名带参数后缀（与 strategy_engine 的命名函数一致）
+_COLUMN_PATTERNS: Tuple[Tuple[re.Pattern, str, Callable[[re.Match], Tuple[Any, ...]]], ...] = (
+    (re.compile(r"^ma(\d+)$"), "ma", lambda m: (int(m.group(1)),)),
+    (re.compile(r"^rsi(\d+)$"), "rsi", lambda m: (int(m.group(1)),)),
+    (re.compile(r"^rsi$"), "rsi_alias", lambda m: ()),
+    (
+        re.compile(r"^(?:macd|macd_signal|macd_hist)(?:_(\d+)_(\d+)_(\d+))?$"),
+        "macd",
+        lambda m: tuple(int(g) for g in m.groups()) if m.group(1) else (12, 26, 9),
+    ),
+    (
+        re.compile(r"^kdj_[kdj](?:_(\d+)_(\d+)_(\d+))?$"),
+        "kdj",
+        lambda m: tuple(int(g) for g in m.groups()) if m.group(1) else (9, 3, 3),
+    ),
+    (
+        re.compile(r"^boll_(?:upper|middle|lower|width)(?:_(\d+)_(\d+(?:\.\d+)?))?$"),
+        "boll",
+        lambda m: (int(m.group(1)), float(m.group(2))) if m.group(1) else (20, 2.0),
+    ),
+    (re.compile(r"^bbi$"), "bbi", lambda m: ()),
+    (re.compile(r"^cci(?:_(\d+))?$"), "cci", lambda m: (int(m.group(1)) if m.group(1) else 14,)),
+)
+
+
+@lru_cache(maxsize=None)
+def _timeframe_node_for(timeframe: str, base: Optional[IndicatorNode]) -> IndicatorNode:
+    # 大周期节点：整组列（如 MACD 三条线或 K 线 OHLCV）一次重采样、计算并对齐
+    columns = KLINE_COLUMNS if base is None else base.columns
+    key: IndicatorKey = ("timeframe", (timeframe, None if base is None else base.key))
+
+    def build(df: pd.DataFrame) -> None:
+        attach_higher_timeframe(df, timeframe, columns)
+
+    return IndicatorNode(key, (), build, tuple(timeframe_column(col, timeframe) for col in columns))
+
+
+def indicator_node(col: str) -> Optional[IndicatorNode]:
+    """根据指标列名解析出计算节点；原始 K 线列、未知列或参数非法（如周期为 0）时返回 None"""
+    split = split_timeframe_column(col)
+    if split is not None:
+        base_col, timeframe = split
+        if base_col in KLINE_COLUMNS:
+            return _timeframe_node_for(timeframe, None)
+        base = indicator_node(base_col)
+        return None if base is None else _timeframe_node_for(timeframe, base)
+    for pattern, name, parse in _COLUMN_PATTERNS:
+        match = pattern.match(col)
+        if match is None:
+            continue
+        params = parse(match)
+        if any(p <= 0 for p in params):
+            return None
+        return _indicator_node_for(name, params)
+    return None
+
+
+# 不指定 required 时计算的默认指标列（与历史版本 compute_indicators 的输出一致）
+ALL_INDICATOR_COLUMNS: Tuple[str, ...] = (
+    "macd", "macd_signal", "macd_hist",
+    "rsi6", "rsi12", "rsi14", "rsi24", "rsi",
+    "kdj_k", "kdj_d", "kdj_j",
+    "boll_upper", "boll_middle", "boll_lower", "boll_width",
+    "bbi", "cci",
+    *(ma_column(w) for w in (3, 5, 6, 10, 12, 15, 20, 24, 30, 60, 120)),
+)
+
+
+def _resolve_indicator_order(required: Iterable[str]) -> List[IndicatorNode]:
+    """按依赖关系展开所需指标列，返回去重后、依赖在前的计算节点序列"""
+    ordered: List[IndicatorNode] = []
+    visited: Set[str] = set()
+
+    def visit(col: str) -> None:
+        if col in visited:
+            return
+        visited.add(col)
+        node = indicator_node(col)
+        if node is None:
+            return  # 原始 K 线列或未知列，无需计算
+        for dep in node.deps:
+            visit(dep)
+        if node not in ordered:
+            ordered.append(node)
+        visited.update(node.columns)
+
+    for col in required:
+        visit(col)
+    return ordered
+
+
+def kline_signature(df: pd.DataFrame) -> Tuple[Any, ...]:
+    """K 线数据版本：行数与首尾 K 线的时间、收盘价，任一变化即视为不同数据"""
+    if len(df) == 0:
+        return (0,)
+    close = df["close"] if "close" in df.columns else None
+    ts = df["ts"] if "ts" in df.columns else None
+    return (
+        len(df),
+        None if close is None else (close.iloc[0], close.iloc[-1]),
+        None if ts is None else (ts.iloc[0], ts.iloc[-1]),
+    )
+
+
+class IndicatorCache:
+    """单个 DataFrame 的指标缓存：按 (指标, 参数) 保存已算出的列，数据变化（行数或首尾 K 线不同）时整体失效"""
+
+    def __init__(self) -> None:
+        self.signature: Optional[Tuple[Any, ...]] = None
+        self.values: Dict[IndicatorKey, Dict[str, np.ndarray]] = {}
+
+    def validate(self, df: pd.DataFrame) -> None:
+        signature = kline_signature(df)
+        if signature != self.signature:
+            self.signature = signature
+            self.values.clear()
+
+    def apply(self, df: pd.DataFrame, node: IndicatorNode) -> None:
+        """确保 df 中存在该节点的全部列：命中缓存直接回填，否则计算一次并记录"""
+        cached = self.values.get(node.key)
+        if cached is None:
+            node.build(df)
+            self.values[node.key] = {col: df[col].to_numpy() for col in node.columns if col in df.columns}
+            return
+        for col, values in cached.items():
+            if col not in df.columns:
+                df[col] = values
+
+
+# id(DataFrame) -> IndicatorCache；DataFrame 不可哈希，随 DataFrame 被回收时通过 weakref.finalize 清理
+_indicator_caches: Dict[int, IndicatorCache] = {}
+
+
+def get_indicator_cache(df: pd.DataFrame) -> IndicatorCache:
+    key = id(df)
+    cache = _indicator_caches.get(key)
+    if cache is None:
+        cache = IndicatorCache()
+        _indicator_caches[key] = cache
+        weakref.finalize(df, _indicator_caches.pop, key, None)
+    cache.validate(df)
+    return cache
+
+
+def adopt_indicator_columns(df: pd.DataFrame) -> None:
+    """把 df 中已有的指标列登记到其指标缓存（如从共享内存还原、指标已由主进程算好的 DataFrame），
+    之后 compute_indicators 直接复用这些列，不再重新计算"""
+    cache = get_indicator_cache(df)
+    for col in df.columns:
+        node = indicator_node(col)
+        if node is None or node.key in cache.values:
+            continue
+        present = {c: df[c].to_numpy() for c in node.columns if c in df.columns}
+        if present:
+            cache.values[node.key] = present
+
+
+def compute_indicators(df: pd.DataFrame, required: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """计算技术指标（包含高精度 Wilder RSI、完整 MA 均线族、MACD、KDJ、BOLL、BBI、CCI 等）
+
+    required 为空时计算全部默认指标；传入所需指标列（如 CompiledRuleSet.required_columns）时
+    只计算这些列及其依赖，未用到的指标既不计算也不占内存。带参数后缀的列（如 ma21、rsi9、
+    macd_5_35_5、boll_upper_20_2.5）按列名解析参数计算；带周期后缀的列（如 macd_4H、close_1D）
+    由基础周期 K 线重采样出大周期 K 线后计算并无未来函数地对齐。同一 DataFrame 上每个 (指标, 参数)
+    只计算一次，多个条件、分组以及寻优的各个参数组合共享结果。
+    """
+    columns = ALL_INDICATOR_COLUMNS if required is None else required
+    cache = get_indicator_cache(df)
+    for node in _resolve_indicator_order(columns):
+        cache.apply(df, node)
     return df
 
 
 @dataclass
 class BacktestResult:
-    trades: List[BacktestTrade]
-    trades_list: List[Dict[str, Any]]
-    equity_curve: List[Dict[str, Any]]
-    benchmark_curve: List[Dict[str, Any]]
+    trade_log: TradeLog  # 成交记录（按列存储），交易明细与 ORM 行按需生成
+    equity_curve: EquityCurve  # 逐 Bar 策略净值（数组）
+    benchmark_curve: EquityCurve  # 逐 Bar 买入持有基准净值（数组）
     total_return: float = 0.0  # 策略总收益率(%)
     benchmark_return: float = 0.0  # 基准收益率(%)
     win_rate: float = 0.0  # 胜率(%)
@@ -125,71 +367,127 @@ class BacktestResult:
     max_win: float = 0.0  # 单笔最大盈利
     max_profit: float = 0.0  # 单笔最大盈利
     max_loss: float = 0.0  # 单笔最大亏损
+    sortino_ratio: float = 0.0  # 索提诺比率
+    calmar_ratio: float = 0.0  # 卡玛比率
+    annual_return: float = 0.0  # 年化收益率(%)
+    exposure: float = 0.0  # 持仓时间占比(%)
+    timings: Dict[str, Any] = field(default_factory=dict)  # 各阶段耗时（PhaseTimer.to_dict()）
+
+    @property
+    def trades_list(self) -> List[Dict[str, Any]]:
+        """逐笔交易明细（dict），首次访问时生成"""
+        return self.trade_log.to_dicts()
 
+    @property
+    def trades(self) -> List[BacktestTrade]:
+        """开仓 / 平仓成交的 BacktestTrade ORM 行（未关联回测记录），每次访问重新生成"""
+        return self.trade_log.to_orm()
 
 
 def run_backtest(
     df: pd.DataFrame,
-    rule_set: StrategyRuleSet,
+    rule_set: Union[StrategyRuleSet, CompiledRuleSet],
     initial_balance: float = 10000.0,
     stop_loss_pct: Optional[float] = None,
     take_profit_pct: Optional[float] = None,
     trailing_stop_pct: Optional[float] = None,
     fee_rate: float = 0.0,
     slippage_pct: float = 0.0,
+    timeframe: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
 ) -> BacktestResult:
-    """运行回测，支持多空双向、止损、止盈、追踪止损、手续费与滑点模拟，并生成逐笔交易明细和基准收益对比"""
-    df = compute_indicators(df)
+    """运行回测，支持多空双向、止损、止盈、追踪止损、手续费与滑点模拟，并生成逐笔交易明细和基准收益对比
+
+    timeframe 用于夏普 / 索提诺等指标的年化，未传入时取 tag_klines 记录的周期。
+    progress(已处理 Bar 数, 总 Bar 数) 在主循环中约每 1% 的 Bar 调用一次，回调抛出的异常会中止回测（用于取消）。
+    """
+    timer = PhaseTimer()
+    compiled = compile_rule_set(rule_set)
+    with timer.phase(PHASE_INDICATORS):
+        df = compute_indicators(df, required=compiled.required_columns)
+    # 整段序列一次性编译信号，循环内仅做 O(1) 查表（已编译的规则直接复用）
+    with timer.phase(PHASE_SIGNALS):
+        signals = compiled.evaluate(df, timer)
+
+    simulation_wall = time.perf_counter()
+    simulation_cpu = time.thread_time()
+    n_bars = len(df)
+    ts_values = df["ts"].array
+    # 循环只读取连续的 float64 / bool 数组（转为 Python list 后逐根取标量，远快于 df.iloc 与 ndarray 标量下标）
+    close_arr = df["close"].to_numpy(dtype=np.float64)
+    closes: List[float] = close_arr.tolist()
+    highs: List[float] = df["high"].to_numpy(dtype=np.float64).tolist()
+    lows: List[float] = df["low"].to_numpy(dtype=np.float64).tolist()
+    open_long_sig: List[bool] = signals.open_long.tolist()
+    close_long_sig: List[bool] = signals.close_long.tolist()
+    open_short_sig: List[bool] = signals.open_short.tolist()
+    close_short_sig: List[bool] = signals.close_short.tolist()
+
+    # 空仓时只看开仓信号：next_open[i] 为 i 及之后第一根出现开仓信号的 Bar（没有则为 n_bars），空仓区间整段跳过
+    open_positions = np.where(signals.open_long | signals.open_short, np.arange(n_bars), n_bars)
+    next_open: List[int] = np.minimum.accumulate(open_positions[::-1])[::-1].tolist()
+
+    use_stop_loss = stop_loss_pct is not None and stop_loss_pct > 0
+    use_take_profit = take_profit_pct is not None and take_profit_pct > 0
+    use_trailing_stop = trailing_stop_pct is not None and trailing_stop_pct > 0
 
     cash = initial_balance
     position = 0.0
     entry_price = 0.0
-    entry_ts: Optional[datetime] = None
     entry_idx: int = 0
     highest_price_since_entry = 0.0
+    lowest_price_since_entry = float("inf")
 
-    trades: List[BacktestTrade] = []
-    trades_list: List[Dict[str, Any]] = []
-    equity_curve: List[Dict[str, Any]] = []
-    benchmark_curve: List[Dict[str, Any]] = []
+    trade_log = TradeLog(ts_values)
+    equity = np.empty(n_bars, dtype=np.float64)
+    in_market = np.zeros(n_bars, dtype=bool)
 
-    first_close = float(df.iloc[0]["close"]) if len(df) > 0 else 1.0
+    first_close = closes[0] if n_bars > 0 else 1.0
 
-    for idx in range(len(df)):
-        row = df.iloc[idx]
-        raw_ts = row["ts"]
-        ts = raw_ts if isinstance(raw_ts, datetime) else datetime.fromisoformat(str(raw_ts))
-        close_price = float(row["close"])
-        high_price = float(row["high"])
-        low_price = float(row["low"])
-        exited_this_bar = False
+    report_every = max(1, n_bars // 100)
+    next_report = 0 if progress is not None else n_bars
+
+    idx = 0
+    while idx < n_bars:
+        if idx >= next_report:
+            progress(idx, n_bars)
+            next_report = idx + report_every
 
-        # 计算买入并持有基准净值
-        benchmark_equity = (close_price / first_close) * initial_balance
-        benchmark_curve.append({"ts": ts.isoformat(), "equity": benchmark_equity})
+        if position == 0 and next_open[idx] > idx:
+            # 空仓且当前 Bar 无开仓信号：直到下一个开仓信号前权益恒为现金
+            skip_to = next_open[idx]
+            equity[idx:skip_to] = max(cash, 0.0)
+            idx = skip_to
+            continue
+
+        close_price = closes[idx]
+        high_price = highs[idx]
+        low_price = lows[idx]
+        exited_this_bar = False
 
         # 检查多头持仓平仓触发条件
         if position > 0:
-            highest_price_since_entry = max(highest_price_since_entry, high_price)
+            if high_price > highest_price_since_entry:
+                highest_price_since_entry = high_price
             exit_reason: Optional[str] = None
             exit_price = close_price
 
             # 1. 多头止损判断 (Stop Loss)
-            if stop_loss_pct is not None and stop_loss_pct > 0:
+            if use_stop_loss:
                 sl_price = entry_price * (1.0 - stop_loss_pct / 100.0)
                 if low_price <= sl_price:
                     exit_reason = "STOP_LOSS"
                     exit_price = min(close_price, sl_price)
 
             # 2. 多头止盈判断 (Take Profit)
-            if exit_reason is None and take_profit_pct is not None and take_profit_pct > 0:
+            if exit_reason is None and use_take_profit:
                 tp_price = entry_price * (1.0 + take_profit_pct / 100.0)
                 if high_price >= tp_price:
                     exit_reason = "TAKE_PROFIT"
                     exit_price = max(close_price, tp_price)
 
             # 3. 多头移动追踪止损 (Trailing Stop)
-            if exit_reason is None and trailing_stop_pct is not None and trailing_stop_pct > 0:
+            if exit_reason is None and use_trailing_stop:
                 trailing_trigger_price = entry_price * (1.0 + trailing_stop_pct / 100.0)
                 if highest_price_since_entry >= trailing_trigger_price:
                     trailing_stop_line = highest_price_since_entry * (1.0 - trailing_stop_pct / 100.0)
@@ -198,7 +496,7 @@ def run_backtest(
                         exit_price = min(close_price, trailing_stop_line)
 
             # 4. 多头常规平仓信号 (Close Long)
-            if exit_reason is None and (should_close_long(rule_set, df, idx) or should_sell(rule_set, df, idx)):
+            if exit_reason is None and close_long_sig[idx]:
                 exit_reason = "SIGNAL_CLOSE_LONG"
                 exit_price = close_price
 
@@ -217,64 +515,39 @@ def run_backtest(
                 trade_pnl = net_revenue - (entry_cost + entry_fee)
                 trade_pnl_pct = (trade_pnl / (entry_cost + entry_fee)) * 100.0
 
-                trades.append(
-                    BacktestTrade(
-                        backtest_id=0,
-                        side="SELL",
-                        ts=ts,
-                        price=effective_exit_price,
-                        qty=position,
-                        fee=exit_fee,
-                        pnl=trade_pnl,
-                    )
-                )
-
-                holding_bars = idx - entry_idx
-                trades_list.append(
-                    {
-                        "id": len(trades_list) + 1,
-                        "position_side": "LONG",
-                        "entry_time": entry_ts.isoformat() if entry_ts else ts.isoformat(),
-                        "entry_price": round(entry_price, 4),
-                        "exit_time": ts.isoformat(),
-                        "exit_price": round(effective_exit_price, 4),
-                        "qty": round(position, 4),
-                        "pnl": round(trade_pnl, 2),
-                        "pnl_pct": round(trade_pnl_pct, 2),
-                        "fee": round(total_fee, 2),
-                        "exit_reason": exit_reason,
-                        "holding_bars": holding_bars,
-                    }
+                trade_log.record_close(
+                    entry_idx, idx, LONG, entry_price, effective_exit_price, position,
+                    exit_fee, total_fee, trade_pnl, trade_pnl_pct, exit_reason,
                 )
 
                 position = 0.0
                 entry_price = 0.0
-                entry_ts = None
                 highest_price_since_entry = 0.0
 
         # 检查空头持仓平仓触发条件
         elif position < 0:
             abs_pos = abs(position)
-            lowest_price_since_entry = min(lowest_price_since_entry, low_price)
+            if low_price < lowest_price_since_entry:
+                lowest_price_since_entry = low_price
             exit_reason = None
             exit_price = close_price
 
             # 1. 空头止损判断 (价格上涨达到阈值止损)
-            if stop_loss_pct is not None and stop_loss_pct > 0:
+            if use_stop_loss:
                 sl_price = entry_price * (1.0 + stop_loss_pct / 100.0)
                 if high_price >= sl_price:
                     exit_reason = "STOP_LOSS"
                     exit_price = max(close_price, sl_price)
 
             # 2. 空头止盈判断 (价格下跌达到目标止盈)
-            if exit_reason is None and take_profit_pct is not None and take_profit_pct > 0:
+            if exit_reason is None and use_take_profit:
                 tp_price = entry_price * (1.0 - take_profit_pct / 100.0)
                 if low_price <= tp_price:
                     exit_reason = "TAKE_PROFIT"
                     exit_price = min(close_price, tp_price)
 
             # 3. 空头移动追踪止损 (从低点回弹超过追踪幅度)
-            if exit_reason is None and trailing_stop_pct is not None and trailing_stop_pct > 0:
+            if exit_reason is None and use_trailing_stop:
                 trailing_trigger_price = entry_price * (1.0 - trailing_stop_pct / 100.0)
                 if lowest_price_since_entry <= trailing_trigger_price:
                     trailing_stop_line = lowest_price_since_entry * (1.0 + trailing_stop_pct / 100.0)
@@ -283,7 +556,7 @@ def run_backtest(
                         exit_price = max(close_price, trailing_stop_line)
 
             # 4. 空头常规平仓信号 (Close Short)
-            if exit_reason is None and should_close_short(rule_set, df, idx):
+            if exit_reason is None and close_short_sig[idx]:
                 exit_reason = "SIGNAL_CLOSE_SHORT"
                 exit_price = close_price
 
@@ -303,44 +576,18 @@ def run_backtest(
                 trade_pnl_pct = (trade_pnl / (entry_cost + entry_fee)) * 100.0
                 cash += (entry_cost + trade_pnl)
 
-                trades.append(
-                    BacktestTrade(
-                        backtest_id=0,
-                        side="BUY",  # 平空为买入平仓
-                        ts=ts,
-                        price=effective_exit_price,
-                        qty=abs_pos,
-                        fee=exit_fee,
-                        pnl=trade_pnl,
-                    )
-                )
-
-                holding_bars = idx - entry_idx
-                trades_list.append(
-                    {
-                        "id": len(trades_list) + 1,
-                        "position_side": "SHORT",
-                        "entry_time": entry_ts.isoformat() if entry_ts else ts.isoformat(),
-                        "entry_price": round(entry_price, 4),
-                        "exit_time": ts.isoformat(),
-                        "exit_price": round(effective_exit_price, 4),
-                        "qty": round(abs_pos, 4),
-                        "pnl": round(trade_pnl, 2),
-                        "pnl_pct": round(trade_pnl_pct, 2),
-                        "fee": round(total_fee, 2),
-                        "exit_reason": exit_reason,
-                        "holding_bars": holding_bars,
-                    }
+                trade_log.record_close(
+                    entry_idx, idx, SHORT, entry_price, effective_exit_price, abs_pos,
+                    exit_fee, total_fee, trade_pnl, trade_pnl_pct, exit_reason,
                 )
 
                 position = 0.0
                 entry_price = 0.0
-                entry_ts = None
                 lowest_price_since_entry = float("inf")
 
         # 检查空仓时的开仓信号 (做多或做空)
         if position == 0 and not exited_this_bar:
-            if should_open_long(rule_set, df, idx) or should_buy(rule_set, df, idx):
+            if open_long_sig[idx]:
 
                 effective_entry_price = close_price * (1.0 + slippage_pct)
                 buy_fee = cash * fee_rate
@@ -349,24 +596,13 @@ def run_backtest(
                     size = usable_cash / effective_entry_price
                     position = size
                     entry_price = effective_entry_price
-                    entry_ts = ts
                     entry_idx = idx
                     highest_price_since_entry = effective_entry_price
                     cash = 0.0
 
-                    trades.append(
-                        BacktestTrade(
-                            backtest_id=0,
-                            side="BUY",
-                            ts=ts,
-                            price=effective_entry_price,
-                            qty=size,
-                            fee=buy_fee,
-                            pnl=0.0,
-                        )
-                    )
-
-            elif should_open_short(rule_set, df, idx):
+                    trade_log.record_open(idx, LONG, effective_entry_price, size, buy_fee)
+
+            elif open_short_sig[idx]:
                 effective_entry_price = close_price * (1.0 - slippage_pct)
                 short_fee = cash * fee_rate
                 usable_cash = cash - short_fee
@@ -374,22 +610,11 @@ def run_backtest(
                     size = usable_cash / effective_entry_price
                     position = -size  # 负数表示空头仓位
                     entry_price = effective_entry_price
-                    entry_ts = ts
                     entry_idx = idx
                     lowest_price_since_entry = effective_entry_price
                     cash = 0.0
 
-                    trades.append(
-                        BacktestTrade(
-                            backtest_id=0,
-                            side="SELL",  # 开空为卖出开仓
-                            ts=ts,
-                            price=effective_entry_price,
-                            qty=size,
-                            fee=short_fee,
-                            pnl=0.0,
-                        )
-                    )
+                    trade_log.record_open(idx, SHORT, effective_entry_price, size, short_fee)
 
         # 计算当前动态权益
         if position > 0:
@@ -401,93 +626,52 @@ def run_backtest(
         else:
             current_equity = cash
 
-        equity_curve.append({"ts": ts.isoformat(), "equity": max(current_equity, 0.0)})
-
-
-    # 计算整体统计指标
-    total_return = 0.0
-    benchmark_return = 0.0
-    win_rate = 0.0
-    sharpe_ratio = 0.0
-    max_drawdown = 0.0
-    profit_factor = 0.0
-    win_count = 0
-    loss_count = 0
-    avg_trade_pnl = 0.0
-    max_win = 0.0
-    max_loss = 0.0
-
-    if equity_curve:
-        final_equity = equity_curve[-1]["equity"]
-        total_return = ((final_equity - initial_balance) / initial_balance) * 100.0
-
-        if benchmark_curve:
-            final_bench = benchmark_curve[-1]["equity"]
-            benchmark_return = ((final_bench - initial_balance) / initial_balance) * 100.0
-
-        # 交易统计分析
-        if trades_list:
-            pnls = [t["pnl"] for t in trades_list]
-            win_pnls = [p for p in pnls if p > 0]
-            loss_pnls = [p for p in pnls if p <= 0]
-            win_count = len(win_pnls)
-            loss_count = len(loss_pnls)
-            win_rate = (win_count / len(trades_list)) * 100.0
-            avg_trade_pnl = float(np.mean(pnls)) if pnls else 0.0
-            max_win = max(pnls) if pnls else 0.0
-            max_loss = min(pnls) if pnls else 0.0
-
-            total_profit = sum(win_pnls)
-            total_loss = abs(sum(loss_pnls))
-            if total_loss > 0:
-                profit_factor = total_profit / total_loss
-            elif total_profit > 0:
-                profit_factor = 999.0
-
-        # 计算最大回撤
-        peak = initial_balance
-        max_dd = 0.0
-        for point in equity_curve:
-            equity_val = point["equity"]
-            if equity_val > peak:
-                peak = equity_val
-            drawdown = (peak - equity_val) / peak * 100.0
-            if drawdown > max_dd:
-                max_dd = drawdown
-        max_drawdown = max_dd
-
-        # 计算夏普比率
-        if len(equity_curve) > 1:
-            returns = []
-            for i in range(1, len(equity_curve)):
-                prev_equity = equity_curve[i - 1]["equity"]
-                curr_equity = equity_curve[i]["equity"]
-                if prev_equity > 0:
-                    ret = (curr_equity - prev_equity) / prev_equity
-                    returns.append(ret)
-
-            if returns:
-                mean_return = np.mean(returns)
-                std_return = np.std(returns)
-                if std_return > 0:
-                    sharpe_ratio = float((mean_return / std_return) * np.sqrt(252))
+        equity[idx] = max(current_equity, 0.0)
+        in_market[idx] = position != 0
+        idx += 1
+
+    if progress is not None:
+        progress(n_bars, n_bars)
+    timer.add(PHASE_SIMULATION, time.perf_counter() - simulation_wall, time.thread_time() - simulation_cpu)
+
+    with timer.phase(PHASE_STATISTICS):
+        # 策略净值与买入并持有基准净值共用同一时间轴
+        equity_curve = EquityCurve.from_series(df["ts"], equity)
+        benchmark_curve = equity_curve.with_equity(close_arr / first_close * initial_balance)
+
+        # 计算整体统计指标
+        benchmark_return = 0.0
+        if len(benchmark_curve):
+            benchmark_return = ((benchmark_curve.final - initial_balance) / initial_balance) * 100.0
+
+        metrics = compute_metrics(
+            equity,
+            trade_log.rounded_pnls(),
+            initial_balance,
+            timeframe=timeframe if timeframe is not None else df.attrs.get("timeframe"),
+            in_market=in_market,
+        )
 
     return BacktestResult(
-        trades=trades,
-        trades_list=trades_list,
+        trade_log=trade_log,
         equity_curve=equity_curve,
         benchmark_curve=benchmark_curve,
-        total_return=total_return,
+        total_return=metrics.total_return,
         benchmark_return=benchmark_return,
-        win_rate=win_rate,
-        sharpe_ratio=sharpe_ratio,
-        max_drawdown=max_drawdown,
-        profit_factor=profit_factor,
-        trade_count=len(trades_list),
-        win_count=win_count,
-        loss_count=loss_count,
-        avg_trade_pnl=avg_trade_pnl,
-        max_win=max_win,
-        max_loss=max_loss,
+        win_rate=metrics.win_rate,
+        sharpe_ratio=metrics.sharpe_ratio,
+        max_drawdown=metrics.max_drawdown,
+        profit_factor=metrics.profit_factor,
+        trade_count=metrics.trade_count,
+        win_count=metrics.win_count,
+        loss_count=metrics.loss_count,
+        avg_trade_pnl=metrics.avg_trade_pnl,
+        max_win=metrics.max_win,
+        max_loss=metrics.max_loss,
+        sortino_ratio=metrics.sortino_ratio,
+        calmar_ratio=metrics.calmar_ratio,
+        annual_return=metrics.annual_return,
+        exposure=metrics.exposure,
+        timings=timer.to_dict(),
     )
 
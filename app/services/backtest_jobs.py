@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models import Backtest, Strategy
+from app.services.backtest_engine import BacktestResult, run_backtest
+from app.services.equity_curve import downsample_curves, pack_curves
+from app.services.kline_store import load_klines
+from app.services.timings import PHASE_SERIALIZATION, PhaseTimer, phase_histograms
+
+# 回测任务队列：回测在有界的进程池中运行，HTTP 请求只负责写入 PENDING 记录并入队
+#   - 状态流转 PENDING -> RUNNING -> FINISHED / FAILED / CANCELLED 全部写入 Backtest.status
+#   - 每个任务占用一小块共享内存 [进度(%), 取消标记]，子进程每处理约 1% 的 Bar 更新进度并检查取消标记
+#   - 服务重启时仍为 PENDING / RUNNING 的回测已无进程在执行，启动时统一标记为 FAILED
+
+BACKTEST_PENDING = "PENDING"
+BACKTEST_RUNNING = "RUNNING"
+BACKTEST_FINISHED = "FINISHED"
+BACKTEST_FAILED = "FAILED"
+BACKTEST_CANCELLED = "CANCELLED"
+
+# 同时运行的回测进程数上限
+MAX_BACKTEST_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_SLOT_PROGRESS = 0
+_SLOT_CANCEL = 1
+
+
+class BacktestCancelled(Exception):
+    """回测被用户取消"""
+
+
+def store_backtest_result(
+    bt: Backtest,
+    result: BacktestResult,
+    strategy: Strategy,
+    timer: Optional[PhaseTimer] = None,
+) -> None:
+    """回测结果写入回测记录：result_json 只保存降采样后的展示曲线，全分辨率曲线压缩后单独存储，
+    按需通过 /backtests/{id}/equity 获取。timer 为空时取回测自身的 timings，序列化耗时计入其中"""
+    timer = timer if timer is not None else PhaseTimer(result.timings)
+    with timer.phase(PHASE_SERIALIZATION):
+        display_equity, display_benchmark = downsample_curves(result.equity_curve, result.benchmark_curve)
+        bt.equity_blob = pack_curves(result.equity_curve, result.benchmark_curve)
+        body = json.dumps({
+            "equity_curve": display_equity.to_points(),
+            "benchmark_curve": display_benchmark.to_points(),
+            "equity_points_total": len(result.equity_curve),
+            "trades_list": result.trades_list,
+            "trade_count": result.trade_count,
+            "win_count": result.win_count,
+            "loss_count": result.loss_count,
+            "total_return": result.total_return,
+            "benchmark_return": result.benchmark_return,
+            "win_rate": result.win_rate,
+            "sharpe_ratio": result.sharpe_ratio,
+            "sortino_ratio": result.sortino_ratio,
+            "calmar_ratio": result.calmar_ratio,
+            "annual_return": result.annual_return,
+            "exposure": result.exposure,
+            "max_drawdown": result.max_drawdown,
+            "profit_factor": result.profit_factor,
+            "avg_trade_pnl": result.avg_trade_pnl,
+            "max_win": result.max_win,
+            "max_loss": result.max_loss,
+            "stop_loss_pct": strategy.stop_loss_pct,
+            "take_profit_pct": strategy.take_profit_pct,
+            "trailing_stop_pct": strategy.trailing_stop_pct,
+        })
+    # timings 在序列化完成后才能确定，直接拼接到 JSON 末尾，避免整体重新序列化
+    bt.result_json = f'{body[:-1]}, "timings": {json.dumps(timer.to_dict())}}}'
+
+
+@dataclass(frozen=True)
+class BacktestTask:
+    backtest_id: int
+    fee_rate: float = 0.0
+    slippage_pct: float = 0.0
+
+
+def _set_status(db: Session, bt: Backtest, status: str, error: Optional[str] = None) -> None:
+    bt.status = status
+    if error is not None:
+        bt.result_json = json.dumps({"error": error})
+    db.commit()
+
+
+def execute_backtest(task: BacktestTask, slot_name: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """执行一个已入库的回测（在工作进程中运行），返回 (最终状态, 各阶段耗时)；slot_name 为进度共享内存名"""
+    timer = PhaseTimer()
+    status = _execute_backtest(task, slot_name, timer)
+    return status, timer.to_dict()
+
+
+def _execute_backtest(task: BacktestTask, slot_name: Optional[str], timer: PhaseTimer) -> str:
+    slot_shm = shared_memory.SharedMemory(name=slot_name) if slot_name else None
+    slot = np.ndarray((2,), dtype=np.float64, buffer=slot_shm.buf) if slot_shm else None
+
+    def on_progress(done: int, total: int) -> None:
+        if slot is None:
+            return
+        slot[_SLOT_PROGRESS] = done / total * 100.0 if total else 100.0
+        if slot[_SLOT_CANCEL]:
+            raise BacktestCancelled()
+
+    db = SessionLocal()
+    bt: Optional[Backtest] = None
+    try:
+        bt = db.query(Backtest).filter(Backtest.id == task.backtest_id).first()
+        if bt is None or bt.status != BACKTEST_PENDING:
+            return bt.status if bt is not None else BACKTEST_FAILED
+        if slot is not None and slot[_SLOT_CANCEL]:
+            _set_status(db, bt, BACKTEST_CANCELLED)
+            return BACKTEST_CANCELLED
+        _set_status(db, bt, BACKTEST_RUNNING)
+
+        strategy = db.query(Strategy).filter(Strategy.id == bt.strategy_id).first()
+        if strategy is None:
+            _set_status(db, bt, BACKTEST_FAILED, "Strategy not found")
+            return BACKTEST_FAILED
+
+        df = load_klines(
+            db,
+            bt.symbol_id or strategy.symbol_id,
+            bt.timeframe or strategy.timeframe,
+            bt.start_ts,
+            bt.end_ts,
+            timer=timer,
+        )
+        if df.empty:
+            _set_status(db, bt, BACKTEST_FAILED, "未找到对应的K线回测数据，请先下载该周期的K线数据")
+            return BACKTEST_FAILED
+
+        result = run_backtest(
+            df=df,
+            rule_set=json.loads(strategy.config_json),
+            initial_balance=bt.initial_balance,
+            stop_loss_pct=strategy.stop_loss_pct,
+            take_profit_pct=strategy.take_profit_pct,
+            trailing_stop_pct=strategy.trailing_stop_pct,
+            fee_rate=task.fee_rate,
+            slippage_pct=task.slippage_pct,
+            progress=on_progress,
+        )
+        timer.merge(result.timings)
+        store_backtest_result(bt, result, strategy, timer)
+        _set_status(db, bt, BACKTEST_FINISHED)
+        return BACKTEST_FINISHED
+    except BacktestCancelled:
+        db.rollback()
+        if bt is not None:
+            _set_status(db, bt, BACKTEST_CANCELLED)
+        return BACKTEST_CANCELLED
+    except Exception as e:
+        print(f"回测错误: {e}")
+        traceback.print_exc()
+        db.rollback()
+        if bt is not None:
+            _set_status(db, bt, BACKTEST_FAILED, str(e))
+        return BACKTEST_FAILED
+    finally:
+        db.close()
+        if slot_shm is not None:
+            slot = None
+            slot_shm.close()
+
+
+class _Job:
+    def __init__(self, backtest_id: int) -> None:
+        self.backtest_id = backtest_id
+        self.shm = shared_memory.SharedMemory(create=True, size=16)
+        self.slot = np.ndarray((2,), dtype=np.float64, buffer=self.shm.buf)
+        self.slot[:] = 0.0
+        self.future: Optional[Future] = None
+
+    def release(self) -> None:
+        self.slot = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class BacktestJobQueue:
+    """回测任务队列：入队、查询进度、取消"""
+
+    def __init__(self, max_workers: int = MAX_BACKTEST_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[int, _Job] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def submit(self, task: BacktestTask, on_done: Optional[Callable[[str], None]] = None) -> None:
+        """回测记录须已以 PENDING 状态入库；on_done(最终状态) 在任务结束后于主进程中调用"""
+        job = _Job(task.backtest_id)
+        with self._lock:
+            self._jobs[task.backtest_id] = job
+            job.future = self._get_pool().submit(execute_backtest, task, job.shm.name)
+        job.future.add_done_callback(lambda future: self._finish(task.backtest_id, future, on_done))
+
+    def _finish(self, backtest_id: int, future: Future, on_done: Optional[Callable[[str], None]]) -> None:
+        with self._lock:
+            job = self._jobs.pop(backtest_id, None)
+        if job is not None:
+            job.release()
+        if future.cancelled():
+            status = BACKTEST_CANCELLED
+        elif future.exception() is not None:
+            status = BACKTEST_FAILED
+        else:
+            status, timings = future.result()
+            if status == BACKTEST_FINISHED:
+                phase_histograms.record("backtest", timings)
+        if on_done is not None:
+            on_done(status)
+
+    def progress(self, backtest_id: int) -> Optional[float]:
+        """运行中 / 排队中回测的进度(%)；不在队列中时返回 None"""
+        with self._lock:
+            job = self._jobs.get(backtest_id)
+            return round(float(job.slot[_SLOT_PROGRESS]), 1) if job is not None else None
+
+    def cancel(self, backtest_id: int) -> bool:
+        """请求取消：排队中的任务直接移出队列，运行中的任务在下一次进度检查时中止；不在队列中时返回 False"""
+        with self._lock:
+            job = self._jobs.get(backtest_id)
+            if job is None:
+                return False
+            job.slot[_SLOT_CANCEL] = 1.0
+        # Future.cancel 会同步执行完成回调（_finish 需要获取锁），必须在锁外调用
+        if job.future is not None and job.future.cancel():
+            db = SessionLocal()
+            try:
+                bt = db.query(Backtest).filter(Backtest.id == backtest_id).first()
+                if bt is not None and bt.status == BACKTEST_PENDING:
+                    _set_status(db, bt, BACKTEST_CANCELLED)
+            finally:
+                db.close()
+        return True
+
+    def fail_interrupted(self) -> int:
+        """服务启动时把上次未执行完的回测标记为 FAILED，返回处理条数"""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Backtest)
+                .filter(Backtest.status.in_([BACKTEST_PENDING, BACKTEST_RUNNING]))
+                .all()
+            )
+            for bt in rows:
+                bt.status = BACKTEST_FAILED
+                bt.result_json = json.dumps({"error": "服务重启，回测被中断"})
+            db.commit()
+            return len(rows)
+        finally:
+            db.close()
+
+    def shutdown(self) -> None:
+        """取消全部任务并关闭进程池"""
+        with self._lock:
+            backtest_ids = list(self._jobs)
+        for backtest_id in backtest_ids:
+            self.cancel(backtest_id)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+backtest_jobs = BacktestJobQueue()
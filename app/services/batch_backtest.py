@@ -0,0 +1,491 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from app.services.backtest_engine import BacktestResult, adopt_indicator_columns, compute_indicators, run_backtest
+from app.services.metrics import PerformanceMetrics, compute_metrics
+from app.services.shared_klines import SharedKlines, SharedKlinesSpec, attach_shared_klines
+from app.services.strategy_engine import CompiledRuleSet, StrategyRuleSet, compile_rule_set
+
+# 同一组信号、多组出场参数的批量回测：
+# 止损 / 止盈 / 追踪止损参数不影响开平仓信号，信号与指标只计算一次，全部参数组合一起推进一个 NumPy 状态机。
+# 状态机按“事件”而非逐 Bar 推进：空仓的组合直接跳到下一个开仓信号；持仓的组合取其后一段 Bar 组成
+# (组合 × Bar) 二维窗口，一次性算出止损 / 止盈 / 追踪止损 / 平仓信号的首个触发点。迭代次数约等于单个组合的
+# 交易笔数，与 K 线数量和组合数量基本无关。每笔交易的价格、手续费与盈亏按与 run_backtest 完全相同的顺序
+# 计算，净值曲线由交易区间还原后交给 compute_metrics，统计结果与逐组调用 run_backtest 一致。
+
+# 持仓组合每次向后检查的最大 Bar 数（窗口内未触发出场时顺延）
+_MAX_WINDOW = 256
+# 还原净值曲线时每批处理的组合数上限（按 组合数 × K 线数 控制临时内存）
+_EQUITY_CHUNK_CELLS = 4_000_000
+
+
+@dataclass
+class ExitParams:
+    stop_loss_pct: Optional[float] = None
+    take_profit_pct: Optional[float] = None
+    trailing_stop_pct: Optional[float] = None
+
+
+@dataclass
+class ExitSweepResult:
+    metrics: List[PerformanceMetrics]  # 与传入的出场参数一一对应
+    benchmark_return: float = 0.0  # 买入持有基准收益率(%)，各组合相同
+
+
+class _TradeColumns:
+    """全部组合的交易（按列分批追加），持仓到最后一根 Bar 仍未平仓的交易 exit_idx 为 K 线数量、pnl 为 NaN"""
+
+    FIELDS = ("combo", "entry_idx", "exit_idx", "side", "qty", "entry_price", "cash_after", "pnl")
+
+    def __init__(self) -> None:
+        self.batches: Dict[str, List[np.ndarray]] = {name: [] for name in self.FIELDS}
+
+    def append(self, **columns: np.ndarray) -> None:
+        for name in self.FIELDS:
+            self.batches[name].append(np.asarray(columns[name]))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            name: np.concatenate(batch) if batch else np.empty(0)
+            for name, batch in self.batches.items()
+        }
+
+
+@dataclass
+class _SweepState:
+    """全部组合的状态向量"""
+
+    n_combos: int
+    initial_balance: float
+    t: np.ndarray = field(init=False)  # 下一根待处理的 Bar
+    side: np.ndarray = field(init=False)  # 0 空仓 / 1 多头 / -1 空头
+    cash: np.ndarray = field(init=False)
+    qty: np.ndarray = field(init=False)
+    entry_price: np.ndarray = field(init=False)
+    entry_idx: np.ndarray = field(init=False)
+    extreme: np.ndarray = field(init=False)  # 持仓以来的最高价（多头）/ 最低价（空头）
+
+    def __post_init__(self) -> None:
+        n = self.n_combos
+        self.t = np.zeros(n, dtype=np.int64)
+        self.side = np.zeros(n, dtype=np.int8)
+        self.cash = np.full(n, float(self.initial_balance))
+        self.qty = np.zeros(n)
+        self.entry_price = np.zeros(n)
+        self.entry_idx = np.zeros(n, dtype=np.int64)
+        self.extreme = np.zeros(n)
+
+
+def _pct_array(values: Sequence[Optional[float]]) -> np.ndarray:
+    """出场百分比参数，未启用（None 或 <= 0）记为 0"""
+    return np.array([v if v is not None and v > 0 else 0.0 for v in values], dtype=np.float64)
+
+
+def _next_true(flags: np.ndarray) -> np.ndarray:
+    """next[i] 为 i 及之后第一个 True 的位置（没有则为 len），长度 len + 1"""
+    n = len(flags)
+    positions = np.where(flags, np.arange(n), n)
+    return np.r_[np.minimum.accumulate(positions[::-1])[::-1], n]
+
+
+def run_exit_sweep(
+    df: pd.DataFrame,
+    rule_set: Union[StrategyRuleSet, CompiledRuleSet],
+    exit_params: Sequence[ExitParams],
+    initial_balance: float = 10000.0,
+    fee_rate: float = 0.0,
+    slippage_pct: float = 0.0,
+    timeframe: Optional[str] = None,
+) -> ExitSweepResult:
+    """同一规则、多组止损 / 止盈 / 追踪止损参数的批量回测，统计指标与逐组调用 run_backtest 一致"""
+    compiled = compile_rule_set(rule_set)
+    df = compute_indicators(df, required=compiled.required_columns)
+    signals = compiled.evaluate(df)
+    timeframe = timeframe if timeframe is not None else df.attrs.get("timeframe")
+
+    n_bars = len(df)
+    n_combos = len(exit_params)
+    if n_bars == 0:
+        return ExitSweepResult(metrics=[PerformanceMetrics() for _ in range(n_combos)])
+
+    closes = df["close"].to_numpy(dtype=np.float64)
+    highs = df["high"].to_numpy(dtype=np.float64)
+    lows = df["low"].to_numpy(dtype=np.float64)
+    open_long = np.asarray(signals.open_long, dtype=bool)
+    next_open = _next_true(open_long | np.asarray(signals.open_short, dtype=bool))
+    close_signals = {1: np.asarray(signals.close_long, dtype=bool), -1: np.asarray(signals.close_short, dtype=bool)}
+    next_close = {side: _next_true(flags) for side, flags in close_signals.items()}
+
+    stop_loss = _pct_array([p.stop_loss_pct for p in exit_params])
+    take_profit = _pct_array([p.take_profit_pct for p in exit_params])
+    trailing = _pct_array([p.trailing_stop_pct for p in exit_params])
+    # 与 run_backtest 相同的表达式（entry_price * (1.0 - stop_loss_pct / 100.0) 等），逐元素结果完全一致
+    factors = {
+        1: (1.0 - stop_loss / 100.0, 1.0 + take_profit / 100.0, 1.0 + trailing / 100.0, 1.0 - trailing / 100.0),
+        -1: (1.0 + stop_loss / 100.0, 1.0 - take_profit / 100.0, 1.0 - trailing / 100.0, 1.0 + trailing / 100.0),
+    }
+    enabled = (stop_loss > 0, take_profit > 0, trailing > 0)
+
+    state = _SweepState(n_combos, initial_balance)
+    trades = _TradeColumns()
+
+    while True:
+        active = state.t < n_bars
+        if not active.any():
+            break
+
+        # 1. 空仓组合跳到下一个开仓信号并开仓（同一根 Bar 同时有开多、开空信号时开多）
+        flat = np.flatnonzero(active & (state.side == 0))
+        if len(flat):
+            bars = next_open[state.t[flat]]
+            state.t[flat] = bars + 1
+            has_signal = bars < n_bars
+            flat, bars = flat[has_signal], bars[has_signal]
+            if len(flat):
+                is_long = open_long[bars]
+                effective_entry_price = np.where(
+                    is_long, closes[bars] * (1.0 + slippage_pct), closes[bars] * (1.0 - slippage_pct)
+                )
+                cash = state.cash[flat]
+                usable_cash = cash - cash * fee_rate
+                ok = usable_cash > 0
+                rows = flat[ok]
+                state.side[rows] = np.where(is_long[ok], 1, -1)
+                state.qty[rows] = usable_cash[ok] / effective_entry_price[ok]
+                state.entry_price[rows] = effective_entry_price[ok]
+                state.extreme[rows] = effective_entry_price[ok]
+                state.entry_idx[rows] = bars[ok]
+                state.cash[rows] = 0.0
+
+        # 2. 持仓组合在 (组合 × Bar) 窗口内寻找首个出场点
+        for side in (1, -1):
+            rows = np.flatnonzero((state.t < n_bars) & (state.side == side))
+            if len(rows):
+                _advance_positions(
+                    state, rows, side, trades, highs, lows, closes, close_signals[side], next_close[side],
+                    factors[side], enabled, fee_rate, slippage_pct,
+                )
+
+    # 持仓到最后一根 Bar 的组合
+    holding = np.flatnonzero(state.side != 0)
+    trades.append(
+        combo=holding,
+        entry_idx=state.entry_idx[holding],
+        exit_idx=np.full(len(holding), n_bars),
+        side=state.side[holding],
+        qty=state.qty[holding],
+        entry_price=state.entry_price[holding],
+        cash_after=np.zeros(len(holding)),
+        pnl=np.full(len(holding), np.nan),
+    )
+
+    metrics = _equity_metrics(trades.arrays(), n_combos, closes, initial_balance, timeframe)
+    benchmark_final = closes[-1] / closes[0] * initial_balance
+    return ExitSweepResult(
+        metrics=metrics,
+        benchmark_return=((benchmark_final - initial_balance) / initial_balance) * 100.0,
+    )
+
+
+def _advance_positions(
+    state: _SweepState,
+    rows: np.ndarray,
+    side: int,
+    trades: _TradeColumns,
+    highs: np.ndarray,
+    lows: np.ndarray,
+    closes: np.ndarray,
+    close_signal: np.ndarray,
+    next_close: np.ndarray,
+    factors: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    enabled: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    fee_rate: float,
+    slippage_pct: float,
+) -> None:
+    """同方向持仓的组合按窗口向后推进：触发出场的组合平仓并记录交易，未触发的组合顺延到窗口之后"""
+    n_bars = len(closes)
+    start = state.t[rows]
+    # 窗口长度：覆盖到各组合之后第一个平仓信号即可（信号必然出场），上限 _MAX_WINDOW
+    window = int(min(_MAX_WINDOW, max(1, int((next_close[start] - start).max()) + 1)))
+    bars = start[:, None] + np.arange(window)
+    valid = bars < n_bars
+    bars = np.minimum(bars, n_bars - 1)
+    high, low, close = highs[bars], lows[bars], closes[bars]
+
+    sl_factor, tp_factor, trail_trigger_factor, trail_line_factor = (f[rows] for f in factors)
+    use_sl, use_tp, use_trail = (e[rows] for e in enabled)
+    entry = state.entry_price[rows]
+    sl_price = entry * sl_factor
+    tp_price = entry * tp_factor
+    trail_trigger = entry * trail_trigger_factor
+
+    if side == 1:
+        # 多头：持仓以来最高价（含当根 Bar 最高价），跌破止损 / 追踪线或涨到止盈
+        extreme = np.maximum(np.maximum.accumulate(high, axis=1), state.extreme[rows][:, None])
+        trail_line = extreme * trail_line_factor[:, None]
+        hit_sl = use_sl[:, None] & (low <= sl_price[:, None])
+        hit_tp = use_tp[:, None] & (high >= tp_price[:, None])
+        hit_trail = use_trail[:, None] & (extreme >= trail_trigger[:, None]) & (low <= trail_line)
+    else:
+        # 空头：持仓以来最低价（含当根 Bar 最低价），涨破止损 / 追踪线或跌到止盈
+        extreme = np.minimum(np.minimum.accumulate(low, axis=1), state.extreme[rows][:, None])
+        trail_line = extreme * trail_line_factor[:, None]
+        hit_sl = use_sl[:, None] & (high >= sl_price[:, None])
+        hit_tp = use_tp[:, None] & (low <= tp_price[:, None])
+        hit_trail = use_trail[:, None] & (extreme <= trail_trigger[:, None]) & (high >= trail_line)
+
+    hit = (hit_sl | hit_tp | hit_trail | close_signal[bars]) & valid
+    exits = hit.any(axis=1)
+    first = hit.argmax(axis=1)
+
+    # 未触发出场：记录窗口末的最高 / 最低价，从窗口之后继续
+    hold = ~exits
+    state.extreme[rows[hold]] = extreme[hold, -1]
+    state.t[rows[hold]] = start[hold] + window
+
+    if not exits.any():
+        return
+    rows, k, col = rows[exits], np.flatnonzero(exits), first[exits]
+    exit_close = close[k, col]
+    # 出场价格按 止损 > 止盈 > 追踪止损 > 平仓信号 的优先级
+    if side == 1:
+        exit_price = np.where(
+            hit_sl[k, col], np.minimum(exit_close, sl_price[k]),
+            np.where(
+                hit_tp[k, col], np.maximum(exit_close, tp_price[k]),
+                np.where(hit_trail[k, col], np.minimum(exit_close, trail_line[k, col]), exit_close),
+            ),
+        )
+        qty = state.qty[rows]
+        effective_exit_price = exit_price * (1.0 - slippage_pct)
+        gross_revenue = qty * effective_exit_price
+        exit_fee = gross_revenue * fee_rate
+        net_revenue = gross_revenue - exit_fee
+        state.cash[rows] += net_revenue
+        entry_cost = qty * entry[k]
+        entry_fee = entry_cost * fee_rate
+        trade_pnl = net_revenue - (entry_cost + entry_fee)
+    else:
+        exit_price = np.where(
+            hit_sl[k, col], np.maximum(exit_close, sl_price[k]),
+            np.where(
+                hit_tp[k, col], np.minimum(exit_close, tp_price[k]),
+                np.where(hit_trail[k, col], np.maximum(exit_close, trail_line[k, col]), exit_close),
+            ),
+        )
+        abs_pos = state.qty[rows]
+        effective_exit_price = exit_price * (1.0 + slippage_pct)
+        cover_cost = abs_pos * effective_exit_price
+        exit_fee = cover_cost * fee_rate
+        entry_cost = abs_pos * entry[k]
+        entry_fee = entry_cost * fee_rate
+        total_fee = entry_fee + exit_fee
+        trade_pnl = (entry[k] - effective_exit_price) * abs_pos - total_fee
+        state.cash[rows] += (entry_cost + trade_pnl)
+
+    exit_bars = start[exits] + col
+    trades.append(
+        combo=rows,
+        entry_idx=state.entry_idx[rows],
+        exit_idx=exit_bars,
+        side=np.full(len(rows), side),
+        qty=state.qty[rows],
+        entry_price=entry[k],
+        cash_after=state.cash[rows],
+        pnl=trade_pnl,
+    )
+
+    # 平仓当根 Bar 不再开仓
+    state.side[rows] = 0
+    state.qty[rows] = 0.0
+    state.entry_price[rows] = 0.0
+    state.t[rows] = exit_bars + 1
+
+
+def _equity_metrics(
+    trades: Dict[str, np.ndarray],
+    n_combos: int,
+    closes: np.ndarray,
+    initial_balance: float,
+    timeframe: Optional[str],
+) -> List[PerformanceMetrics]:
+    """由各组合的交易区间还原逐 Bar 净值（与 run_backtest 的逐 Bar 权益公式一致）并计算绩效指标
+
+    每个组合在开仓 Bar 记事件 +(交易序号+1)、平仓 Bar 记 -(交易序号+1)，沿 Bar 方向向前填充最近一次事件：
+    为正表示持仓于该笔交易，为负表示已平仓（净值为该笔交易平仓后的现金），为 0 表示尚未开仓（初始资金）。
+    """
+    n_bars = len(closes)
+    combos = trades["combo"].astype(np.int64)
+    entry_idx = trades["entry_idx"].astype(np.int64)
+    exit_idx = trades["exit_idx"].astype(np.int64)
+    # 末尾追加一个占位交易，尚未开仓的 Bar（交易序号 -1）取到它
+    side = np.append(trades["side"], 0)
+    qty = np.append(trades["qty"], 0.0)
+    entry_price = np.append(trades["entry_price"], 0.0)
+    cash_after = np.append(trades["cash_after"], 0.0)
+    trade_ids = np.arange(1, len(combos) + 1)
+
+    # 交易统计使用与 trades_list 一致的两位小数盈亏
+    closed = ~np.isnan(trades["pnl"])
+    closed_pnls = np.array([round(p, 2) for p in trades["pnl"][closed].tolist()], dtype=np.float64)
+    closed_combos = combos[closed]
+    order = np.argsort(closed_combos, kind="stable")
+    pnl_bounds = np.searchsorted(closed_combos[order], np.arange(n_combos + 1))
+    closed_pnls = closed_pnls[order]
+
+    chunk = max(1, _EQUITY_CHUNK_CELLS // max(n_bars, 1))
+    bar_index = np.arange(n_bars)
+    results: List[PerformanceMetrics] = []
+    for chunk_start in range(0, n_combos, chunk):
+        n_rows = min(chunk, n_combos - chunk_start)
+        in_chunk = (combos >= chunk_start) & (combos < chunk_start + n_rows)
+        rows = combos[in_chunk] - chunk_start
+        ids = trade_ids[in_chunk]
+        events = np.zeros((n_rows, n_bars), dtype=np.int64)
+        events[rows, entry_idx[in_chunk]] = ids
+        ended = exit_idx[in_chunk] < n_bars
+        events[rows[ended], exit_idx[in_chunk][ended]] = -ids[ended]
+
+        last_event = np.maximum.accumulate(np.where(events != 0, bar_index, 0), axis=1)
+        current = np.take_along_axis(events, last_event, axis=1)
+        holding = current > 0
+        trade = np.abs(current) - 1
+
+        t_qty = qty[trade]
+        t_entry = entry_price[trade]
+        long_equity = t_qty * closes
+        short_equity = (t_qty * t_entry) + (t_entry - closes) * t_qty
+        flat_equity = np.where(current < 0, cash_after[trade], initial_balance)
+        equity = np.where(holding, np.where(side[trade] == 1, long_equity, short_equity), flat_equity)
+        np.maximum(equity, 0.0, out=equity)
+
+        for row in range(n_rows):
+            combo = chunk_start + row
+            pnls = closed_pnls[pnl_bounds[combo] : pnl_bounds[combo + 1]]
+            results.append(compute_metrics(equity[row], pnls, initial_balance, timeframe, holding[row]))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 多策略 × 多数据集批量回测：每个 (品种, 周期) 数据集只加载一次、指标只计算一次（取该数据集上全部策略所需指标的并集），
+# 全部 (数据集, 策略) 组合在同一个进程池中并行回测，子进程经共享内存读取 K 线与指标列。
+
+# 并行的最少回测数量（少于此数时进程启动开销大于收益）
+BATCH_PARALLEL_MIN_CELLS = 4
+
+
+@dataclass
+class BatchCell:
+    dataset: int  # datasets 列表中的下标
+    rule_set: Dict  # 策略规则（config_json 解析后的 dict）
+    stop_loss_pct: Optional[float] = None
+    take_profit_pct: Optional[float] = None
+    trailing_stop_pct: Optional[float] = None
+
+
+def _compile_cached(cache: Dict[str, CompiledRuleSet], rule_set: Dict) -> CompiledRuleSet:
+    key = json.dumps(rule_set, sort_keys=True, default=str)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = cache[key] = compile_rule_set(rule_set)
+    return compiled
+
+
+def _run_cell(
+    df: pd.DataFrame,
+    compiled: CompiledRuleSet,
+    cell: BatchCell,
+    initial_balance: float,
+    fee_rate: float,
+    slippage_pct: float,
+) -> BacktestResult:
+    return run_backtest(
+        df=df,
+        rule_set=compiled,
+        initial_balance=initial_balance,
+        stop_loss_pct=cell.stop_loss_pct,
+        take_profit_pct=cell.take_profit_pct,
+        trailing_stop_pct=cell.trailing_stop_pct,
+        fee_rate=fee_rate,
+        slippage_pct=slippage_pct,
+    )
+
+
+# 子进程状态：已挂载的共享内存数据集（按共享内存名）与已编译的规则
+_batch_worker_datasets: Dict[str, Tuple[object, pd.DataFrame]] = {}
+_batch_worker_rules: Dict[str, CompiledRuleSet] = {}
+
+
+def _run_cell_in_worker(
+    task: Tuple[int, SharedKlinesSpec, BatchCell, float, float, float],
+) -> Tuple[int, BacktestResult]:
+    index, spec, cell, initial_balance, fee_rate, slippage_pct = task
+    attached = _batch_worker_datasets.get(spec.name)
+    if attached is None:
+        shm, df = attach_shared_klines(spec)
+        adopt_indicator_columns(df)
+        attached = _batch_worker_datasets[spec.name] = (shm, df)
+    compiled = _compile_cached(_batch_worker_rules, cell.rule_set)
+    return index, _run_cell(attached[1], compiled, cell, initial_balance, fee_rate, slippage_pct)
+
+
+def run_backtest_batch(
+    datasets: List[pd.DataFrame],
+    cells: List[BatchCell],
+    initial_balance: float = 10000.0,
+    fee_rate: float = 0.0,
+    slippage_pct: float = 0.0,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[int, BacktestResult]]:
+    """批量回测，逐个产出 (cells 下标, 回测结果)，并行时按完成先后顺序
+
+    workers 为工作进程数：None 时按回测数量与 CPU 核数自动选择，1 为在当前线程串行执行。
+    """
+    compiled_cache: Dict[str, CompiledRuleSet] = {}
+    compiled = [_compile_cached(compiled_cache, cell.rule_set) for cell in cells]
+
+    # 每个数据集只计算一次指标：取其上全部策略所需指标列的并集
+    required: Dict[int, set] = {}
+    for cell, rule in zip(cells, compiled):
+        required.setdefault(cell.dataset, set()).update(rule.required_columns)
+    for dataset, columns in required.items():
+        compute_indicators(datasets[dataset], required=sorted(columns))
+
+    if workers is None:
+        workers = max(1, min(os.cpu_count() or 1, len(cells))) if len(cells) >= BATCH_PARALLEL_MIN_CELLS else 1
+    if workers <= 1:
+        for index, (cell, rule) in enumerate(zip(cells, compiled)):
+            yield index, _run_cell(datasets[cell.dataset], rule, cell, initial_balance, fee_rate, slippage_pct)
+        return
+
+    with ExitStack() as stack:
+        specs = {
+            dataset: stack.enter_context(SharedKlines(datasets[dataset])).spec
+            for dataset in required
+        }
+        pool = stack.enter_context(
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        )
+        futures = [
+            pool.submit(
+                _run_cell_in_worker,
+                (index, specs[cell.dataset], cell, initial_balance, fee_rate, slippage_pct),
+            )
+            for index, cell in enumerate(cells)
+        ]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 回测净值曲线的数组表示与序列化：
+#   - 回测过程中净值 / 基准曲线始终保存为 NumPy 数组（datetime64[ns] 时间 + float64 净值），不再逐 Bar 构造 dict
+#   - 入库时保存两份：result_json 中为 min/max 分桶降采样后的展示版本，equity_blob 中为压缩的全分辨率副本
+#   - 降采样对净值与基准使用同一组下标，前端按下标对齐两条曲线的逻辑保持不变
+
+# 展示用曲线的默认最大点数
+DISPLAY_MAX_POINTS = 2000
+
+
+@dataclass
+class EquityCurve:
+    ts: np.ndarray  # datetime64[ns]；带时区的原始时间统一换算为 UTC 墙上时间
+    equity: np.ndarray  # float64
+    utc: bool = False  # 原始时间是否带时区，序列化时追加 "+00:00"
+
+    @classmethod
+    def from_series(cls, ts: pd.Series, equity: np.ndarray) -> "EquityCurve":
+        values, utc = datetime64_values(ts)
+        return cls(ts=values, equity=np.asarray(equity, dtype=float), utc=utc)
+
+    def __len__(self) -> int:
+        return len(self.equity)
+
+    @property
+    def final(self) -> Optional[float]:
+        """最后一个净值点；空曲线返回 None"""
+        return float(self.equity[-1]) if len(self.equity) else None
+
+    def with_equity(self, equity: np.ndarray) -> "EquityCurve":
+        """共享时间轴的另一条曲线（如买入持有基准）"""
+        return EquityCurve(ts=self.ts, equity=np.asarray(equity, dtype=float), utc=self.utc)
+
+    def take(self, indices: np.ndarray) -> "EquityCurve":
+        return EquityCurve(ts=self.ts[indices], equity=self.equity[indices], utc=self.utc)
+
+    def isoformat_ts(self) -> List[str]:
+        """时间转 ISO 字符串，格式与 datetime.isoformat() 一致"""
+        if not len(self.ts):
+            return []
+        ns = self.ts.astype(np.int64)
+        unit = "s" if not (ns % 1_000_000_000).any() else "us"
+        text = np.datetime_as_string(self.ts, unit=unit)
+        if self.utc:
+            text = np.char.add(text, "+00:00")
+        return text.tolist()
+
+    def to_points(self) -> List[Dict[str, Any]]:
+        """[{"ts": ISO 字符串, "equity": 净值}, ...]，即 result_json 中的曲线格式"""
+        return [{"ts": t, "equity": e} for t, e in zip(self.isoformat_ts(), self.equity.tolist())]
+
+    def to_series(self) -> pd.Series:
+        index = pd.DatetimeIndex(self.ts, tz="UTC" if self.utc else None)
+        return pd.Series(self.equity, index=index)
+
+
+def datetime64_values(ts: pd.Series) -> Tuple[np.ndarray, bool]:
+    """K 线时间列 -> (datetime64[ns] 数组, 是否带时区)；带时区的时间换算为 UTC"""
+    if not pd.api.types.is_datetime64_any_dtype(ts.dtype):
+        try:
+            ts = pd.to_datetime(ts)
+        except (TypeError, ValueError):
+            ts = pd.to_datetime(ts, utc=True)  # 混合时区偏移
+    if isinstance(ts.dtype, pd.DatetimeTZDtype):
+        values = ts.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+        return values, True
+    return ts.to_numpy(dtype="datetime64[ns]"), False
+
+
+def minmax_indices(series: Sequence[np.ndarray], max_points: int) -> np.ndarray:
+    """min/max 分桶降采样下标（M4 / LTTB 类思路）
+
+    将曲线均分为若干桶，每桶保留各条曲线的最小值点与最大值点，并始终保留首尾两点；
+    多条曲线共用一组下标，保证降采样后仍按下标对齐。回撤谷底、净值峰值等极值点不会被平滑掉。
+    """
+    n = len(series[0]) if series else 0
+    if n <= max_points:
+        return np.arange(n)
+
+    n_buckets = max(1, (max_points - 2) // (2 * len(series)))
+    bucket_size = -(-n // n_buckets)
+    offsets = np.arange(n_buckets) * bucket_size
+
+    picked = [np.array([0, n - 1])]
+    for values in series:
+        padded = np.empty(n_buckets * bucket_size)
+        padded[:n] = values
+        padded[n:] = values[-1]
+        buckets = padded.reshape(n_buckets, bucket_size)
+        picked.append(offsets + buckets.argmin(axis=1))
+        picked.append(offsets + buckets.argmax(axis=1))
+    return np.unique(np.minimum(np.concatenate(picked), n - 1))
+
+
+def downsample_curves(
+    equity_curve: EquityCurve,
+    benchmark_curve: EquityCurve,
+    max_points: int = DISPLAY_MAX_POINTS,
+) -> Tuple[EquityCurve, EquityCurve]:
+    """净值与基准曲线按同一组下标降采样"""
+    indices = minmax_indices([equity_curve.equity, benchmark_curve.equity], max_points)
+    return equity_curve.take(indices), benchmark_curve.take(indices)
+
+
+def pack_curves(equity_curve: EquityCurve, benchmark_curve: EquityCurve) -> bytes:
+    """全分辨率净值 / 基准曲线压缩为二进制（npz），入库到 Backtest.equity_blob"""
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        ts=equity_curve.ts.astype(np.int64),
+        equity=equity_curve.equity,
+        benchmark=benchmark_curve.equity,
+        utc=np.array(equity_curve.utc),
+    )
+    return buffer.getvalue()
+
+
+def unpack_curves(blob: bytes) -> Tuple[EquityCurve, EquityCurve]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        ts = data["ts"].astype("datetime64[ns]")
+        utc = bool(data["utc"])
+        equity_curve = EquityCurve(ts=ts, equity=data["equity"], utc=utc)
+        return equity_curve, equity_curve.with_equity(data["benchmark"])
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Kline, KlineCoverage
+from app.services.multi_timeframe import TIMEFRAME_DELTAS
+
+# K 线覆盖索引：
+#   - kline_coverage 记录每个 (品种, 周期) 已与交易所同步过的连续时间段，同步时只请求区间之外的缺口
+#   - 覆盖表示"交易所在该时间段内的 K 线已全部拉取过"，与本地是否有 K 线无关（如上市前的时间段也算已覆盖）
+#   - 只记录已收盘的 K 线：覆盖终点不晚于当前时间减一根 K 线，最新一根未收盘的 K 线下次同步会重新请求
+#   - 历史数据库没有覆盖记录时，首次查询按已有 K 线的连续段重建
+#   - 时间统一为不带时区的 UTC（与 klines.ts 的存储一致）
+
+Interval = Tuple[datetime, datetime]
+
+# 不定长周期（如月线）相邻判断的容差
+_MIN_STEP = timedelta(milliseconds=1)
+
+
+def naive_utc(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+def bar_delta(timeframe: str) -> Optional[timedelta]:
+    """K 线周期时长；月线等不定长周期返回 None"""
+    delta = TIMEFRAME_DELTAS.get(timeframe)
+    return delta.to_pytimedelta() if delta is not None else None
+
+
+def _step(timeframe: str) -> timedelta:
+    return bar_delta(timeframe) or _MIN_STEP
+
+
+def _query(db: Session, symbol_id: int, timeframe: str):
+    return db.query(KlineCoverage).filter(
+        KlineCoverage.symbol_id == symbol_id,
+        KlineCoverage.timeframe == timeframe,
+    )
+
+
+def rebuild_coverage(db: Session, symbol_id: int, timeframe: str) -> List[Interval]:
+    """按已有 K 线的连续段重建覆盖记录（相邻 K 线间隔超过一个周期即断开）"""
+    ts = np.array(
+        [row[0] for row in db.query(Kline.ts)
+         .filter(Kline.symbol_id == symbol_id, Kline.timeframe == timeframe)
+         .order_by(Kline.ts.asc())],
+        dtype="datetime64[us]",
+    )
+    _query(db, symbol_id, timeframe).delete()
+    if not len(ts):
+        return []
+
+    delta = bar_delta(timeframe)
+    if delta is None:
+        breaks = np.empty(0, dtype=np.int64)
+    else:
+        breaks = np.flatnonzero(np.diff(ts) > np.timedelta64(delta))
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(ts) - 1]))
+    intervals = [(ts[s].astype(datetime), ts[e].astype(datetime)) for s, e in zip(starts, ends)]
+    for start, end in intervals:
+        db.add(KlineCoverage(symbol_id=symbol_id, timeframe=timeframe, start_ts=start, end_ts=end))
+    db.flush()
+    return intervals
+
+
+def coverage_intervals(db: Session, symbol_id: int, timeframe: str) -> List[Interval]:
+    """已覆盖的时间段（按开始时间升序）；尚无覆盖记录但已有 K 线时先重建"""
+    rows = _query(db, symbol_id, timeframe).order_by(KlineCoverage.start_ts.asc()).all()
+    if rows:
+        return [(row.start_ts, row.end_ts) for row in rows]
+    has_klines = (
+        db.query(Kline.id).filter(Kline.symbol_id == symbol_id, Kline.timeframe == timeframe).first() is not None
+    )
+    return rebuild_coverage(db, symbol_id, timeframe) if has_klines else []
+
+
+def record_coverage(db: Session, symbol_id: int, timeframe: str, start: datetime, end: datetime) -> None:
+    """登记 [start, end] 已同步，与重叠或相邻的区间合并；由调用方提交事务"""
+    start, end = naive_utc(start), naive_utc(end)
+    step = _step(timeframe)
+    delta = bar_delta(timeframe)
+    if delta is not None:
+        end = min(end, datetime.utcnow() - delta)
+    if start > end:
+        return
+
+    coverage_intervals(db, symbol_id, timeframe)  # 确保历史数据库已重建覆盖记录
+    merged = (
+        _query(db, symbol_id, timeframe)
+        .filter(KlineCoverage.start_ts <= end + step, KlineCoverage.end_ts >= start - step)
+        .all()
+    )
+    for row in merged:
+        start = min(start, row.start_ts)
+        end = max(end, row.end_ts)
+        db.delete(row)
+    db.add(KlineCoverage(symbol_id=symbol_id, timeframe=timeframe, start_ts=start, end_ts=end))
+    db.flush()
+
+
+def remove_coverage(db: Session, symbol_id: Optional[int] = None, timeframe: Optional[str] = None) -> int:
+    """删除覆盖记录（K 线被清理时调用）：symbol_id 为空时删除全部，timeframe 为空时删除该品种全部周期"""
+    query = db.query(KlineCoverage)
+    if symbol_id is not None:
+        query = query.filter(KlineCoverage.symbol_id == symbol_id)
+        if timeframe is not None:
+            query = query.filter(KlineCoverage.timeframe == timeframe)
+    return query.delete()
+
+
+def missing_intervals(
+    db: Session, symbol_id: int, timeframe: str, start: datetime, end: datetime
+) -> List[Interval]:
+    """[start, end] 中尚未同步的时间段（按开始时间升序，端点为应请求的首末 K 线时间）"""
+    start, end = naive_utc(start), naive_utc(end)
+    step = _step(timeframe)
+    missing: List[Interval] = []
+    cursor = start
+    for cov_start, cov_end in coverage_intervals(db, symbol_id, timeframe):
+        if cov_end < cursor:
+            continue
+        if cov_start > end:
+            break
+        if cov_start > cursor:
+            missing.append((cursor, min(end, cov_start - step)))
+        cursor = max(cursor, cov_end + step)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+def data_gaps(
+    db: Session, symbol_id: int, timeframe: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """本地 K 线中相邻两根间隔超过一个周期的空洞（交易所停机或未同步），返回首末缺失 K 线时间与缺失根数"""
+    delta = bar_delta(timeframe)
+    if delta is None:
+        return []
+    query = db.query(Kline.ts).filter(Kline.symbol_id == symbol_id, Kline.timeframe == timeframe)
+    if start is not None:
+        query = query.filter(Kline.ts >= naive_utc(start))
+    if end is not None:
+        query = query.filter(Kline.ts <= naive_utc(end))
+    ts = np.array([row[0] for row in query.order_by(Kline.ts.asc())], dtype="datetime64[us]")
+    if len(ts) < 2:
+        return []
+
+    step = np.timedelta64(delta)
+    diffs = np.diff(ts)
+    gaps = []
+    for i in np.flatnonzero(diffs > step):
+        gaps.append(
+            {
+                "start_ts": (ts[i] + step).astype(datetime),
+                "end_ts": (ts[i + 1] - step).astype(datetime),
+                "missing_bars": int(diffs[i] // step) - 1,
+            }
+        )
+    return gaps
+
+
+def kline_count(db: Session, symbol_id: int, timeframe: str) -> int:
+    return db.query(func.count(Kline.id)).filter(Kline.symbol_id == symbol_id, Kline.timeframe == timeframe).scalar() or 0
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models import Symbol
+from app.services.kline_coverage import missing_intervals, record_coverage
+from app.services.kline_ingest import KlinePage, bulk_insert_klines, decode_candles
+from app.services.kline_store import kline_store
+from app.services.multi_timeframe import TIMEFRAME_DELTAS
+from app.services.result_cache import result_cache
+
+# 多品种并发 K 线下载：
+#   - 每个下载任务 (品种, 周期, 时间范围) 按 K 线根数切成若干互不重叠的时间段，全部时间段放入同一个队列
+#   - 若干协程共用一个 httpx.AsyncClient 连接池并发拉取各时间段，段内用 after 游标从新到旧翻页，before 限定段的起点
+#   - 每次请求前从令牌桶取令牌，速率与 OKX history-candles 的限频一致（每 IP 20 次 / 2 秒），遇 429 退避重试
+#   - 解码后的页面交给唯一的写库协程，在线程池中批量 INSERT ... ON CONFLICT DO NOTHING，避免多连接争用 SQLite 写锁
+#   - 只下载 kline_coverage 中尚未覆盖的时间段；时间段的全部页面写入后，由写库协程登记该段已覆盖
+
+HISTORY_CANDLES_PATH = "/api/v5/market/history-candles"
+# OKX history-candles 限频：每 IP 2 秒 20 次
+HISTORY_CANDLES_RATE = 20
+HISTORY_CANDLES_INTERVAL = 2.0
+# 单次请求最多返回的 K 线数
+PAGE_LIMIT = 100
+# 每个时间段包含的页数；时间段是并发调度的最小单位
+SEGMENT_PAGES = 10
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """异步令牌桶：容量 capacity，每 interval 秒补满 capacity 个令牌（匀速补充）"""
+
+    def __init__(self, capacity: int, interval: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class DownloadJob:
+    inst_id: str
+    timeframe: str
+    start_ts: datetime
+    end_ts: datetime
+    symbol_id: int = 0
+    gaps: int = 0  # 需要下载的未覆盖时间段数
+    requests: int = 0
+    fetched: int = 0  # 范围内收到的 K 线数
+    inserted: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "inst_id": self.inst_id,
+            "timeframe": self.timeframe,
+            "start_ts": self.start_ts.isoformat(),
+            "end_ts": self.end_ts.isoformat(),
+            "gaps": self.gaps,
+            "requests": self.requests,
+            "fetched": self.fetched,
+            "inserted": self.inserted,
+            "errors": self.errors,
+        }
+
+
+@dataclass
+class _Segment:
+    job: DownloadJob
+    start_ms: int  # 段的时间范围 [start_ms, end_ms]
+    end_ms: int
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def split_segments(
+    job: DownloadJob,
+    start_ts: Optional[datetime] = None,
+    end_ts: Optional[datetime] = None,
+    bars_per_segment: int = PAGE_LIMIT * SEGMENT_PAGES,
+) -> List[_Segment]:
+    """把 [start_ts, end_ts]（默认为任务的时间范围）按 K 线根数切成互不重叠的时间段（最新的时间段在前）；
+    不定长周期（如月线）不切分"""
+    start_ms = int(_utc(start_ts or job.start_ts).timestamp() * 1000)
+    end_ms = int(_utc(end_ts or job.end_ts).timestamp() * 1000)
+    if end_ms < start_ms:
+        return []
+    delta = TIMEFRAME_DELTAS.get(job.timeframe)
+    if delta is None:
+        return [_Segment(job, start_ms, end_ms)]
+    span_ms = int(delta.total_seconds() * 1000) * bars_per_segment
+    segments = []
+    seg_end = end_ms
+    while seg_end >= start_ms:
+        seg_start = max(start_ms, seg_end - span_ms + 1)
+        segments.append(_Segment(job, seg_start, seg_end))
+        seg_end = seg_start - 1
+    return segments
+
+
+class KlineDownloader:
+    """一次批量下载：并发拉取全部时间段、单协程写库，完成后汇总吞吐量"""
+
+    def __init__(self, jobs: List[DownloadJob], concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        self.jobs = jobs
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(HISTORY_CANDLES_RATE, HISTORY_CANDLES_INTERVAL)
+        self._pages: "asyncio.Queue[Optional[Tuple[DownloadJob, Union[KlinePage, _Segment]]]]" = asyncio.Queue(maxsize=64)
+
+    async def run(self) -> Dict[str, Any]:
+        start_time = time.perf_counter()
+        planned = await asyncio.to_thread(self._plan_segments)
+
+        segments: "asyncio.Queue[_Segment]" = asyncio.Queue()
+        for segment in planned:
+            segments.put_nowait(segment)
+        total_segments = segments.qsize()
+
+        writer = asyncio.create_task(self._write_pages())
+        base_url = settings.okx_base_url.rstrip("/")
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=30.0, trust_env=True, limits=limits) as client:
+                fetchers = [
+                    asyncio.create_task(self._fetch_segments(client, segments))
+                    for _ in range(min(self.concurrency, max(1, total_segments)))
+                ]
+                await asyncio.gather(*fetchers)
+        finally:
+            await self._pages.put(None)
+            await writer
+
+        for job in self.jobs:
+            if job.inserted:
+                result_cache.invalidate(job.symbol_id, job.timeframe)
+
+        elapsed = time.perf_counter() - start_time
+        fetched = sum(job.fetched for job in self.jobs)
+        return {
+            "jobs": [job.to_dict() for job in self.jobs],
+            "segments": total_segments,
+            "requests": sum(job.requests for job in self.jobs),
+            "fetched": fetched,
+            "inserted": sum(job.inserted for job in self.jobs),
+            "elapsed_seconds": round(elapsed, 2),
+            "candles_per_sec": round(fetched / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    def _plan_segments(self) -> List[_Segment]:
+        """查找（不存在时创建）各任务的品种记录，只为尚未覆盖的时间段生成下载时间段"""
+        db = SessionLocal()
+        try:
+            segments: List[_Segment] = []
+            for job in self.jobs:
+                symbol = db.query(Symbol).filter(Symbol.inst_id == job.inst_id).first()
+                if not symbol:
+                    symbol = Symbol(inst_id=job.inst_id, exchange_name="OKX")
+                    db.add(symbol)
+                    db.commit()
+                    db.refresh(symbol)
+                job.symbol_id = symbol.id
+                gaps = missing_intervals(db, job.symbol_id, job.timeframe, job.start_ts, job.end_ts)
+                db.commit()  # 保存可能发生的覆盖记录重建
+                job.gaps = len(gaps)
+                for gap_start, gap_end in gaps:
+                    segments.extend(split_segments(job, gap_start, gap_end))
+            return segments
+        finally:
+            db.close()
+
+    async def _fetch_segments(self, client: httpx.AsyncClient, segments: "asyncio.Queue[_Segment]") -> None:
+        while True:
+            try:
+                segment = segments.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await self._fetch_segment(client, segment)
+            except Exception as e:
+                job = segment.job
+                message = f"{type(e).__name__}: {e}"
+                job.errors.append(message)
+                print(f"[K线批量下载] {job.inst_id} {job.timeframe} 时间段下载失败: {message}")
+
+    async def _fetch_segment(self, client: httpx.AsyncClient, segment: _Segment) -> None:
+        """段内从新到旧翻页：after 为游标（不含），before 为段起点的前一毫秒（不含）；
+        翻页正常结束后把时间段本身放入写库队列，排在该段全部页面之后，写库协程据此登记覆盖"""
+        job = segment.job
+        start_dt = datetime.fromtimestamp(segment.start_ms / 1000.0, tz=timezone.utc)
+        end_dt = datetime.fromtimestamp(segment.end_ms / 1000.0, tz=timezone.utc)
+        cursor = segment.end_ms + 1
+        while cursor > segment.start_ms:
+            params = {
+                "instId": job.inst_id,
+                "bar": job.timeframe,
+                "limit": str(PAGE_LIMIT),
+                "after": str(cursor),
+                "before": str(segment.start_ms - 1),
+            }
+            rows = await self._request(client, job, params)
+            if not rows:
+                break
+            page = decode_candles(rows, start_dt, end_dt)
+            if len(page):
+                job.fetched += len(page)
+                await self._pages.put((job, page))
+            oldest = min(int(row[0]) for row in rows)
+            if oldest >= cursor or len(rows) < PAGE_LIMIT:
+                break
+            cursor = oldest
+        await self._pages.put((job, segment))
+
+    async def _request(self, client: httpx.AsyncClient, job: DownloadJob, params: Dict[str, str]) -> List[List[Any]]:
+        delay = HISTORY_CANDLES_INTERVAL
+        for attempt in range(MAX_RETRIES):
+            await self.bucket.acquire()
+            job.requests += 1
+            try:
+                resp = await client.get(HISTORY_CANDLES_PATH, params=params)
+                if resp.status_code == 429:
+                    raise httpx.HTTPStatusError("rate limited", request=resp.request, response=resp)
+                resp.raise_for_status()
+                data = resp.json()
+            except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if status is not None and status != 429 and status < 500:
+                    raise
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+                continue
+            if data.get("code") not in (None, "0"):
+                # 50011：请求过于频繁
+                if data.get("code") == "50011" and attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                    continue
+                raise RuntimeError(f"OKX 返回错误 code={data.get('code')} msg={data.get('msg')}")
+            return data.get("data") or []
+        return []
+
+    async def _write_pages(self) -> None:
+        """唯一的写库协程：页面按到达顺序在线程池中批量写入，每页提交一次；收到时间段时登记覆盖"""
+        db = SessionLocal()
+        try:
+            while True:
+                item = await self._pages.get()
+                if item is None:
+                    return
+                job, payload = item
+                try:
+                    if isinstance(payload, _Segment):
+                        await asyncio.to_thread(self._write_coverage, db, job, payload)
+                    else:
+                        job.inserted += await asyncio.to_thread(self._write_page, db, job, payload)
+                except Exception as e:
+                    job.errors.append(f"写库失败: {e}")
+                    print(f"[K线批量下载] {job.inst_id} {job.timeframe} 写库失败: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write_page(db: Any, job: DownloadJob, page: KlinePage) -> int:
+        try:
+            inserted = bulk_insert_klines(db, job.symbol_id, job.timeframe, page)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if inserted:
+            kline_store.append(db, job.symbol_id, job.timeframe, page)
+        return inserted
+
+    @staticmethod
+    def _write_coverage(db: Any, job: DownloadJob, segment: _Segment) -> None:
+        # 同一时间段内有页面写库失败时不登记，下次同步会重新下载
+        if any(error.startswith("写库失败") for error in job.errors):
+            return
+        try:
+            record_coverage(
+                db,
+                job.symbol_id,
+                job.timeframe,
+                datetime.fromtimestamp(segment.start_ms / 1000.0, tz=timezone.utc),
+                datetime.fromtimestamp(segment.end_ms / 1000.0, tz=timezone.utc),
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+
+async def download_klines(
+    jobs: List[Tuple[str, str, datetime, Optional[datetime]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Dict[str, Any]:
+    """批量下载 [(inst_id, timeframe, start_ts, end_ts)]，end_ts 为空时取当前时间；返回各任务统计与总吞吐量"""
+    now = datetime.now(timezone.utc)
+    download_jobs = [
+        DownloadJob(inst_id, timeframe, _utc(start_ts), _utc(end_ts) if end_ts else now)
+        for inst_id, timeframe, start_ts, end_ts in jobs
+    ]
+    return await KlineDownloader(download_jobs, concurrency).run()
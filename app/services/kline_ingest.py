@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import Kline
+
+# K 线批量入库：
+#   - OKX 返回的一页 K 线（字符串二维数组）先整体解码为列数组，再按时间范围过滤、按时间升序排列
+#   - SQLite / PostgreSQL 用一条 INSERT ... ON CONFLICT (symbol_id, timeframe, ts) DO NOTHING 批量写入整页，
+#     依赖 klines 表的唯一约束 uix_symbol_tf_ts 跳过已存在的 K 线，不再逐条查询是否存在
+#   - 其他数据库先一次查出本页时间范围内已存在的时间戳，再批量插入其余 K 线
+
+_CONFLICT_COLUMNS = ["symbol_id", "timeframe", "ts"]
+
+
+@dataclass
+class KlinePage:
+    """一页已解码的 K 线（按时间升序），ts 为毫秒时间戳"""
+
+    ts: np.ndarray  # int64
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    skipped_early: int = 0  # 早于开始时间被过滤的条数
+    skipped_late: int = 0  # 晚于结束时间被过滤的条数
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def _epoch_ms(dt: datetime) -> int:
+    """毫秒时间戳；不带时区的时间按 UTC 处理"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def decode_candles(
+    rows: Sequence[Sequence[Any]], start_ts: Optional[datetime] = None, end_ts: Optional[datetime] = None
+) -> KlinePage:
+    """OKX candles 接口的 data（[ts, o, h, l, c, vol, ...]，从新到旧）解码为列数组，只保留 [start_ts, end_ts] 内的 K 线
+    （为空时不限制）"""
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return KlinePage(np.empty(0, dtype=np.int64), empty, empty, empty, empty, empty)
+
+    values = np.array([row[:6] for row in rows], dtype=np.float64)
+    ts_ms = values[:, 0].astype(np.int64)
+    early = ts_ms < _epoch_ms(start_ts) if start_ts else np.zeros(len(ts_ms), dtype=bool)
+    late = ts_ms > _epoch_ms(end_ts) if end_ts else np.zeros(len(ts_ms), dtype=bool)
+
+    keep = ~(early | late)
+    order = np.argsort(ts_ms[keep], kind="stable")
+    values = values[keep][order]
+    return KlinePage(
+        ts=ts_ms[keep][order],
+        open=values[:, 1],
+        high=values[:, 2],
+        low=values[:, 3],
+        close=values[:, 4],
+        volume=values[:, 5],
+        skipped_early=int(np.count_nonzero(early)),
+        skipped_late=int(np.count_nonzero(late)),
+    )
+
+
+def _page_records(symbol_id: int, timeframe: str, page: KlinePage) -> List[Dict[str, Any]]:
+    timestamps = [datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc) for ms in page.ts.tolist()]
+    return [
+        {
+            "symbol_id": symbol_id,
+            "timeframe": timeframe,
+            "ts": ts,
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c,
+            "volume": v,
+            "quote_volume": None,
+        }
+        for ts, o, h, l, c, v in zip(
+            timestamps,
+            page.open.tolist(),
+            page.high.tolist(),
+            page.low.tolist(),
+            page.close.tolist(),
+            page.volume.tolist(),
+        )
+    ]
+
+
+def bulk_insert_klines(db: Session, symbol_id: int, timeframe: str, page: KlinePage) -> int:
+    """整页 K 线批量写入（已存在的跳过），返回实际插入条数；由调用方提交事务"""
+    if not len(page):
+        return 0
+    records = _page_records(symbol_id, timeframe, page)
+    table = Kline.__table__
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = (
+            insert(table)
+            .on_conflict_do_nothing(index_elements=_CONFLICT_COLUMNS)
+            .returning(table.c.id)
+        )
+        # RETURNING 只返回真正插入的行，据此得到插入条数（executemany 的 rowcount 在各驱动下不可靠）
+        return len(db.execute(stmt, records).all())
+
+    existing = {
+        ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+        for (ts,) in db.query(Kline.ts).filter(
+            Kline.symbol_id == symbol_id,
+            Kline.timeframe == timeframe,
+            Kline.ts >= records[0]["ts"],
+            Kline.ts <= records[-1]["ts"],
+        )
+    }
+    records = [r for r in records if r["ts"] not in existing]
+    if records:
+        db.execute(table.insert(), records)
+    return len(records)
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Kline
+from app.services.kline_coverage import naive_utc
+from app.services.kline_ingest import KlinePage
+from app.services.multi_timeframe import tag_klines
+from app.services.timings import PHASE_DATAFRAME_BUILD, PHASE_KLINE_QUERY, PhaseTimer
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# K 线存储后端：
+#   - SqlKlineStore（默认）：只 select 所需的列，先 count 再按结果集分批直接填入预分配的 NumPy 数组，
+#     不构造 ORM 对象，也不逐行构造 dict
+#   - NpyKlineStore：每个 (品种, 周期) 一个目录，每列一个定长二进制文件（ts 为 int64 微秒，价格与成交量为 float64），
+#     读取时 np.memmap 映射整列，在 ts 列上二分查找时间范围后切片，不逐行构造 Python 对象
+#   - klines 表始终是数据的权威来源（覆盖索引、统计、结果缓存指纹都依赖它）；列存文件是只读加速副本：
+#     同步提交后追加新页面，首次读取或追加时若文件不存在则从 klines 表整体导出，清理 K 线时删除对应目录
+#   - 每次整体写出（导出、回补历史时的合并去重）都生成新的一代目录，写完后原子替换 CURRENT 指针再删除旧的代；
+#     读者（包括回测子进程）先读 CURRENT 再映射该代的全部列，不会读到新旧两代混合的列
+#   - 新 K 线晚于已有数据时直接追加到当前代各列的尾部，不改动已有的行；各列长度不一致
+#     （追加进行中或中途崩溃）时按最短的列读取
+#   - 写入由进程内锁加 <root>/.lock 上的 flock 串行化
+#   - 回测、寻优、组合回测与实盘统一通过 load_klines 读取 K 线；lookback 在开始时间之前多取若干根 K 线用于指标预热，
+#     load_klines_before 只取某时间点之前的若干根（实盘预热）
+
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+PRICE_COLUMNS = COLUMNS[1:]
+_DTYPES = {"ts": np.int64, "open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64, "volume": np.float64}
+_TS_UNIT = "datetime64[us]"  # 与 klines 表读出的 DataFrame 时间精度一致
+# SQL 后端每批从游标取出的行数
+_FETCH_ROWS = 10000
+# 列存的当前代指针文件与写锁文件
+_CURRENT = "CURRENT"
+_LOCK_FILE = ".lock"
+# 读取时遇到当前代被并发替换的重试次数，仍失败则改为从数据库读取
+_READ_ATTEMPTS = 5
+
+KlineColumns = Dict[str, np.ndarray]
+
+
+def _epoch_us(dt: datetime) -> int:
+    """微秒时间戳；不带时区的时间按 UTC 处理"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _allocate(n: int, columns: Sequence[str] = PRICE_COLUMNS) -> KlineColumns:
+    arrays: KlineColumns = {"ts": np.empty(n, dtype=_TS_UNIT)}
+    for name in columns:
+        arrays[name] = np.empty(n, dtype=_DTYPES[name])
+    return arrays
+
+
+class KlineStore:
+    """K 线存储后端接口：read_columns 返回按时间升序的 ts 与 columns 各列数组（ts 为 datetime64[us]，不带时区的 UTC），
+    lookback > 0 且给定 start_ts 时额外包含 start_ts 之前最多 lookback 根 K 线"""
+
+    name = "base"
+
+    def read_columns(
+        self,
+        db: Session,
+        symbol_id: int,
+        timeframe: str,
+        start_ts: Optional[datetime] = None,
+        end_ts: Optional[datetime] = None,
+        columns: Sequence[str] = PRICE_COLUMNS,
+        lookback: int = 0,
+    ) -> KlineColumns:
+        raise NotImplementedError
+
+    def append(self, db: Session, symbol_id: int, timeframe: str, page: KlinePage) -> None:
+        """同步写入 klines 表并提交后调用"""
+
+    def drop(self, symbol_id: Optional[int] = None, timeframe: Optional[str] = None) -> None:
+        """K 线被清理后调用：symbol_id 为空时删除全部，timeframe 为空时删除该品种全部周期"""
+
+
+class SqlKlineStore(KlineStore):
+    name = "sql"
+
+    def read_columns(
+        self,
+        db: Session,
+        symbol_id: int,
+        timeframe: str,
+        start_ts: Optional[datetime] = None,
+        end_ts: Optional[datetime] = None,
+        columns: Sequence[str] = PRICE_COLUMNS,
+        lookback: int = 0,
+    ) -> KlineColumns:
+        table = Kline.__table__
+        where = [table.c.symbol_id == symbol_id, table.c.timeframe == timeframe]
+        if start_ts and lookback > 0:
+            # 开始时间之前第 lookback 根 K 线；不足 lookback 根时取全部更早的 K 线
+            start_ts = db.execute(
+                select(table.c.ts)
+                .where(*where, table.c.ts < start_ts)
+                .order_by(table.c.ts.desc())
+                .offset(lookback - 1)
+                .limit(1)
+            ).scalar()
+        if start_ts:
+            where.append(table.c.ts >= start_ts)
+        if end_ts:
+            where.append(table.c.ts <= end_ts)
+
+        n = db.execute(select(func.count()).select_from(table).where(*where)).scalar() or 0
+        arrays = _allocate(n, columns)
+        if n == 0:
+            return arrays
+        stmt = (
+            select(table.c.ts, *(table.c[name] for name in columns))
+            .where(*where)
+            .order_by(table.c.ts.asc())
+            .execution_options(yield_per=_FETCH_ROWS)
+        )
+        filled = 0
+        for chunk in db.execute(stmt).partitions():
+            end = filled + len(chunk)
+            if end > len(arrays["ts"]):
+                # count 之后又有新 K 线写入：扩容
+                arrays = {name: np.resize(array, end) for name, array in arrays.items()}
+            for array, values in zip(arrays.values(), zip(*chunk)):
+                array[filled:end] = values
+            filled = end
+        if filled < len(arrays["ts"]):
+            arrays = {name: array[:filled] for name, array in arrays.items()}
+        return arrays
+
+
+class NpyKlineStore(KlineStore):
+    """内存映射列存：<root>/<symbol_id>/<timeframe>/CURRENT 指向当前代目录 gNNNNNN，代目录下每列一个 <列名>.bin"""
+
+    name = "npy"
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _dir(self, symbol_id: int, timeframe: str) -> Path:
+        return self.root / str(symbol_id) / timeframe
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """写锁：进程内为 threading.Lock，进程间为 <root>/.lock 上的 flock（没有 fcntl 的平台只有进程内互斥）"""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / _LOCK_FILE, "a+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _current(directory: Path) -> Optional[Path]:
+        try:
+            name = (directory / _CURRENT).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return directory / name if name else None
+
+    @staticmethod
+    def _length(generation: Path) -> int:
+        return min((generation / f"{name}.bin").stat().st_size // 8 for name in COLUMNS)
+
+    def _map(self, generation: Path, columns: Sequence[str] = COLUMNS) -> KlineColumns:
+        """整列映射（copy-on-write：下游原地修改不会写回文件）；ts 列保持 int64。
+        该代已被替换并删除时抛出 FileNotFoundError"""
+        n = self._length(generation)
+        if n == 0:
+            return {name: np.empty(0, dtype=_DTYPES[name]) for name in columns}
+        return {
+            name: np.memmap(generation / f"{name}.bin", dtype=_DTYPES[name], mode="c", shape=(n,))
+            for name in columns
+        }
+
+    def read_columns(
+        self,
+        db: Session,
+        symbol_id: int,
+        timeframe: str,
+        start_ts: Optional[datetime] = None,
+        end_ts: Optional[datetime] = None,
+        columns: Sequence[str] = PRICE_COLUMNS,
+        lookback: int = 0,
+    ) -> KlineColumns:
+        directory = self._dir(symbol_id, timeframe)
+        mapped: Optional[KlineColumns] = None
+        for _ in range(_READ_ATTEMPTS):
+            generation = self._current(directory)
+            if generation is None:
+                with self._writing():
+                    generation = self._current(directory) or self._export(db, symbol_id, timeframe)
+            try:
+                mapped = self._map(generation, ("ts", *columns))
+                break
+            except FileNotFoundError:
+                # 读取 CURRENT 之后该代被其他进程的合并替换并删除：重新读取 CURRENT
+                continue
+        if mapped is None:
+            print(f"[K线存储] {symbol_id} {timeframe} 列存文件持续变化，改为从数据库读取")
+            return SqlKlineStore().read_columns(db, symbol_id, timeframe, start_ts, end_ts, columns, lookback)
+
+        ts = mapped["ts"]
+        lo = int(np.searchsorted(ts, _epoch_us(start_ts), side="left")) if start_ts else 0
+        hi = int(np.searchsorted(ts, _epoch_us(end_ts), side="right")) if end_ts else len(ts)
+        lo = max(0, lo - max(0, lookback))
+        result = {name: np.asarray(column[lo:hi]) for name, column in mapped.items()}
+        result["ts"] = result["ts"].view(_TS_UNIT)
+        return result
+
+    def append(self, db: Session, symbol_id: int, timeframe: str, page: KlinePage) -> None:
+        if not len(page):
+            return
+        directory = self._dir(symbol_id, timeframe)
+        with self._writing():
+            generation = self._current(directory)
+            if generation is None:
+                # 尚无列存文件：整体导出（已包含刚提交的页面）
+                self._export(db, symbol_id, timeframe)
+                return
+            new = {
+                "ts": page.ts.astype(np.int64) * 1000,
+                "open": page.open,
+                "high": page.high,
+                "low": page.low,
+                "close": page.close,
+                "volume": page.volume,
+            }
+            n = self._length(generation)
+            existing = np.memmap(generation / "ts.bin", dtype=np.int64, mode="r", shape=(n,)) if n else None
+            if existing is None or new["ts"][0] > existing[-1]:
+                self._append_tail(generation, n, new)
+                return
+            # 页面与已有数据重叠：已存在的 K 线跳过，只有中间缺失的 K 线才需要生成新的一代
+            pos = np.searchsorted(existing, new["ts"])
+            present = (pos < n) & (existing[np.minimum(pos, n - 1)] == new["ts"])
+            tail = new["ts"] > existing[-1]
+            del existing
+            if (present | tail).all():
+                if tail.any():
+                    self._append_tail(generation, n, {name: column[tail] for name, column in new.items()})
+            else:
+                self._merge(directory, generation, new)
+
+    def drop(self, symbol_id: Optional[int] = None, timeframe: Optional[str] = None) -> None:
+        with self._writing():
+            if symbol_id is None:
+                targets = [child for child in self.root.iterdir() if child.name != _LOCK_FILE]
+            elif timeframe is None:
+                targets = [self.root / str(symbol_id)]
+            else:
+                targets = [self._dir(symbol_id, timeframe)]
+            for target in targets:
+                shutil.rmtree(target, ignore_errors=True)
+
+    @staticmethod
+    def _append_tail(generation: Path, n: int, new: KlineColumns) -> None:
+        # 只在尾部追加、不改动已有的行：并发读者按各列最短长度读取，读到的总是完整对齐的行
+        for name in COLUMNS:
+            with open(generation / f"{name}.bin", "r+b") as f:
+                # 先截断到公共长度，丢弃上次中途崩溃留下的多余尾部
+                f.truncate(n * 8)
+                f.seek(n * 8)
+                f.write(np.ascontiguousarray(new[name], dtype=_DTYPES[name]).tobytes())
+
+    def _merge(self, directory: Path, generation: Path, new: KlineColumns) -> None:
+        old = self._map(generation)
+        ts = np.concatenate((np.asarray(old["ts"]), new["ts"]))
+        # 时间戳相同时保留已有数据（与 ON CONFLICT DO NOTHING 一致）：稳定排序后取每组第一条
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        keep = np.concatenate(([True], ts[1:] != ts[:-1])) if len(ts) else np.empty(0, dtype=bool)
+        merged = {"ts": ts[keep]}
+        for name in COLUMNS[1:]:
+            merged[name] = np.concatenate((np.asarray(old[name]), new[name]))[order][keep]
+        del old
+        self._write(directory, merged)
+
+    def _export(self, db: Session, symbol_id: int, timeframe: str) -> Path:
+        columns = SqlKlineStore().read_columns(db, symbol_id, timeframe)
+        columns["ts"] = columns["ts"].view(np.int64)
+        return self._write(self._dir(symbol_id, timeframe), columns)
+
+    def _write(self, directory: Path, columns: KlineColumns) -> Path:
+        """写出新的一代并原子切换 CURRENT，再删除旧的代；返回新一代目录（调用方持有写锁）"""
+        current = self._current(directory)
+        number = int(current.name[1:]) + 1 if current is not None and current.name[1:].isdigit() else 1
+        generation = directory / f"g{number:06d}"
+        shutil.rmtree(generation, ignore_errors=True)  # 上次中途崩溃留下的同名目录
+        generation.mkdir(parents=True)
+        for name in COLUMNS:
+            np.ascontiguousarray(columns[name], dtype=_DTYPES[name]).tofile(generation / f"{name}.bin")
+
+        tmp = directory / f"{_CURRENT}.{os.getpid()}.tmp"
+        tmp.write_text(generation.name)
+        os.replace(tmp, directory / _CURRENT)
+        # 已映射旧代的读者不受删除影响；刚读到旧 CURRENT、尚未映射完的读者会因文件不存在而重试
+        for child in directory.iterdir():
+            if child.is_dir() and child.name != generation.name:
+                shutil.rmtree(child, ignore_errors=True)
+        return generation
+
+
+def create_kline_store(backend: str, root: str) -> KlineStore:
+    if backend == NpyKlineStore.name:
+        return NpyKlineStore(root)
+    if backend != SqlKlineStore.name:
+        print(f"[K线存储] 未知的存储后端 {backend}，使用 {SqlKlineStore.name}")
+    return SqlKlineStore()
+
+
+kline_store = create_kline_store(settings.kline_store_backend, settings.kline_store_dir)
+
+
+def _price_columns(columns: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    columns = tuple(columns) if columns is not None else PRICE_COLUMNS
+    unknown = [name for name in columns if name not in PRICE_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的 K 线列: {', '.join(unknown)}")
+    return columns
+
+
+def load_klines(
+    db: Session,
+    symbol_id: int,
+    timeframe: str,
+    start_ts: Optional[datetime] = None,
+    end_ts: Optional[datetime] = None,
+    columns: Optional[Sequence[str]] = None,
+    lookback: int = 0,
+    timer: Optional[PhaseTimer] = None,
+) -> pd.DataFrame:
+    """读取 [start_ts, end_ts] 内的 K 线为 DataFrame（ts 加 columns 指定的列，默认全部 OHLCV）并标记品种与周期。
+    lookback > 0 时在 start_ts 之前多取最多 lookback 根 K 线，实际多取的根数记在 df.attrs["lookback_bars"]；
+    传入 timer 时记录查询与 DataFrame 构建耗时"""
+    columns = _price_columns(columns)
+
+    timer = timer if timer is not None else PhaseTimer()
+    with timer.phase(PHASE_KLINE_QUERY):
+        arrays = kline_store.read_columns(db, symbol_id, timeframe, start_ts, end_ts, columns, lookback)
+    with timer.phase(PHASE_DATAFRAME_BUILD):
+        # 列数组直接交给 pandas，不再复制（列存后端下为内存映射切片）
+        df = pd.DataFrame(arrays, copy=False)
+    tag_klines(df, symbol_id, timeframe)
+    if lookback > 0:
+        start = np.datetime64(naive_utc(start_ts), "us") if start_ts else None
+        df.attrs["lookback_bars"] = int(np.searchsorted(arrays["ts"], start, side="left")) if start is not None else 0
+    return df
+
+
+def load_klines_before(
+    db: Session,
+    symbol_id: int,
+    timeframe: str,
+    before: datetime,
+    count: int,
+    columns: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """读取 before 之前（不含 before）最多 count 根 K 线为 DataFrame（列与标记同 load_klines），
+    用于实盘等只需要某时间点之前若干根历史 K 线做指标预热的场景"""
+    columns = _price_columns(columns)
+    if count <= 0:
+        df = pd.DataFrame(_allocate(0, columns), copy=False)
+    else:
+        # 查询 [before, before] 并向前多取 count 根，再去掉恰好位于 before 的那一根
+        arrays = kline_store.read_columns(db, symbol_id, timeframe, before, before, columns, count)
+        end = int(np.searchsorted(arrays["ts"], np.datetime64(naive_utc(before), "us"), side="left"))
+        df = pd.DataFrame({name: values[:end] for name, values in arrays.items()}, copy=False)
+    tag_klines(df, symbol_id, timeframe)
+    return df
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.services.multi_timeframe import TIMEFRAME_DELTAS
+
+# 绩效统计：输入净值数组与逐笔盈亏数组，全部指标向量化计算，供回测、组合回测与参数寻优共用
+#   - 年化因子按 K 线周期换算（加密货币 7x24 交易，按每年 365 天计）；周期未知时沿用日频 252 的约定
+#   - 回撤的峰值从初始资金起算；收益率序列只取前一根净值为正的 Bar
+#   - 年化收益率在对数空间复利外推：回测区间远短于一年（如 1m 周期的几十根 Bar）时结果可能溢出，
+#     溢出时截断为最大有限浮点数，保证结果可比较、可序列化
+
+DEFAULT_PERIODS_PER_YEAR = 252.0
+_YEAR = 365 * 24 * 3600
+_FLOAT_MAX = float(np.finfo(float).max)
+
+
+def periods_per_year(timeframe: Optional[str]) -> float:
+    """K 线周期对应的每年 Bar 数，如 1H -> 8760、1D -> 365；未知周期返回 252"""
+    if not timeframe:
+        return DEFAULT_PERIODS_PER_YEAR
+    timeframe = timeframe.replace("utc", "")  # OKX 的 6Hutc / 1Dutc 等按 UTC 0 点对齐的周期
+    if timeframe == "1M":
+        return 12.0
+    delta = TIMEFRAME_DELTAS.get(timeframe)
+    if delta is None:
+        return DEFAULT_PERIODS_PER_YEAR
+    return _YEAR / delta.total_seconds()
+
+
+def annualization_factor(timeframe: Optional[str]) -> float:
+    """夏普 / 索提诺比率的年化因子 sqrt(每年 Bar 数)"""
+    return float(np.sqrt(periods_per_year(timeframe)))
+
+
+def clamp_finite(value: float) -> float:
+    """把 ±inf 截断为最大有限浮点数（NaN 原样返回）"""
+    return float(np.clip(value, -_FLOAT_MAX, _FLOAT_MAX))
+
+
+def is_saturated(value: float) -> bool:
+    """是否为 clamp_finite 截断后的值（或 ±inf / NaN）"""
+    return not abs(value) < _FLOAT_MAX
+
+
+def annualize_return(growth: float, n_periods: float, per_year: float) -> float:
+    """期末 / 期初的资金倍数 growth 在 n_periods 根 Bar 内实现，按每年 per_year 根 Bar 复利外推为年化收益率(%)；
+    growth 或 n_periods 非正时返回 0"""
+    if n_periods <= 0 or growth <= 0:
+        return 0.0
+    with np.errstate(over="ignore"):
+        annual = np.expm1(np.log(growth) * (per_year / n_periods)) * 100.0
+    return clamp_finite(annual)
+
+
+@dataclass
+class PerformanceMetrics:
+    total_return: float = 0.0  # 总收益率(%)
+    annual_return: float = 0.0  # 年化收益率(%)
+    max_drawdown: float = 0.0  # 最大回撤(%)
+    sharpe_ratio: float = 0.0  # 夏普比率
+    sortino_ratio: float = 0.0  # 索提诺比率
+    calmar_ratio: float = 0.0  # 卡玛比率（年化收益率 / 最大回撤）
+    exposure: float = 0.0  # 持仓时间占比(%)
+    win_rate: float = 0.0  # 胜率(%)
+    profit_factor: float = 0.0  # 盈亏比
+    trade_count: int = 0  # 总交易次数
+    win_count: int = 0  # 盈利笔数
+    loss_count: int = 0  # 亏损笔数
+    avg_trade_pnl: float = 0.0  # 平均每笔盈亏
+    max_win: float = 0.0  # 单笔最大盈利
+    max_loss: float = 0.0  # 单笔最大亏损
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def max_drawdown_pct(equity: np.ndarray, initial_balance: float) -> float:
+    """最大回撤(%)，峰值从初始资金起算"""
+    if not len(equity):
+        return 0.0
+    peak = np.maximum.accumulate(np.maximum(equity, initial_balance))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = (peak - equity) / peak * 100.0
+    return max(float(np.nanmax(drawdown)), 0.0)
+
+
+def period_returns(equity: np.ndarray) -> np.ndarray:
+    """逐 Bar 收益率，只取前一根净值为正的 Bar"""
+    if len(equity) < 2:
+        return np.empty(0)
+    prev = equity[:-1]
+    curr = equity[1:]
+    valid = prev > 0
+    return (curr[valid] - prev[valid]) / prev[valid]
+
+
+def compute_metrics(
+    equity: np.ndarray,
+    pnls: np.ndarray,
+    initial_balance: float,
+    timeframe: Optional[str] = None,
+    in_market: Optional[np.ndarray] = None,
+) -> PerformanceMetrics:
+    """由净值曲线、逐笔盈亏（与 trades_list 中的 pnl 一致）与逐 Bar 持仓标记计算全部绩效指标"""
+    equity = np.asarray(equity, dtype=float)
+    pnls = np.asarray(pnls, dtype=float)
+    metrics = PerformanceMetrics()
+    if not len(equity):
+        return metrics
+
+    final_equity = float(equity[-1])
+    metrics.total_return = ((final_equity - initial_balance) / initial_balance) * 100.0
+    metrics.max_drawdown = max_drawdown_pct(equity, initial_balance)
+
+    per_year = periods_per_year(timeframe)
+    n_periods = len(equity) - 1
+    if initial_balance > 0:
+        metrics.annual_return = annualize_return(final_equity / initial_balance, n_periods, per_year)
+    if metrics.max_drawdown > 0:
+        metrics.calmar_ratio = clamp_finite(metrics.annual_return / metrics.max_drawdown)
+
+    returns = period_returns(equity)
+    if len(returns):
+        factor = float(np.sqrt(per_year))
+        mean_return = np.mean(returns)
+        std_return = np.std(returns)
+        if std_return > 0:
+            metrics.sharpe_ratio = float((mean_return / std_return) * factor)
+        downside = float(np.sqrt(np.mean(np.square(np.minimum(returns, 0.0)))))
+        if downside > 0:
+            metrics.sortino_ratio = float((mean_return / downside) * factor)
+
+    if in_market is not None and len(in_market):
+        metrics.exposure = float(np.count_nonzero(in_market)) / len(in_market) * 100.0
+
+    # 交易统计分析
+    metrics.trade_count = len(pnls)
+    if len(pnls):
+        wins = pnls > 0
+        metrics.win_count = int(np.count_nonzero(wins))
+        metrics.loss_count = len(pnls) - metrics.win_count
+        metrics.win_rate = (metrics.win_count / len(pnls)) * 100.0
+        metrics.avg_trade_pnl = float(np.mean(pnls))
+        metrics.max_win = float(pnls.max())
+        metrics.max_loss = float(pnls.min())
+
+        total_profit = float(pnls[wins].sum())
+        total_loss = abs(float(pnls[~wins].sum()))
+        if total_loss > 0:
+            metrics.profit_factor = total_profit / total_loss
+        elif total_profit > 0:
+            metrics.profit_factor = 999.0
+    return metrics
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# 蒙特卡洛稳健性检验：以回测的逐笔收益率为样本，重抽样生成大量权益路径
+#   - bootstrap：有放回抽样（每条路径的交易次数可与原始不同）；shuffle：原始交易随机重排（终值不变，只改变路径与回撤）
+#   - 全部路径在一个 (路径数 x 交易数) 矩阵上沿 axis=1 累乘、求滚动峰值与回撤，按块处理以限制内存占用
+#   - 逐笔收益率 = 该笔盈亏 / 开仓前权益（回测为全仓开仓、同一时间最多一笔持仓，开仓前权益即初始资金加此前累计盈亏）
+
+MC_METHODS = ("bootstrap", "shuffle")
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+MC_MAX_PATHS = 100_000
+_CHUNK_CELLS = 4_000_000
+_BAND_POINTS = 100
+
+
+@dataclass
+class MonteCarloSummary:
+    method: str
+    n_paths: int
+    n_trades: int
+    original_total_return: float  # 原始交易顺序的总收益率(%)
+    original_max_drawdown: float  # 原始交易顺序（按平仓权益）的最大回撤(%)
+    total_return: Dict[str, float]  # 各分位数的总收益率(%)
+    max_drawdown: Dict[str, float]  # 各分位数的最大回撤(%)
+    prob_loss: float  # 终值低于初始资金的路径占比(%)
+    prob_drawdown: Dict[str, float]  # 最大回撤超过 10/20/30/50% 的路径占比(%)
+    equity_bands: Dict[str, List[float]]  # 逐笔权益的分位数带（最多 _BAND_POINTS 个点），键 "step" 为交易序号
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "n_paths": self.n_paths,
+            "n_trades": self.n_trades,
+            "original_total_return": self.original_total_return,
+            "original_max_drawdown": self.original_max_drawdown,
+            "total_return": self.total_return,
+            "max_drawdown": self.max_drawdown,
+            "prob_loss": self.prob_loss,
+            "prob_drawdown": self.prob_drawdown,
+            "equity_bands": self.equity_bands,
+        }
+
+
+def trade_returns(pnls: Sequence[float], initial_balance: float) -> np.ndarray:
+    """逐笔盈亏 -> 逐笔收益率（相对开仓前权益）"""
+    pnls = np.asarray(pnls, dtype=float)
+    if not len(pnls):
+        return pnls
+    equity_before = initial_balance + np.concatenate(([0.0], np.cumsum(pnls)[:-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(equity_before > 0, pnls / equity_before, -1.0)
+    return np.maximum(returns, -1.0)
+
+
+def _path_growth(returns_matrix: np.ndarray) -> np.ndarray:
+    """(路径数, 交易数) 收益率矩阵 -> 逐笔权益倍数（原地计算，复用输入内存）"""
+    np.add(returns_matrix, 1.0, out=returns_matrix)
+    np.cumprod(returns_matrix, axis=1, out=returns_matrix)
+    return returns_matrix
+
+
+def _max_drawdowns(growth: np.ndarray) -> np.ndarray:
+    """逐路径最大回撤(%)，峰值从初始资金（倍数 1.0）起算"""
+    peak = np.maximum(growth, 1.0)
+    np.maximum.accumulate(peak, axis=1, out=peak)
+    np.divide(growth, peak, out=peak)
+    return (1.0 - peak.min(axis=1)) * 100.0
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    return {f"p{q}": round(float(v), 2) for q, v in zip(MC_PERCENTILES, np.percentile(values, MC_PERCENTILES))}
+
+
+def run_monte_carlo(
+    pnls: Sequence[float],
+    initial_balance: float,
+    n_paths: int = 1000,
+    method: str = "bootstrap",
+    n_trades: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> MonteCarloSummary:
+    """由逐笔盈亏生成 n_paths 条重抽样权益路径，统计总收益率与最大回撤的分布
+
+    n_trades 为每条路径的交易数（仅 bootstrap，默认与原始交易数相同）。
+    """
+    if method not in MC_METHODS:
+        raise ValueError(f"未知的重抽样方式: {method}，可选 {', '.join(MC_METHODS)}")
+    if n_paths < 1 or n_paths > MC_MAX_PATHS:
+        raise ValueError(f"n_paths 需在 1 ~ {MC_MAX_PATHS} 之间")
+    returns = trade_returns(pnls, initial_balance)
+    if not len(returns):
+        raise ValueError("回测没有已平仓的交易，无法进行蒙特卡洛模拟")
+    if method == "shuffle" or not n_trades:
+        n_trades = len(returns)
+
+    original = _path_growth(returns[np.newaxis, :].copy())
+    rng = np.random.default_rng(seed)
+
+    # 分位数带只取均匀分布的若干个交易序号
+    steps = np.unique(np.linspace(0, n_trades - 1, min(n_trades, _BAND_POINTS)).astype(np.int64))
+    finals = np.empty(n_paths)
+    drawdowns = np.empty(n_paths)
+    band_samples = np.empty((n_paths, len(steps)))
+
+    chunk = max(1, _CHUNK_CELLS // n_trades)
+    for start in range(0, n_paths, chunk):
+        stop = min(start + chunk, n_paths)
+        if method == "bootstrap":
+            sampled = returns[rng.integers(0, len(returns), size=(stop - start, n_trades))]
+        else:
+            sampled = rng.permuted(np.broadcast_to(returns, (stop - start, n_trades)), axis=1)
+        growth = _path_growth(sampled)
+        finals[start:stop] = growth[:, -1]
+        band_samples[start:stop] = growth[:, steps]
+        drawdowns[start:stop] = _max_drawdowns(growth)
+
+    total_returns = (finals - 1.0) * 100.0
+    bands = np.percentile(band_samples, MC_PERCENTILES, axis=0) * initial_balance
+    equity_bands: Dict[str, List[float]] = {"step": (steps + 1).tolist()}
+    for q, row in zip(MC_PERCENTILES, bands):
+        equity_bands[f"p{q}"] = np.round(row, 2).tolist()
+
+    return MonteCarloSummary(
+        method=method,
+        n_paths=n_paths,
+        n_trades=n_trades,
+        original_total_return=round(float(original[0, -1] - 1.0) * 100.0, 2),
+        original_max_drawdown=round(float(_max_drawdowns(original)[0]), 2),
+        total_return=_percentiles(total_returns),
+        max_drawdown=_percentiles(drawdowns),
+        prob_loss=round(float(np.count_nonzero(finals < 1.0)) / n_paths * 100.0, 2),
+        prob_drawdown={
+            str(level): round(float(np.count_nonzero(drawdowns > level)) / n_paths * 100.0, 2)
+            for level in (10, 20, 30, 50)
+        },
+        equity_bands=equity_bands,
+    )
+
+
+def trades_list_pnls(trades_list: List[Dict[str, Any]]) -> List[float]:
+    """BacktestResult.trades_list / result_json["trades_list"] 中的逐笔盈亏"""
+    return [float(t.get("pnl") or 0.0) for t in trades_list]
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.strategy_engine import KLINE_COLUMNS, merge_higher_timeframe, timeframe_column
+
+# 支持重采样的大周期（OKX bar 参数）及其时长；月线长度不固定，不支持
+TIMEFRAME_DELTAS: Dict[str, pd.Timedelta] = {
+    "1m": pd.Timedelta(minutes=1),
+    "3m": pd.Timedelta(minutes=3),
+    "5m": pd.Timedelta(minutes=5),
+    "15m": pd.Timedelta(minutes=15),
+    "30m": pd.Timedelta(minutes=30),
+    "1H": pd.Timedelta(hours=1),
+    "2H": pd.Timedelta(hours=2),
+    "4H": pd.Timedelta(hours=4),
+    "6H": pd.Timedelta(hours=6),
+    "12H": pd.Timedelta(hours=12),
+    "1D": pd.Timedelta(days=1),
+    "2D": pd.Timedelta(days=2),
+    "3D": pd.Timedelta(days=3),
+    "1W": pd.Timedelta(weeks=1),
+}
+
+# 周线按周一 00:00 (UTC) 分桶，其余周期按 Unix 纪元 (UTC) 分桶
+_WEEK_ANCHOR_NS = pd.Timestamp("1970-01-05", tz="UTC").value
+
+_TIMEFRAME_COLUMN = re.compile(r"^(.+)_(\d+[mHDW])$")
+
+
+def split_timeframe_column(col: str) -> Optional[Tuple[str, str]]:
+    """macd_4H -> ("macd", "4H")；不带受支持周期后缀的列返回 None"""
+    match = _TIMEFRAME_COLUMN.match(col)
+    if match is None or match.group(2) not in TIMEFRAME_DELTAS:
+        return None
+    return match.group(1), match.group(2)
+
+
+def tag_klines(df: pd.DataFrame, symbol: Any, timeframe: str) -> pd.DataFrame:
+    """在 K 线 DataFrame 上记录交易对与基础周期，供大周期重采样与缓存使用"""
+    df.attrs["symbol"] = symbol
+    df.attrs["timeframe"] = timeframe
+    return df
+
+
+def _utc_ts(ts: pd.Series) -> pd.Series:
+    return pd.to_datetime(ts, utc=True).astype("datetime64[ns, UTC]")
+
+
+def _utc_ns(ts: pd.Series) -> np.ndarray:
+    return _utc_ts(ts).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def base_timeframe_delta(df: pd.DataFrame) -> Optional[pd.Timedelta]:
+    """基础周期时长：优先取 tag_klines 记录的周期，否则按相邻 K 线时间差的中位数推断"""
+    timeframe = df.attrs.get("timeframe")
+    if timeframe in TIMEFRAME_DELTAS:
+        return TIMEFRAME_DELTAS[timeframe]
+    if len(df) < 2 or "ts" not in df.columns:
+        return None
+    diffs = np.diff(_utc_ns(df["ts"]))
+    diffs = diffs[diffs > 0]
+    if len(diffs) == 0:
+        return None
+    return pd.Timedelta(int(np.median(diffs)), unit="ns")
+
+
+def resample_klines(df: pd.DataFrame, timeframe: str, base_delta: pd.Timedelta) -> pd.DataFrame:
+    """将基础周期 K 线聚合为大周期 K 线（OHLCV），不再重新请求交易所或数据库
+
+    返回的 ts 为该大周期 Bar 的最后一根基础 K 线的 ts（即大周期收盘后才可见的时间点），
+    与 merge_higher_timeframe 的向后匹配配合，基础周期每根 K 线只能看到已闭合的大周期 Bar。
+    开头不完整的大周期 Bar 会被丢弃，结尾未走完的 Bar 因时间点尚未到达不会被匹配。
+    """
+    step = TIMEFRAME_DELTAS[timeframe].value
+    anchor = _WEEK_ANCHOR_NS if timeframe == "1W" else 0
+
+    ns = _utc_ns(df["ts"])
+    order = np.argsort(ns, kind="stable")
+    ns = ns[order]
+    bucket = (ns - anchor) // step
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ns)] - 1
+    bucket_start = bucket[starts] * step + anchor
+
+    columns: Dict[str, np.ndarray] = {}
+    if "open" in df.columns:
+        columns["open"] = df["open"].to_numpy(dtype=float)[order][starts]
+    if "high" in df.columns:
+        columns["high"] = np.maximum.reduceat(df["high"].to_numpy(dtype=float)[order], starts)
+    if "low" in df.columns:
+        columns["low"] = np.minimum.reduceat(df["low"].to_numpy(dtype=float)[order], starts)
+    if "close" in df.columns:
+        columns["close"] = df["close"].to_numpy(dtype=float)[order][ends]
+    if "volume" in df.columns:
+        columns["volume"] = np.add.reduceat(df["volume"].to_numpy(dtype=float)[order], starts)
+
+    higher = pd.DataFrame(columns)
+    visible_at = pd.to_datetime(bucket_start + step - base_delta.value, utc=True)
+    higher.insert(0, "ts", visible_at.astype("datetime64[ns, UTC]"))
+    if len(ns) and ns[0] != bucket_start[0]:
+        higher = higher.iloc[1:].reset_index(drop=True)
+    return higher
+
+
+class HigherTimeframeCache:
+    """大周期 K 线缓存：按 (交易对, 周期, 数据版本) 保存重采样结果，其上的指标由 compute_indicators 的
+    指标缓存按需累积，同一份基础 K 线的多次回测 / 寻优组合 / 实盘轮询不会重复重采样和计算"""
+
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Any, ...], pd.DataFrame]" = OrderedDict()
+
+    def get(self, df: pd.DataFrame, timeframe: str) -> Optional[pd.DataFrame]:
+        from app.services.backtest_engine import kline_signature
+
+        base_delta = base_timeframe_delta(df)
+        if base_delta is None or TIMEFRAME_DELTAS[timeframe] < base_delta:
+            return None  # 无法推断基础周期，或目标周期小于基础周期
+
+        key = (df.attrs.get("symbol"), timeframe, kline_signature(df))
+        higher = self._entries.get(key)
+        if higher is None:
+            higher = resample_klines(df, timeframe, base_delta)
+            self._entries[key] = higher
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return higher
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+higher_timeframe_cache = HigherTimeframeCache()
+
+
+def attach_higher_timeframe(df: pd.DataFrame, timeframe: str, columns: Iterable[str]) -> None:
+    """在 df 上原地添加大周期列（如 columns=["macd"], timeframe="4H" 时添加 macd_4H）
+
+    columns 为大周期上的列名，可以是指标列或 K 线原始列；无法重采样时不添加任何列，相关条件按缺列恒为 False。
+    """
+    from app.services.backtest_engine import compute_indicators
+
+    if df.empty or "ts" not in df.columns:
+        return
+    higher = higher_timeframe_cache.get(df, timeframe)
+    if higher is None or higher.empty:
+        return
+
+    columns = list(columns)
+    compute_indicators(higher, required=[col for col in columns if col not in KLINE_COLUMNS])
+    available = [col for col in columns if col in higher.columns]
+    if not available:
+        return
+
+    rows = higher_timeframe_rows(df, higher, timeframe)
+    visible = rows >= 0
+    for col in available:
+        values = np.full(len(df), np.nan)
+        values[visible] = higher[col].to_numpy(dtype=float)[rows[visible]]
+        df[timeframe_column(col, timeframe)] = values
+
+
+def higher_timeframe_rows(df: pd.DataFrame, higher: pd.DataFrame, timeframe: str) -> np.ndarray:
+    """基础周期每根 K 线可见的最近一根已闭合大周期 Bar 在 higher 中的行号（merge_asof 向后匹配），尚无可见 Bar 时为 -1"""
+    base = pd.DataFrame({"ts": _utc_ts(df["ts"]).reset_index(drop=True), "_row": np.arange(len(df))})
+    marks = pd.DataFrame({"ts": higher["ts"], "bar": np.arange(len(higher), dtype=float)})
+    merged = merge_higher_timeframe(base, marks, timeframe)
+    bar = merged[timeframe_column("bar", timeframe)].to_numpy(dtype=float)
+    visible = ~np.isnan(bar)
+    rows = np.full(len(df), -1, dtype=np.int64)
+    rows[merged["_row"].to_numpy()[visible]] = bar[visible].astype(np.int64)
+    return rows
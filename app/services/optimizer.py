@@ -2,25 +2,57 @@ from __future__ import annotations
 
 import copy
 import itertools
+import json
+import multiprocessing
+import os
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import pandas as pd
 
-from app.services.backtest_engine import BacktestResult, run_backtest
-from app.services.strategy_engine import StrategyRuleSet
+from app.services.backtest_engine import BacktestResult, adopt_indicator_columns, compute_indicators, run_backtest
+from app.services.batch_backtest import ExitParams, run_exit_sweep
+from app.services.metrics import PerformanceMetrics
+from app.services.param_search import (
+    SEARCH_MODES,
+    ParamSpace,
+    TopK,
+    grid_combinations,
+    halving_rungs,
+    latin_hypercube_combinations,
+    random_combinations,
+)
+from app.services.result_cache import backtest_cache_key, frame_dataset, frame_fingerprint, result_cache
+from app.services.shared_klines import SharedKlines, SharedKlinesSpec, attach_shared_klines
+from app.services.strategy_engine import CompiledRuleSet, StrategyRuleSet, compile_rule_set
+from app.services.timings import PHASE_EVALUATION, PHASE_RANKING, PhaseTimer
+
+EXIT_PARAM_KEYS = ("stop_loss_pct", "take_profit_pct", "trailing_stop_pct")
+
+# 组合数达到该值且主机多核时自动启用多进程寻优（进程启动开销约 1 秒）
+PARALLEL_MIN_COMBINATIONS = 16
+# 同一规则下出场参数组合数达到该值时改用批量出场模拟（信号只计算一次）
+EXIT_SWEEP_MIN_COMBINATIONS = 8
+# 逐次减半中第一轮短窗口的最少 K 线数
+HALVING_MIN_BARS = 300
+
+# 进度回调：(已完成组合数, 总组合数, 当前排行榜)，每完成一个组合调用一次（在寻优线程中执行）
+ProgressCallback = Callable[[int, int, TopK], None]
 
 
 def _apply_param_to_rule_set(rule_set: Dict[str, Any], key: str, val: Any) -> Dict[str, Any]:
-    """若参数属于指标内部参数（如 rsi_threshold / ma_fast 等），递归替换 rule_set 中的参数"""
+    """若参数属于指标内部参数（如 rsi_threshold / ma_period / macd_fast 等），递归替换 rule_set 中的参数"""
     new_rule = copy.deepcopy(rule_set)
 
-    # 遍历 buy_groups 和 sell_groups 中的 conditions
-    for group_key in ["buy_groups", "sell_groups"]:
+    # 遍历开多/平多/开空/平空各方向分组中的 conditions（buy_groups/sell_groups 为同一列表的别名）
+    for group_key in ["open_long_groups", "close_long_groups", "open_short_groups", "close_short_groups"]:
         if group_key in new_rule:
             for group in new_rule[group_key]:
                 for cond in group.get("conditions", []):
-                    params = cond.get("params", {})
+                    params = cond.get("params") or {}
+                    indicator_prefix = f"{str(cond.get('indicator_type', '')).lower()}_"
                     # 匹配参数键，如 threshold, period 等
                     if key in params:
                         params[key] = val
@@ -28,99 +60,427 @@ def _apply_param_to_rule_set(rule_set: Dict[str, Any], key: str, val: Any) -> Di
                         params["threshold"] = val
                     elif key == "kdj_threshold" and cond.get("indicator_type") == "KDJ":
                         params["threshold"] = val
+                    elif key.startswith(indicator_prefix) and len(key) > len(indicator_prefix):
+                        # 指标参数，如 ma_period / rsi_period / macd_fast / boll_std，写入对应条件的 params
+                        params[key[len(indicator_prefix):]] = val
+                    else:
+                        continue
+                    cond["params"] = params
 
     return new_rule
 
 
+def _exit_pct(params: Dict[str, Any], key: str) -> Optional[float]:
+    val = params.get(key)
+    if val is None:
+        return None
+    return float(val) if float(val) > 0 else None
+
+
+def _combo_rule_set(base_compiled: CompiledRuleSet, current_params: Dict[str, Any]) -> CompiledRuleSet:
+    """构建此组合下的 rule_set；仅止损/止盈/追踪参数变化的组合直接复用同一个 CompiledRuleSet"""
+    rule_params = {k: v for k, v in current_params.items() if k not in EXIT_PARAM_KEYS}
+    if not rule_params:
+        return base_compiled
+    combo_source = base_compiled.source
+    for k, v in rule_params.items():
+        combo_source = _apply_param_to_rule_set(combo_source, k, v)
+    return compile_rule_set(combo_source)
+
+
+def _score(stats: Union[BacktestResult, PerformanceMetrics]) -> float:
+    """综合评分 (Sharpe比率*20 + 总收益率 - 最大回撤*1.2 + 胜率*0.2)"""
+    return (
+        (stats.sharpe_ratio * 20.0)
+        + stats.total_return
+        - (stats.max_drawdown * 1.2)
+        + (stats.win_rate * 0.2)
+    )
+
+
+def _result_row(
+    current_params: Dict[str, Any],
+    stats: Union[BacktestResult, PerformanceMetrics],
+    benchmark_return: float,
+) -> Dict[str, Any]:
+    """一条寻优结果（rank 在排序后填写）"""
+    return {
+        "rank": 0,
+        "params": current_params,
+        "score": round(_score(stats), 2),
+        "total_return": round(stats.total_return, 2),
+        "benchmark_return": round(benchmark_return, 2),
+        "win_rate": round(stats.win_rate, 2),
+        "sharpe_ratio": round(stats.sharpe_ratio, 3),
+        "sortino_ratio": round(stats.sortino_ratio, 3),
+        "calmar_ratio": round(stats.calmar_ratio, 3),
+        "max_drawdown": round(stats.max_drawdown, 2),
+        "exposure": round(stats.exposure, 2),
+        "profit_factor": round(stats.profit_factor, 2),
+        "trade_count": stats.trade_count,
+        "win_count": stats.win_count,
+        "loss_count": stats.loss_count,
+        "avg_trade_pnl": round(stats.avg_trade_pnl, 2),
+    }
+
+
+def backtest_combination(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    current_params: Dict[str, Any],
+    initial_balance: float,
+) -> BacktestResult:
+    """以指定参数组合运行一次完整回测"""
+    return run_backtest(
+        df=df,
+        rule_set=_combo_rule_set(base_compiled, current_params),
+        initial_balance=initial_balance,
+        stop_loss_pct=_exit_pct(current_params, "stop_loss_pct"),
+        take_profit_pct=_exit_pct(current_params, "take_profit_pct"),
+        trailing_stop_pct=_exit_pct(current_params, "trailing_stop_pct"),
+    )
+
+
+def evaluate_combination(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    current_params: Dict[str, Any],
+    initial_balance: float,
+) -> Dict[str, Any]:
+    """回测单个参数组合，返回一条寻优结果（rank 在排序后填写）"""
+    bt_res = backtest_combination(df, base_compiled, current_params, initial_balance)
+    return _result_row(current_params, bt_res, bt_res.benchmark_return)
+
+
+def compute_search_indicators(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    combinations: Iterable[Dict[str, Any]],
+) -> None:
+    """统一计算全部组合所需的指标（同一 (指标, 参数) 只算一次）"""
+    required: Set[str] = set()
+    for current_params in combinations:
+        required.update(_combo_rule_set(base_compiled, current_params).required_columns)
+    compute_indicators(df, required=sorted(required))
+
+
+def slice_klines(df: pd.DataFrame, start: int, stop: int) -> pd.DataFrame:
+    """截取第 [start, stop) 根 K 线；已算好的指标列随之截取并登记到新 DataFrame 的指标缓存，不再重新计算
+    （指标值与完整区间一致，不受截取后预热长度的影响）"""
+    if start <= 0 and stop >= len(df):
+        return df
+    window = df.iloc[start:stop].reset_index(drop=True)
+    window.attrs.update(df.attrs)
+    adopt_indicator_columns(window)
+    return window
+
+
+def split_exit_sweeps(
+    combinations: List[Dict[str, Any]],
+) -> Tuple[List[List[Tuple[int, Dict[str, Any]]]], List[Tuple[int, Dict[str, Any]]]]:
+    """按规则参数（止损/止盈/追踪以外的参数）分组：同一规则下出场参数组合足够多的分组走批量出场模拟，
+    返回 (批量分组列表, 其余逐个回测的组合)，元素均为 (组合序号, 参数)"""
+    groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for index, current_params in enumerate(combinations):
+        rule_params = {k: v for k, v in current_params.items() if k not in EXIT_PARAM_KEYS}
+        key = json.dumps(rule_params, sort_keys=True, default=str)
+        groups.setdefault(key, []).append((index, current_params))
+
+    sweeps = [group for group in groups.values() if len(group) >= EXIT_SWEEP_MIN_COMBINATIONS]
+    remaining = [item for group in groups.values() if len(group) < EXIT_SWEEP_MIN_COMBINATIONS for item in group]
+    remaining.sort(key=lambda item: item[0])
+    return sweeps, remaining
+
+
+def iter_exit_sweep_results(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    group: List[Tuple[int, Dict[str, Any]]],
+    initial_balance: float,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """同一规则下的一组出场参数：信号只计算一次，全部组合一起批量模拟"""
+    sweep = run_exit_sweep(
+        df,
+        _combo_rule_set(base_compiled, group[0][1]),
+        [
+            ExitParams(
+                stop_loss_pct=_exit_pct(current_params, "stop_loss_pct"),
+                take_profit_pct=_exit_pct(current_params, "take_profit_pct"),
+                trailing_stop_pct=_exit_pct(current_params, "trailing_stop_pct"),
+            )
+            for _, current_params in group
+        ],
+        initial_balance=initial_balance,
+    )
+    for (index, current_params), stats in zip(group, sweep.metrics):
+        yield index, _result_row(current_params, stats, sweep.benchmark_return)
+
+
+# 子进程状态：由 _init_worker 在每个工作进程中初始化一次
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(spec: SharedKlinesSpec, source: Dict[str, Any], initial_balance: float) -> None:
+    shm, df = attach_shared_klines(spec)
+    adopt_indicator_columns(df)
+    _worker_state.update(shm=shm, df=df, base_compiled=compile_rule_set(source), initial_balance=initial_balance)
+
+
+def _evaluate_in_worker(task: Tuple[int, Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    index, current_params = task
+    state = _worker_state
+    return index, evaluate_combination(state["df"], state["base_compiled"], current_params, state["initial_balance"])
+
+
+def default_workers(n_combinations: int) -> int:
+    """自动选择工作进程数：组合较少或单核主机时串行，否则按 CPU 核数（不超过组合数）并行"""
+    if n_combinations < PARALLEL_MIN_COMBINATIONS:
+        return 1
+    return max(1, min(os.cpu_count() or 1, n_combinations))
+
+
+def iter_combination_results(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    combinations: Iterable[Dict[str, Any]],
+    initial_balance: float,
+    workers: int = 1,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """逐个产出 (组合序号, 回测结果)，并行时按完成先后顺序
+
+    workers > 1 时先在主进程一次性算好所有组合用到的指标列，把 K 线与指标通过共享内存发布给
+    ProcessPoolExecutor 的各工作进程；任务只传递参数字典，同时在途的任务数有上限，组合可以是惰性迭代器。
+    """
+    if workers <= 1:
+        for index, current_params in enumerate(combinations):
+            yield index, evaluate_combination(df, base_compiled, current_params, initial_balance)
+        return
+
+    # 先取出全部组合的规则，统一计算指标（同一 (指标, 参数) 只算一次）
+    pending_params = list(combinations)
+    compute_search_indicators(df, base_compiled, pending_params)
+
+    with SharedKlines(df) as shared:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shared.spec, base_compiled.source, initial_balance),
+        ) as pool:
+            todo = enumerate(pending_params)
+            in_flight = set()
+            max_in_flight = workers * 4
+            try:
+                while True:
+                    for task in itertools.islice(todo, max_in_flight - len(in_flight)):
+                        in_flight.add(pool.submit(_evaluate_in_worker, task))
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+
+def evaluate_combinations(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    combinations: List[Dict[str, Any]],
+    initial_balance: float,
+    workers: Optional[int] = None,
+    summary: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """评估一批参数组合，按 (组合序号, 结果) 产出：规则相同、仅出场参数不同的组合批量模拟，
+    其余组合逐个回测（workers 为空时按组合数与 CPU 核数自动选择进程数）。
+    summary 不为空时累计批量模拟的组合数（exit_sweep_combinations）与实际使用的进程数（workers）。"""
+    # 之前评估过的组合（规则、参数与 K 线数据均相同）直接取缓存结果
+    fingerprint = frame_fingerprint(df)
+    dataset = frame_dataset(df)
+    keys = [
+        backtest_cache_key("optimizer_row", base_compiled, fingerprint, initial_balance, params=params)
+        for params in combinations
+    ]
+    pending: List[Tuple[int, Dict[str, Any]]] = []
+    for index, params in enumerate(combinations):
+        cached = result_cache.get(keys[index])
+        if cached is None:
+            pending.append((index, params))
+        else:
+            yield index, dict(cached)
+    if not pending:
+        return
+
+    uncached = _evaluate_uncached(df, base_compiled, [p for _, p in pending], initial_balance, workers, summary)
+    for local_index, row in uncached:
+        index = pending[local_index][0]
+        result_cache.put(keys[index], dict(row), dataset=dataset, size=512)
+        yield index, row
+
+
+def _evaluate_uncached(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    combinations: List[Dict[str, Any]],
+    initial_balance: float,
+    workers: Optional[int],
+    summary: Optional[Dict[str, int]],
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    sweeps, remaining = split_exit_sweeps(combinations)
+    if workers is None:
+        workers = default_workers(len(remaining))
+    if summary is not None:
+        summary["exit_sweep_combinations"] = summary.get("exit_sweep_combinations", 0) + sum(len(g) for g in sweeps)
+        summary["workers"] = max(summary.get("workers", 1), workers)
+    for group in sweeps:
+        yield from iter_exit_sweep_results(df, base_compiled, group, initial_balance)
+    for local_index, row in iter_combination_results(
+        df, base_compiled, [p for _, p in remaining], initial_balance, workers=workers
+    ):
+        yield remaining[local_index][0], row
+
+
+def sample_combinations(
+    space: ParamSpace,
+    search_mode: str,
+    budget: int,
+    seed: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """按搜索模式从参数空间取出待评估的组合（最多 budget 个，不展开整个网格）"""
+    if search_mode == "grid":
+        return list(grid_combinations(space, budget))
+    if search_mode in ("random", "halving"):
+        return list(random_combinations(space, budget, seed))
+    if search_mode == "lhs":
+        return list(latin_hypercube_combinations(space, budget, seed))
+    raise ValueError(f"未知的搜索模式: {search_mode}，可选 {', '.join(SEARCH_MODES)}")
+
+
+def _successive_halving(
+    df: pd.DataFrame,
+    base_compiled: CompiledRuleSet,
+    candidates: List[Dict[str, Any]],
+    initial_balance: float,
+    workers: Optional[int],
+    rungs: List[Tuple[int, int]],
+    board: TopK,
+    summary: Dict[str, int],
+    tick: Callable[[], bool],
+) -> List[Dict[str, Any]]:
+    """逐次减半：全部候选先在最近一段较短的 K 线上评估，每轮只保留得分前 1/eta 的组合并把 K 线放大 eta 倍，
+    最后一轮在完整区间上评估并计入排行榜。返回已完成各轮的组合数与 K 线数；tick 返回 True 时提前停止。"""
+    # 指标在完整区间上一次算好，各轮的短窗口直接截取
+    compute_search_indicators(df, base_compiled, candidates)
+
+    survivors = list(enumerate(candidates))
+    rung_info: List[Dict[str, Any]] = []
+    for rung, (n_keep, n_bars) in enumerate(rungs):
+        survivors = survivors[:n_keep]
+        window = slice_klines(df, len(df) - n_bars, len(df))
+
+        scored: List[Tuple[int, Dict[str, Any]]] = []
+        stopped = False
+        for item in evaluate_combinations(
+            window, base_compiled, [p for _, p in survivors], initial_balance, workers, summary
+        ):
+            scored.append(item)
+            if rung == len(rungs) - 1:
+                board.push(survivors[item[0]][0], item[1])
+            if tick():
+                stopped = True
+                break
+        if stopped:
+            break
+        rung_info.append({"rung": rung + 1, "combinations": len(survivors), "bars": len(window)})
+        if rung == len(rungs) - 1:
+            break
+        scored.sort(key=lambda item: (-item[1]["score"], survivors[item[0]][0]))
+        survivors = [survivors[local_index] for local_index, _ in scored]
+    return rung_info
+
+
 def run_grid_search(
     df: pd.DataFrame,
-    base_rule_set: Dict[str, Any],
+    base_rule_set: Union[Dict[str, Any], CompiledRuleSet],
     param_grid: Dict[str, List[Any]],
     initial_balance: float = 10000.0,
     max_combinations: int = 100,
+    workers: Optional[int] = None,
+    search_mode: str = "grid",
+    n_samples: Optional[int] = None,
+    seed: Optional[int] = None,
+    top_k: int = 100,
+    halving_eta: int = 3,
+    progress: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    timer: Optional[PhaseTimer] = None,
 ) -> Dict[str, Any]:
-    """运行网格参数寻优，测试各种参数组合并按综合得分排序"""
+    """运行参数寻优，测试各种参数组合并按综合得分排序
+
+    search_mode：grid 按网格顺序取前 max_combinations 个组合；random / lhs 在整个网格上随机 / 拉丁超立方抽取
+    n_samples 个（默认 max_combinations）；halving 随机抽取候选后逐次减半。结果只保留得分最高的 top_k 条。
+    workers 为工作进程数：None 时按组合数与 CPU 核数自动选择，1 为在当前线程串行执行。
+    progress 每完成一个组合回调一次；cancel_event 被置位后停止派发新组合，返回已完成部分的结果（cancelled=True）。
+    timer 可带入调用方已记录的阶段（如 K 线读取），评估与排序耗时累加其上并作为 timings 返回。
+    """
     start_time = time.time()
+    timer = timer if timer is not None else PhaseTimer()
+
+    # 规则只编译一次；仅止损/止盈/追踪参数变化的组合直接复用同一个 CompiledRuleSet
+    base_compiled = compile_rule_set(base_rule_set)
+
+    space = ParamSpace(param_grid)
+    budget = max_combinations if search_mode == "grid" or not n_samples else n_samples
+    combinations = sample_combinations(space, search_mode, budget, seed)
+
+    halving_plan: List[Tuple[int, int]] = []
+    if search_mode == "halving" and combinations:
+        halving_plan = halving_rungs(len(combinations), len(df), halving_eta, HALVING_MIN_BARS)
+    total = sum(n for n, _ in halving_plan) if halving_plan else len(combinations)
+
+    board = TopK(top_k)
+    done = 0
+
+    def tick() -> bool:
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done, total, board)
+        return cancel_event is not None and cancel_event.is_set()
+
+    summary: Dict[str, int] = {"workers": 1, "exit_sweep_combinations": 0}
+    rungs: List[Dict[str, Any]] = []
+    with timer.phase(PHASE_EVALUATION):
+        if halving_plan:
+            rungs = _successive_halving(
+                df, base_compiled, combinations, initial_balance, workers, halving_plan, board, summary, tick
+            )
+        elif not (cancel_event is not None and cancel_event.is_set()):
+            for index, row in evaluate_combinations(
+                df, base_compiled, combinations, initial_balance, workers, summary
+            ):
+                board.push(index, row)
+                if tick():
+                    break
 
-    # 提取所有要遍历的参数键与取值列表
-    keys = list(param_grid.keys())
-    value_lists = [param_grid[k] for k in keys]
-
-    # 生成笛卡尔积组合
-    all_combinations = list(itertools.product(*value_lists))
-    if len(all_combinations) > max_combinations:
-        all_combinations = all_combinations[:max_combinations]
-
-    results: List[Dict[str, Any]] = []
-
-    for idx, combo in enumerate(all_combinations):
-        current_params = dict(zip(keys, combo))
-
-        sl_pct = current_params.get("stop_loss_pct")
-        if sl_pct is not None:
-            sl_pct = float(sl_pct) if float(sl_pct) > 0 else None
-
-        tp_pct = current_params.get("take_profit_pct")
-        if tp_pct is not None:
-            tp_pct = float(tp_pct) if float(tp_pct) > 0 else None
-
-        ts_pct = current_params.get("trailing_stop_pct")
-        if ts_pct is not None:
-            ts_pct = float(ts_pct) if float(ts_pct) > 0 else None
-
-        # 构建此组合下的 rule_set
-        combo_rule_set = base_rule_set
-        for k, v in current_params.items():
-            if k not in ["stop_loss_pct", "take_profit_pct", "trailing_stop_pct"]:
-                combo_rule_set = _apply_param_to_rule_set(combo_rule_set, k, v)
-
-        # 运行回测
-        bt_res: BacktestResult = run_backtest(
-            df=df,
-            rule_set=combo_rule_set,
-            initial_balance=initial_balance,
-            stop_loss_pct=sl_pct,
-            take_profit_pct=tp_pct,
-            trailing_stop_pct=ts_pct,
-        )
-
-        # 计算综合评分 (Sharpe比率*20 + 总收益率 - 最大回撤*1.2)
-        score = (
-            (bt_res.sharpe_ratio * 20.0)
-            + bt_res.total_return
-            - (bt_res.max_drawdown * 1.2)
-            + (bt_res.win_rate * 0.2)
-        )
-
-        results.append(
-            {
-                "rank": 0,
-                "params": current_params,
-                "score": round(score, 2),
-                "total_return": round(bt_res.total_return, 2),
-                "benchmark_return": round(bt_res.benchmark_return, 2),
-                "win_rate": round(bt_res.win_rate, 2),
-                "sharpe_ratio": round(bt_res.sharpe_ratio, 3),
-                "max_drawdown": round(bt_res.max_drawdown, 2),
-                "profit_factor": round(bt_res.profit_factor, 2),
-                "trade_count": bt_res.trade_count,
-                "win_count": bt_res.win_count,
-                "loss_count": bt_res.loss_count,
-                "avg_trade_pnl": round(bt_res.avg_trade_pnl, 2),
-            }
-        )
-
-    # 排序并分配名次
-    results.sort(key=lambda x: x["score"], reverse=True)
-    for i, r in enumerate(results):
-        r["rank"] = i + 1
+    # 排序并分配名次（同分按组合顺序，与并行完成顺序无关）
+    with timer.phase(PHASE_RANKING):
+        results = board.ranked()
 
     elapsed = round(time.time() - start_time, 2)
     best_result = results[0] if results else None
 
     return {
-        "total_combinations": len(results),
+        "search_mode": search_mode,
+        "search_space_size": space.size,
+        "total_combinations": board.count,
+        "evaluated_combinations": done,
+        "cancelled": done < total,
         "elapsed_seconds": elapsed,
+        **summary,
         "best_result": best_result,
+        "rungs": rungs,
+        "timings": timer.to_dict(),
         "results": results,
     }
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.param_search import TopK
+
+# 参数寻优任务：寻优在后台线程中运行，前端按任务 id 查询进度 / 订阅进度流 / 取消 / 获取最终结果
+#   - 同一时间只运行 MAX_RUNNING_JOBS 个任务（每个任务自身已按 CPU 核数开多进程），其余排队为 PENDING
+#   - 进度（已完成数、ETA）每个组合更新一次，排行榜快照最多每 PROGRESS_INTERVAL 秒刷新一次
+#   - 只在内存中保留最近 MAX_RETAINED_JOBS 个已结束的任务
+
+JOB_PENDING = "PENDING"
+JOB_RUNNING = "RUNNING"
+JOB_FINISHED = "FINISHED"
+JOB_FAILED = "FAILED"
+JOB_CANCELLED = "CANCELLED"
+TERMINAL_STATUSES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+MAX_RUNNING_JOBS = 1
+MAX_RETAINED_JOBS = 20
+PROGRESS_INTERVAL = 0.5
+LEADERBOARD_SIZE = 10
+
+
+class OptimizerJob:
+    """单个寻优任务的状态；字段只在持有 lock 时读写，version 每次状态变化加一"""
+
+    def __init__(self, job_id: str, meta: Dict[str, Any]) -> None:
+        self.id = job_id
+        self.meta = meta
+        self.status = JOB_PENDING
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = 0
+        self.total = 0
+        self.leaderboard: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self._last_board_refresh = 0.0
+
+    def _touch(self) -> None:
+        self.version += 1
+
+    def on_progress(self, done: int, total: int, board: TopK) -> None:
+        now = time.time()
+        with self.lock:
+            self.done = done
+            self.total = total
+            if done == total or now - self._last_board_refresh >= PROGRESS_INTERVAL:
+                self.leaderboard = board.ranked()[:LEADERBOARD_SIZE]
+                self._last_board_refresh = now
+                self._touch()
+
+    def snapshot(self, include_result: bool = False) -> Dict[str, Any]:
+        """任务当前状态（可直接序列化为 JSON）"""
+        with self.lock:
+            now = self.finished_at or time.time()
+            elapsed = round(now - self.started_at, 2) if self.started_at else 0.0
+            eta = None
+            if self.status == JOB_RUNNING and self.done and self.total:
+                eta = round(elapsed / self.done * (self.total - self.done), 1)
+            data: Dict[str, Any] = {
+                "job_id": self.id,
+                **self.meta,
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "progress": round(self.done / self.total * 100.0, 1) if self.total else 0.0,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": eta,
+                "leaderboard": self.leaderboard,
+                "error": self.error,
+                "version": self.version,
+            }
+            if include_result:
+                data["result"] = self.result
+            return data
+
+
+class OptimizerJobManager:
+    """寻优任务注册表与后台执行线程池"""
+
+    def __init__(self) -> None:
+        self._jobs: "OrderedDict[str, OptimizerJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, meta: Dict[str, Any], run: Callable[[OptimizerJob], Dict[str, Any]]) -> OptimizerJob:
+        """创建任务并排队执行；run(job) 在后台线程中运行寻优并返回最终结果"""
+        job = OptimizerJob(uuid.uuid4().hex, meta)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_RUNNING_JOBS, thread_name_prefix="optimizer")
+            executor = self._executor
+        executor.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id: str) -> Optional[OptimizerJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[OptimizerJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[OptimizerJob]:
+        """请求取消任务：排队中的任务直接结束，运行中的任务在当前组合完成后停止并保留已完成部分的结果"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with job.lock:
+            if job.status == JOB_PENDING:
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+                job._touch()
+        return job
+
+    def _run(self, job: OptimizerJob, run: Callable[[OptimizerJob], Dict[str, Any]]) -> None:
+        with job.lock:
+            if job.status != JOB_PENDING:
+                return
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            job._touch()
+        try:
+            result = run(job)
+        except Exception as e:
+            print(f"[寻优任务 {job.id}] 失败: {e}")
+            traceback.print_exc()
+            with job.lock:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                job.finished_at = time.time()
+                job._touch()
+            return
+        with job.lock:
+            job.result = result
+            job.leaderboard = result.get("results", [])[:LEADERBOARD_SIZE]
+            job.status = JOB_CANCELLED if result.get("cancelled") else JOB_FINISHED
+            job.finished_at = time.time()
+            job._touch()
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in TERMINAL_STATUSES]
+        for job_id in finished[: max(0, len(finished) - MAX_RETAINED_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        """取消全部未结束的任务并等待后台线程退出"""
+        for job in self.list():
+            if job.status not in TERMINAL_STATUSES:
+                self.cancel(job.id)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+optimizer_jobs = OptimizerJobManager()
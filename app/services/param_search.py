@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import random
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 参数寻优的搜索空间采样与结果排行：
+#   - grid：按笛卡尔积顺序惰性枚举（不再整体展开后截断）
+#   - random：在整个网格上无放回均匀随机抽样，按组合序号解码，不展开网格
+#   - lhs：拉丁超立方抽样，每个参数维度的取值区间被均匀覆盖
+#   - 结果由有界的 TopK 排行榜维护，只保留得分最高的 K 条
+
+SEARCH_MODES = ("grid", "random", "lhs", "halving")
+
+
+class ParamSpace:
+    """参数网格：keys 与各自的候选取值列表，组合按混合进制序号（首个参数为最高位）编号"""
+
+    def __init__(self, param_grid: Dict[str, Sequence[Any]]) -> None:
+        self.keys: List[str] = list(param_grid.keys())
+        self.values: List[List[Any]] = [list(param_grid[k]) for k in self.keys]
+        self.sizes: List[int] = [len(v) for v in self.values]
+
+    @property
+    def size(self) -> int:
+        return math.prod(self.sizes) if self.keys else 0
+
+    def combination(self, indices: Sequence[int]) -> Dict[str, Any]:
+        return {key: values[i] for key, values, i in zip(self.keys, self.values, indices)}
+
+    def decode(self, flat_index: int) -> Dict[str, Any]:
+        """组合序号 -> 参数字典（与 itertools.product 的枚举顺序一致）"""
+        indices = []
+        for size in reversed(self.sizes):
+            flat_index, i = divmod(flat_index, size)
+            indices.append(i)
+        return self.combination(indices[::-1])
+
+
+def grid_combinations(space: ParamSpace, limit: int) -> Iterator[Dict[str, Any]]:
+    """按笛卡尔积顺序取前 limit 个组合（惰性）"""
+    if not space.size:
+        return iter(())
+    return (dict(zip(space.keys, combo)) for combo in itertools.islice(itertools.product(*space.values), limit))
+
+
+def random_combinations(space: ParamSpace, n: int, seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """无放回均匀随机抽取 n 个组合；n 不小于网格大小时返回整个网格"""
+    total = space.size
+    if n >= total:
+        yield from grid_combinations(space, total)
+        return
+    rng = random.Random(seed)
+    if n * 2 > total:
+        # 抽样比例较高时直接打乱全部序号（此时网格不大）
+        for flat_index in rng.sample(range(total), n):
+            yield space.decode(flat_index)
+        return
+    seen = set()
+    while len(seen) < n:
+        flat_index = rng.randrange(total)
+        if flat_index not in seen:
+            seen.add(flat_index)
+            yield space.decode(flat_index)
+
+
+def latin_hypercube_combinations(space: ParamSpace, n: int, seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """拉丁超立方抽样：每个参数维度划分为 n 层、每层恰好抽一次，再映射到离散取值；重复组合只保留一次"""
+    if not space.size or n <= 0:
+        return
+    rng = np.random.default_rng(seed)
+    columns = []
+    for size in space.sizes:
+        strata = (rng.permutation(n) + rng.random(n)) / n
+        columns.append(np.minimum((strata * size).astype(np.int64), size - 1))
+    seen = set()
+    for indices in zip(*(c.tolist() for c in columns)):
+        if indices not in seen:
+            seen.add(indices)
+            yield space.combination(indices)
+
+
+def halving_rungs(n_candidates: int, n_bars: int, eta: int, min_bars: int) -> List[Tuple[int, int]]:
+    """逐次减半的各轮 (参与组合数, 使用的 K 线数)：每轮保留前 1/eta，K 线数放大 eta 倍，最后一轮使用全部 K 线"""
+    eta = max(2, eta)
+    n_rungs = 0
+    while (
+        n_candidates // eta ** (n_rungs + 1) >= 1
+        and n_bars // eta ** (n_rungs + 1) >= min_bars
+    ):
+        n_rungs += 1
+    rungs = []
+    candidates = n_candidates
+    for r in range(n_rungs, -1, -1):
+        rungs.append((candidates, n_bars // eta ** r if r else n_bars))
+        candidates = max(1, math.ceil(candidates / eta))
+    return rungs
+
+
+class TopK:
+    """有界排行榜：保留得分最高的 k 条结果，同分时序号小的优先"""
+
+    def __init__(self, k: int) -> None:
+        self.k = max(1, k)
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.count = 0
+
+    def push(self, index: int, row: Dict[str, Any]) -> None:
+        self.count += 1
+        item = (row["score"], -index, row)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def ranked(self) -> List[Dict[str, Any]]:
+        """按得分从高到低排列的结果副本（已填写 rank）"""
+        ordered = sorted(self._heap, key=lambda item: item[:2], reverse=True)
+        return [dict(row, rank=i + 1) for i, (_, _, row) in enumerate(ordered)]
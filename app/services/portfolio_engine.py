@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, List, Optional
@@ -8,7 +9,10 @@ import numpy as np
 import pandas as pd
 
 from app.services.backtest_engine import BacktestResult, run_backtest
+from app.services.metrics import compute_metrics
+from app.services.result_cache import backtest_cache_key, frame_dataset, frame_fingerprint, result_cache
 from app.services.strategy_engine import StrategyRuleSet
+from app.services.timings import PHASE_STATISTICS, PhaseTimer
 
 
 @dataclass
@@ -23,13 +27,46 @@ class PortfolioStrategyConfig:
     trailing_stop_pct: Optional[float] = None
 
 
+def _cached_backtest(s: PortfolioStrategyConfig, allocated_capital: float, timer: PhaseTimer) -> BacktestResult:
+    """单策略回测；规则、出场参数、分配资金与 K 线数据都相同的回测直接复用缓存结果（结果只读，不做修改）。
+    实际执行的回测把各阶段耗时累加到 timer"""
+    key = backtest_cache_key(
+        "backtest_result",
+        s.rule_set,
+        frame_fingerprint(s.df),
+        allocated_capital,
+        stop_loss_pct=s.stop_loss_pct,
+        take_profit_pct=s.take_profit_pct,
+        trailing_stop_pct=s.trailing_stop_pct,
+    )
+    bt_res = result_cache.get(key)
+    if bt_res is None:
+        bt_res = run_backtest(
+            df=s.df,
+            rule_set=s.rule_set,
+            initial_balance=allocated_capital,
+            stop_loss_pct=s.stop_loss_pct,
+            take_profit_pct=s.take_profit_pct,
+            trailing_stop_pct=s.trailing_stop_pct,
+        )
+        size = len(bt_res.equity_curve) * 32 + bt_res.trade_count * 256
+        result_cache.put(key, bt_res, dataset=frame_dataset(s.df), size=size)
+        timer.merge(bt_res.timings)
+    return bt_res
+
+
 def run_portfolio_backtest(
     strategies: List[PortfolioStrategyConfig],
     initial_balance: float = 10000.0,
+    timer: Optional[PhaseTimer] = None,
 ) -> Dict[str, Any]:
-    """运行多策略投资组合回测，计算组合综合净值、分散风险指标与策略收益相关性矩阵"""
+    """运行多策略投资组合回测，计算组合综合净值、分散风险指标与策略收益相关性矩阵
+
+    timer 可带入调用方已记录的阶段（如 K 线读取），各策略回测与组合统计的耗时累加其上并作为 timings 返回。
+    """
     if not strategies:
         return {"error": "未提供策略配置"}
+    timer = timer if timer is not None else PhaseTimer()
 
     # 归一化权重
     total_weight = sum(s.weight for s in strategies)
@@ -46,14 +83,7 @@ def run_portfolio_backtest(
         norm_weight = s.weight / total_weight
         allocated_capital = initial_balance * norm_weight
 
-        bt_res: BacktestResult = run_backtest(
-            df=s.df,
-            rule_set=s.rule_set,
-            initial_balance=allocated_capital,
-            stop_loss_pct=s.stop_loss_pct,
-            take_profit_pct=s.take_profit_pct,
-            trailing_stop_pct=s.trailing_stop_pct,
-        )
+        bt_res = _cached_backtest(s, allocated_capital, timer)
 
         individual_summaries.append(
             {
@@ -61,11 +91,13 @@ def run_portfolio_backtest(
                 "strategy_name": s.strategy_name,
                 "weight_pct": round(norm_weight * 100, 1),
                 "allocated_capital": round(allocated_capital, 2),
-                "final_equity": round(bt_res.equity_curve[-1]["equity"] if bt_res.equity_curve else allocated_capital, 2),
+                "final_equity": round(bt_res.equity_curve.final if len(bt_res.equity_curve) else allocated_capital, 2),
                 "total_return": round(bt_res.total_return, 2),
                 "win_rate": round(bt_res.win_rate, 2),
                 "sharpe_ratio": round(bt_res.sharpe_ratio, 3),
+                "sortino_ratio": round(bt_res.sortino_ratio, 3),
                 "max_drawdown": round(bt_res.max_drawdown, 2),
+                "exposure": round(bt_res.exposure, 2),
                 "trade_count": bt_res.trade_count,
             }
         )
@@ -76,10 +108,8 @@ def run_portfolio_backtest(
             all_trades.append(t_copy)
 
         # 构建时间序列
-        if bt_res.equity_curve:
-            ts_list = [p["ts"] for p in bt_res.equity_curve]
-            eq_list = [p["equity"] for p in bt_res.equity_curve]
-            s_eq = pd.Series(eq_list, index=pd.to_datetime(ts_list), name=s.strategy_name)
+        if len(bt_res.equity_curve):
+            s_eq = bt_res.equity_curve.to_series().rename(s.strategy_name)
             s_eq = s_eq[~s_eq.index.duplicated(keep="first")]
             equity_series_map[s.strategy_name] = s_eq
 
@@ -87,6 +117,9 @@ def run_portfolio_backtest(
             ret_series = s_eq.pct_change().dropna()
             return_series_map[s.strategy_name] = ret_series
 
+    statistics_wall = time.perf_counter()
+    statistics_cpu = time.thread_time()
+
     # 合并净值曲线
     if equity_series_map:
         df_equities = pd.DataFrame(equity_series_map).ffill().bfill()
@@ -104,40 +137,14 @@ def run_portfolio_backtest(
     else:
         portfolio_curve = []
 
-    # 计算组合统计指标
-    portfolio_total_return = 0.0
-    portfolio_sharpe = 0.0
-    portfolio_max_dd = 0.0
-
-    if portfolio_curve:
-        final_eq = portfolio_curve[-1]["equity"]
-        portfolio_total_return = ((final_eq - initial_balance) / initial_balance) * 100.0
-
-        # 计算组合最大回撤
-        peak = initial_balance
-        max_dd = 0.0
-        for p in portfolio_curve:
-            eq_val = p["equity"]
-            if eq_val > peak:
-                peak = eq_val
-            dd = (peak - eq_val) / peak * 100.0
-            if dd > max_dd:
-                max_dd = dd
-        portfolio_max_dd = max_dd
-
-        # 计算组合夏普比率
-        if len(portfolio_curve) > 1:
-            returns = []
-            for i in range(1, len(portfolio_curve)):
-                prev = portfolio_curve[i - 1]["equity"]
-                curr = portfolio_curve[i]["equity"]
-                if prev > 0:
-                    returns.append((curr - prev) / prev)
-            if returns:
-                m = np.mean(returns)
-                sd = np.std(returns)
-                if sd > 0:
-                    portfolio_sharpe = float((m / sd) * np.sqrt(252))
+    # 计算组合统计指标（各策略周期一致时按该周期年化）
+    timeframes = {s.df.attrs.get("timeframe") for s in strategies}
+    portfolio_metrics = compute_metrics(
+        np.array([p["equity"] for p in portfolio_curve], dtype=float),
+        np.empty(0),
+        initial_balance,
+        timeframe=timeframes.pop() if len(timeframes) == 1 else None,
+    )
 
     # 计算策略收益相关性矩阵 (Correlation Matrix)
     correlation_matrix: List[Dict[str, Any]] = []
@@ -157,14 +164,18 @@ def run_portfolio_backtest(
                     }
                 )
 
+    timer.add(PHASE_STATISTICS, time.perf_counter() - statistics_wall, time.thread_time() - statistics_cpu)
+
     return {
         "portfolio_summary": {
             "initial_balance": initial_balance,
             "final_equity": round(portfolio_curve[-1]["equity"] if portfolio_curve else initial_balance, 2),
             "net_profit": round((portfolio_curve[-1]["equity"] if portfolio_curve else initial_balance) - initial_balance, 2),
-            "total_return": round(portfolio_total_return, 2),
-            "sharpe_ratio": round(portfolio_sharpe, 3),
-            "max_drawdown": round(portfolio_max_dd, 2),
+            "total_return": round(portfolio_metrics.total_return, 2),
+            "sharpe_ratio": round(portfolio_metrics.sharpe_ratio, 3),
+            "sortino_ratio": round(portfolio_metrics.sortino_ratio, 3),
+            "calmar_ratio": round(portfolio_metrics.calmar_ratio, 3),
+            "max_drawdown": round(portfolio_metrics.max_drawdown, 2),
             "total_strategies": len(strategies),
             "total_trades": len(all_trades),
         },
@@ -172,4 +183,5 @@ def run_portfolio_backtest(
         "individual_summaries": individual_summaries,
         "correlation_matrix": correlation_matrix,
         "strategy_names": strategy_names,
+        "timings": timer.to_dict(),
     }
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Kline
+from app.services.strategy_engine import CompiledRuleSet, normalize_rule_set
+
+# 内容寻址的回测结果缓存：
+#   - 键为 (规范化规则, 止损/止盈/追踪参数, 手续费/滑点, 初始资金, K 线数据指纹) 的 SHA-256，
+#     相同的回测无论来自哪个接口都命中同一条缓存
+#   - K 线指纹 = 条数 + 起止时间 + 校验和（DataFrame 为 BLAKE2 摘要，数据库查询为按行 id 加权的列和与最大行 id）；
+#     数据变化后指纹随之变化，旧结果不会再被命中
+#   - 按最近使用顺序淘汰（LRU），条数与估算内存双重上限可在配置中调整
+#   - 每条缓存记录所属的 (品种, 周期)，sync_klines / clean_klines 修改数据后按数据集主动清除
+
+Dataset = Tuple[Any, Optional[str]]
+
+
+def frame_fingerprint(df: pd.DataFrame) -> Dict[str, Any]:
+    """K 线 DataFrame 的数据指纹：条数、起止时间与 ts/OHLCV 列的 BLAKE2 校验和"""
+    digest = hashlib.blake2b(digest_size=16)
+    if len(df):
+        digest.update(pd.to_datetime(df["ts"]).to_numpy(dtype="datetime64[ns]").astype(np.int64).tobytes())
+        for col in ("open", "high", "low", "close", "volume"):
+            digest.update(np.ascontiguousarray(df[col].to_numpy(dtype=np.float64)).tobytes())
+    return {
+        "count": len(df),
+        "start": str(df["ts"].iat[0]) if len(df) else None,
+        "end": str(df["ts"].iat[-1]) if len(df) else None,
+        "checksum": digest.hexdigest(),
+    }
+
+
+def query_fingerprint(
+    db: Session,
+    symbol_id: int,
+    timeframe: str,
+    start_ts: Optional[datetime],
+    end_ts: Optional[datetime],
+) -> Dict[str, Any]:
+    """不加载 K 线、直接在数据库中聚合出的数据指纹：条数、起止时间、最大行 id 与各列按行 id 加权的和（起止时间保持 datetime）
+
+    加权和对位置敏感：单根 K 线的微小修正、相互抵消的多处修改都会改变指纹；删除后重新写入的 K 线行 id 变大，
+    同样改变指纹。各和保留完整的浮点精度。"""
+    query = db.query(
+        func.count(Kline.id),
+        func.min(Kline.ts),
+        func.max(Kline.ts),
+        func.max(Kline.id),
+        *(func.sum(Kline.id * column) for column in (Kline.open, Kline.high, Kline.low, Kline.close, Kline.volume)),
+    ).filter(Kline.symbol_id == symbol_id, Kline.timeframe == timeframe)
+    if start_ts:
+        query = query.filter(Kline.ts >= start_ts)
+    if end_ts:
+        query = query.filter(Kline.ts <= end_ts)
+    count, first_ts, last_ts, max_id, *sums = query.one()
+    return {
+        "count": count or 0,
+        "start": first_ts,
+        "end": last_ts,
+        "checksum": f"{max_id or 0}:" + "/".join(repr(float(value or 0.0)) for value in sums),
+    }
+
+
+def backtest_cache_key(
+    kind: str,
+    rule_set: Any,
+    fingerprint: Dict[str, Any],
+    initial_balance: float,
+    stop_loss_pct: Optional[float] = None,
+    take_profit_pct: Optional[float] = None,
+    trailing_stop_pct: Optional[float] = None,
+    fee_rate: float = 0.0,
+    slippage_pct: float = 0.0,
+    **extra: Any,
+) -> str:
+    """缓存键：kind 区分缓存值的类型（如 backtest_id / BacktestResult / 寻优结果行），extra 为额外参与哈希的参数"""
+    source = rule_set.source if isinstance(rule_set, CompiledRuleSet) else normalize_rule_set(rule_set)
+    payload = {
+        "kind": kind,
+        "rule_set": source,
+        "fingerprint": fingerprint,
+        "initial_balance": float(initial_balance),
+        "stop_loss_pct": float(stop_loss_pct) if stop_loss_pct else None,
+        "take_profit_pct": float(take_profit_pct) if take_profit_pct else None,
+        "trailing_stop_pct": float(trailing_stop_pct) if trailing_stop_pct else None,
+        "fee_rate": float(fee_rate or 0.0),
+        "slippage_pct": float(slippage_pct or 0.0),
+        **extra,
+    }
+    text = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def frame_dataset(df: pd.DataFrame) -> Optional[Dataset]:
+    """tag_klines 记录的 (品种, 周期)；未标记的 DataFrame 返回 None"""
+    if "symbol" not in df.attrs:
+        return None
+    return df.attrs["symbol"], df.attrs.get("timeframe")
+
+
+class ResultCache:
+    """线程安全的 LRU 缓存，值的内存占用由调用方估算后传入"""
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[Dataset], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, dataset: Optional[Dataset] = None, size: int = 1024) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, dataset, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def invalidate(self, symbol: Any = None, timeframe: Optional[str] = None) -> int:
+        """清除某个数据集的缓存：symbol 为空时清空全部，timeframe 为空时清除该品种的全部周期；返回清除条数"""
+        with self._lock:
+            if symbol is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+            stale = [
+                key
+                for key, (_, dataset, _) in self._entries.items()
+                if dataset is not None and dataset[0] == symbol and (timeframe is None or dataset[1] == timeframe)
+            ]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[2]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+result_cache = ResultCache(settings.result_cache_max_entries, settings.result_cache_max_mb * 1024 * 1024)
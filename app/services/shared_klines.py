@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.equity_curve import datetime64_values
+
+# 通过 multiprocessing.shared_memory 在进程间共享 K 线与指标列：
+# 主进程把 ts（int64 纳秒）与全部数值列写入同一块共享内存（每列一行的二维 float64 / int64 视图），
+# 子进程按 SharedKlinesSpec 挂载后直接以只读视图构造 DataFrame，不再为每个任务 pickle 整个 DataFrame。
+
+
+@dataclass(frozen=True)
+class SharedKlinesSpec:
+    """子进程挂载共享 K 线所需的全部信息（可 pickle，体积与 K 线数量无关）"""
+
+    name: str
+    columns: Tuple[str, ...]
+    n_rows: int
+    ts_utc: bool
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+class SharedKlines:
+    """主进程持有的共享内存块，用完需 close()（或 with 语句）释放"""
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        columns = tuple(
+            col for col in df.columns if col != "ts" and pd.api.types.is_numeric_dtype(df[col].dtype)
+        )
+        n_rows = len(df)
+        ts_values, ts_utc = datetime64_values(df["ts"])
+
+        size = max((len(columns) + 1) * n_rows * 8, 1)
+        self._shm: Optional[shared_memory.SharedMemory] = shared_memory.SharedMemory(create=True, size=size)
+        np.ndarray((n_rows,), dtype=np.int64, buffer=self._shm.buf)[:] = ts_values.astype(np.int64)
+        matrix = np.ndarray((len(columns), n_rows), dtype=np.float64, buffer=self._shm.buf, offset=n_rows * 8)
+        for i, col in enumerate(columns):
+            matrix[i] = df[col].to_numpy(dtype=np.float64)
+
+        attrs = {key: df.attrs[key] for key in ("symbol", "timeframe") if key in df.attrs}
+        self.spec = SharedKlinesSpec(name=self._shm.name, columns=columns, n_rows=n_rows, ts_utc=ts_utc, attrs=attrs)
+
+    def close(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self) -> "SharedKlines":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def attach_shared_klines(spec: SharedKlinesSpec) -> Tuple[shared_memory.SharedMemory, pd.DataFrame]:
+    """子进程挂载共享 K 线，返回 (共享内存句柄, DataFrame)；DataFrame 的列是共享内存的只读视图，
+    调用方需在使用期间持有句柄"""
+    shm = shared_memory.SharedMemory(name=spec.name)
+    n_rows = spec.n_rows
+    ts_ns = np.ndarray((n_rows,), dtype=np.int64, buffer=shm.buf)
+    matrix = np.ndarray((len(spec.columns), n_rows), dtype=np.float64, buffer=shm.buf, offset=n_rows * 8)
+    matrix.flags.writeable = False
+
+    ts = pd.Series(ts_ns.astype("datetime64[ns]"))
+    if spec.ts_utc:
+        ts = ts.dt.tz_localize("UTC")
+    data: Dict[str, Any] = {"ts": ts}
+    data.update({col: matrix[i] for i, col in enumerate(spec.columns)})
+    df = pd.DataFrame(data, copy=False)
+    df.attrs.update(spec.attrs)
+    return shm, df
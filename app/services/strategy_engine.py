@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import time
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from app.services.timings import PhaseTimer
+
 
 class Side(str, Enum):
     BUY = "BUY"
@@ -147,7 +152,8 @@ class StrategyRuleSet(Dict[str, Any]):
     sell_groups: List[ConditionGroup]
 
 
-def evaluate_condition(cond: Condition, df: pd.DataFrame, idx: int) -> bool:
+def _resolve_condition(cond: Condition) -> Optional[Tuple[IndicatorType, SignalType]]:
+    """解析条件中的指标与信号类型（兼容常见别名写法），无法识别时返回 None"""
     try:
         raw_indicator = cond.get("indicator_type") or cond.get("indicator") or ""
         raw_signal = cond.get("signal_type") or cond.get("signal") or ""
@@ -188,497 +194,733 @@ def evaluate_condition(cond: Condition, df: pd.DataFrame, idx: int) -> bool:
         elif raw_signal_str == "BELOW_ZERO" and raw_indicator_str == "MACD":
             raw_signal_str = "MACD_BELOW_ZERO"
 
-        indicator_type = IndicatorType(raw_indicator_str)
-        signal_type = SignalType(raw_signal_str)
+        return IndicatorType(raw_indicator_str), SignalType(raw_signal_str)
     except Exception:
-        return False
+        return None
+
+
+def evaluate_condition(cond: Condition, df: pd.DataFrame, idx: int) -> bool:
+    """单个条件在第 idx 根 Bar 上的取值（经 CompiledRuleSet 求值，指标参数与条件周期均生效）"""
+    return compile_rule_set({"open_long_groups": [{"logic": "AND", "conditions": [cond]}]}).side_at("open_long", df, idx)
+
+
+# ---------------------------------------------------------------------------
+# 向量化信号编译：每个 SignalType 对整段序列一次性计算出布尔数组
+# ---------------------------------------------------------------------------
+
+SignalKernel = Callable[[pd.DataFrame, Condition], np.ndarray]
+ColumnResolver = Callable[[Condition], Tuple[str, ...]]
+
+
+def _col(df: pd.DataFrame, name: str) -> np.ndarray:
+    return df[name].to_numpy(dtype=float)
+
+
+def _has(df: pd.DataFrame, *names: str) -> bool:
+    return all(name in df.columns for name in names)
+
+
+def _prev(arr: np.ndarray, n: int = 1) -> np.ndarray:
+    """向后平移 n 根 Bar（前 n 个位置填充 NaN），等价于逐 Bar 的 iloc[idx - n]"""
+    out = np.full(arr.shape, np.nan)
+    if n < len(arr):
+        out[n:] = arr[:-n]
+    return out
+
+
+def _warmup(mask: np.ndarray, n: int) -> np.ndarray:
+    """前 n 根 Bar 数据不足，统一视为不触发"""
+    mask[:n] = False
+    return mask
+
+
+def _false(df: pd.DataFrame) -> np.ndarray:
+    return np.zeros(len(df), dtype=bool)
+
+
+def _cross_up(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _warmup((_prev(a) <= _prev(b)) & (a > b), 1)
+
+
+def _cross_down(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _warmup((_prev(a) >= _prev(b)) & (a < b), 1)
+
+
+def _turn_up(x: np.ndarray) -> np.ndarray:
+    x1, x2 = _prev(x, 1), _prev(x, 2)
+    return _warmup((x > x1) & (x1 <= x2), 2)
+
+
+def _turn_down(x: np.ndarray) -> np.ndarray:
+    x1, x2 = _prev(x, 1), _prev(x, 2)
+    return _warmup((x < x1) & (x1 >= x2), 2)
+
+
+# 指标参数与列命名：默认参数沿用原有列名（macd / rsi / kdj_k 等），自定义参数的列名带参数后缀，
+# backtest_engine.compute_indicators 按同样的规则解析列名并计算，同一 (指标, 参数) 只计算一次
+def _int_param(cond: Condition, name: str, default: Optional[int]) -> Optional[int]:
+    value = (cond.get("params") or {}).get(name)
+    return default if value is None else int(value)
+
+
+def _float_param(cond: Condition, name: str, default: float) -> float:
+    value = (cond.get("params") or {}).get(name)
+    return default if value is None else float(value)
+
+
+def ma_column(period: int) -> str:
+    return f"ma{period}"
+
+
+def rsi_column(period: Optional[int] = None) -> str:
+    return "rsi" if period is None else f"rsi{period}"
+
+
+def macd_columns(fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[str, str, str]:
+    if (fast, slow, signal) == (12, 26, 9):
+        return "macd", "macd_signal", "macd_hist"
+    suffix = f"_{fast}_{slow}_{signal}"
+    return f"macd{suffix}", f"macd_signal{suffix}", f"macd_hist{suffix}"
+
+
+def kdj_columns(n: int = 9, m1: int = 3, m2: int = 3) -> Tuple[str, str, str]:
+    if (n, m1, m2) == (9, 3, 3):
+        return "kdj_k", "kdj_d", "kdj_j"
+    suffix = f"_{n}_{m1}_{m2}"
+    return f"kdj_k{suffix}", f"kdj_d{suffix}", f"kdj_j{suffix}"
+
+
+def boll_columns(period: int = 20, std: float = 2.0) -> Tuple[str, str, str, str]:
+    if (period, float(std)) == (20, 2.0):
+        return "boll_upper", "boll_middle", "boll_lower", "boll_width"
+    suffix = f"_{period}_{float(std):g}"
+    return f"boll_upper{suffix}", f"boll_middle{suffix}", f"boll_lower{suffix}", f"boll_width{suffix}"
+
+
+def cci_column(period: int = 14) -> str:
+    return "cci" if period == 14 else f"cci_{period}"
+
+
+# 多周期：条件上的 timeframe 字段（如 "4H"）表示该条件在大周期上计算：由基础周期 K 线重采样出大周期 K 线，
+# 在大周期 K 线上计算指标与信号（前一根即前一根大周期 Bar），再映射回该大周期 Bar 收盘的那根基础 K 线
+KLINE_COLUMNS: Tuple[str, ...] = ("open", "high", "low", "close", "volume")
+
+
+def timeframe_column(col: str, timeframe: str) -> str:
+    return f"{col}_{timeframe}"
+
+
+def condition_timeframe(cond: Condition) -> Optional[str]:
+    timeframe = cond.get("timeframe")
+    if timeframe is None:
+        return None
+    timeframe = str(timeframe).strip()
+    return timeframe or None
+
+
+# RSI 指标体系（params.period 指定单线周期，params.fast / params.slow 指定金叉死叉的快慢线周期）
+def _rsi_columns(cond: Condition) -> Tuple[str, ...]:
+    return (rsi_column(_int_param(cond, "period", None)),)
+
+
+def _rsi_pair_columns(cond: Condition) -> Tuple[str, ...]:
+    return rsi_column(_int_param(cond, "fast", 6)), rsi_column(_int_param(cond, "slow", 12))
+
+
+def _rsi_column_in(df: pd.DataFrame, cond: Condition) -> str:
+    rsi_col = _rsi_columns(cond)[0]
+    if rsi_col == "rsi" and rsi_col not in df.columns:
+        return "rsi14"
+    return rsi_col
+
+
+def _rsi_values(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    rsi_col = _rsi_column_in(df, cond)
+    if rsi_col in df.columns:
+        return _col(df, rsi_col)
+    return np.full(len(df), 50.0)
+
+
+def _rsi_series(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _col(df, _rsi_column_in(df, cond))
+
+
+def _rsi_pair(df: pd.DataFrame, cond: Condition) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    fast_col, slow_col = _rsi_pair_columns(cond)
+    if not _has(df, fast_col, slow_col):
+        return None
+    return _col(df, fast_col), _col(df, slow_col)
+
+
+def _k_rsi_oversold(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    threshold = float(cond.get("params", {}).get("threshold") or cond.get("threshold", 30))
+    return _rsi_values(df, cond) < threshold
+
+
+def _k_rsi_overbought(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    threshold = float(cond.get("params", {}).get("threshold") or cond.get("threshold", 70))
+    return _rsi_values(df, cond) > threshold
+
+
+def _k_rsi_golden_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    pair = _rsi_pair(df, cond)
+    if pair is None:
+        return _false(df)
+    return _cross_up(*pair)
+
+
+def _k_rsi_dead_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    pair = _rsi_pair(df, cond)
+    if pair is None:
+        return _false(df)
+    return _cross_down(*pair)
+
+
+def _k_rsi_low_golden(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    pair = _rsi_pair(df, cond)
+    if pair is None:
+        return _false(df)
+    return (pair[0] < 40) & _cross_up(*pair)
+
+
+def _k_rsi_cross_30_up(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    rsi = _rsi_series(df, cond)
+    return _warmup((_prev(rsi) <= 30.0) & (rsi > 30.0), 1)
+
+
+def _k_rsi_cross_70_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    rsi = _rsi_series(df, cond)
+    return _warmup((_prev(rsi) >= 70.0) & (rsi < 70.0), 1)
+
+
+def _k_rsi_turn_up(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _turn_up(_rsi_series(df, cond))
+
+
+def _k_rsi_turn_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _turn_down(_rsi_series(df, cond))
+
+
+# MACD 指标体系（params.fast / params.slow / params.signal，默认 12 / 26 / 9）
+def _macd_columns(cond: Condition) -> Tuple[str, ...]:
+    return macd_columns(_int_param(cond, "fast", 12), _int_param(cond, "slow", 26), _int_param(cond, "signal", 9))
+
+
+def _macd_lines(df: pd.DataFrame, cond: Condition) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    macd_col, signal_col, hist_col = _macd_columns(cond)
+    macd = _col(df, macd_col)
+    signal = _col(df, signal_col)
+    hist = _col(df, hist_col) if hist_col in df.columns else (macd - signal)
+    return macd, signal, hist
+
+
+def _k_macd_golden_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, signal, _ = _macd_lines(df, cond)
+    diff = macd - signal
+    return _warmup((_prev(diff) <= 0) & (diff > 0), 1)
+
+
+def _k_macd_dead_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, signal, _ = _macd_lines(df, cond)
+    diff = macd - signal
+    return _warmup((_prev(diff) >= 0) & (diff < 0), 1)
+
+
+def _k_macd_above_zero(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, _, _ = _macd_lines(df, cond)
+    return macd > 0
+
+
+def _k_macd_below_zero(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, _, _ = _macd_lines(df, cond)
+    return macd < 0
+
+
+def _k_macd_low_golden(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, signal, _ = _macd_lines(df, cond)
+    diff = macd - signal
+    return _warmup((macd < 0) & (_prev(diff) <= 0) & (diff > 0), 1)
+
+
+def _k_macd_bullish_arrange(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, signal, hist = _macd_lines(df, cond)
+    return (macd > signal) & (hist > 0)
+
+
+def _k_macd_bearish_arrange(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    macd, signal, hist = _macd_lines(df, cond)
+    return (macd < signal) & (hist < 0)
+
+
+# K线形态 (CANDLE)
+def _candle(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    o, c, h, l = _col(df, "open"), _col(df, "close"), _col(df, "high"), _col(df, "low")
+    bar_range = np.maximum(h - l, 1e-6)
+    body = np.abs(c - o)
+    return o, c, h, l, bar_range, body
+
+
+def _k_candle_barefoot_bullish(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, h, l, bar_range, _ = _candle(df)
+    return (c > o) & ((o - l) / bar_range < 0.08)
+
+
+def _k_candle_bald_bullish(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, h, l, bar_range, _ = _candle(df)
+    return (c > o) & ((h - c) / bar_range < 0.08)
+
+
+def _k_candle_barefoot_bearish(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, h, l, bar_range, _ = _candle(df)
+    return (c < o) & ((c - l) / bar_range < 0.08)
+
+
+def _k_candle_bald_bearish(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, h, l, bar_range, _ = _candle(df)
+    return (c < o) & ((h - o) / bar_range < 0.08)
+
+
+def _k_candle_doji(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    _, _, _, _, bar_range, body = _candle(df)
+    return body / bar_range < 0.1
+
+
+def _k_candle_big_yang(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, _, _, bar_range, body = _candle(df)
+    return (c > o) & (body / bar_range > 0.65)
+
+
+def _k_candle_big_yin(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, _, _, bar_range, body = _candle(df)
+    return (o > c) & (body / bar_range > 0.65)
+
+
+def _k_candle_long_upper_shadow(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c, h, _, bar_range, body = _candle(df)
+    upper_shadow = h - np.maximum(o, c)
+    return upper_shadow > np.maximum(body * 2.0, bar_range * 0.5)
+
+
+def _k_candle_bullish_engulfing(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c = _col(df, "open"), _col(df, "close")
+    prev_o, prev_c = _prev(o), _prev(c)
+    engulfing = (c >= prev_o) & (o <= prev_c)
+    return _warmup((prev_c < prev_o) & (c > o) & engulfing, 1)
+
+
+def _k_candle_bearish_engulfing(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o, c = _col(df, "open"), _col(df, "close")
+    prev_o, prev_c = _prev(o), _prev(c)
+    engulfing = (c <= prev_o) & (o >= prev_c)
+    return _warmup((prev_c > prev_o) & (c < o) & engulfing, 1)
 
+
+def _three_bars(df: pd.DataFrame) -> Tuple[np.ndarray, ...]:
+    o, c = _col(df, "open"), _col(df, "close")
+    return _prev(o, 2), _prev(c, 2), _prev(o, 1), _prev(c, 1), o, c
+
+
+def _k_candle_morning_star(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o1, c1, o2, c2, o3, c3 = _three_bars(df)
+    small_body = np.abs(c2 - o2) < np.abs(c1 - o1) * 0.4
+    return _warmup((c1 < o1) & small_body & (c3 > o3) & (c3 > (o1 + c1) / 2), 2)
+
+
+def _k_candle_evening_star(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o1, c1, o2, c2, o3, c3 = _three_bars(df)
+    small_body = np.abs(c2 - o2) < np.abs(c1 - o1) * 0.4
+    return _warmup((c1 > o1) & small_body & (c3 < o3) & (c3 < (o1 + c1) / 2), 2)
+
+
+def _k_candle_three_red_soldiers(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o1, c1, o2, c2, o3, c3 = _three_bars(df)
+    return _warmup((c1 > o1) & (c2 > o2) & (c2 > c1) & (c3 > o3) & (c3 > c2), 2)
+
+
+def _k_candle_four_crows(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    o1, c1, o2, c2, o3, c3 = _three_bars(df)
+    return _warmup((c1 < o1) & (c2 < o2) & (c2 < c1) & (c3 < o3) & (c3 < c2), 2)
+
+
+# KDJ 指标体系（params.n / params.m1 / params.m2，默认 9 / 3 / 3）
+def _kdj_columns(cond: Condition) -> Tuple[str, ...]:
+    return kdj_columns(_int_param(cond, "n", 9), _int_param(cond, "m1", 3), _int_param(cond, "m2", 3))
+
+
+def _kdj(df: pd.DataFrame, cond: Condition) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    k_col, d_col, j_col = _kdj_columns(cond)
+    return _col(df, k_col), _col(df, d_col), _col(df, j_col)
+
+
+def _k_kdj_golden_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, d, _ = _kdj(df, cond)
+    return _cross_up(k, d)
+
+
+def _k_kdj_dead_cross(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, d, _ = _kdj(df, cond)
+    return _cross_down(k, d)
+
+
+def _k_kdj_oversold(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, _, j = _kdj(df, cond)
+    threshold = float(cond.get("params", {}).get("threshold", 20))
+    return (j < threshold) | (k < threshold)
+
+
+def _k_kdj_overbought(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, _, j = _kdj(df, cond)
+    threshold = float(cond.get("params", {}).get("threshold", 80))
+    return (j > threshold) | (k > threshold)
+
+
+def _k_kdj_low_golden(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, d, _ = _kdj(df, cond)
+    return (k < 35) & _cross_up(k, d)
+
+
+def _k_kdj_bullish_arrange(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, d, j = _kdj(df, cond)
+    return (k > d) & (j > k)
+
+
+def _k_kdj_bearish_arrange(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    k, d, j = _kdj(df, cond)
+    return (k < d) & (j < k)
+
+
+def _k_kdj_turn_up(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    _, _, j = _kdj(df, cond)
+    return _turn_up(j)
+
+
+def _k_kdj_turn_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    _, _, j = _kdj(df, cond)
+    return _turn_down(j)
+
+
+# 布林带 (BOLL，params.period / params.std，默认 20 / 2)
+def _boll_columns(cond: Condition) -> Tuple[str, ...]:
+    return boll_columns(_int_param(cond, "period", 20), _float_param(cond, "std", 2.0))
+
+
+def _boll(df: pd.DataFrame, cond: Condition) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    upper_col, middle_col, lower_col, _ = _boll_columns(cond)
+    return _col(df, "close"), _col(df, upper_col), _col(df, middle_col), _col(df, lower_col)
+
+
+def _k_boll_break_upper(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    close, upper, _, _ = _boll(df, cond)
+    return _cross_up(close, upper)
+
+
+def _k_boll_break_middle(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    close, _, middle, _ = _boll(df, cond)
+    return _cross_up(close, middle)
+
+
+def _k_boll_break_lower(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    close, _, _, lower = _boll(df, cond)
+    return _cross_down(close, lower)
+
+
+def _k_boll_break_upper_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    close, upper, _, _ = _boll(df, cond)
+    return _cross_down(close, upper)
+
+
+def _k_boll_break_middle_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    close, _, middle, _ = _boll(df, cond)
+    return _cross_down(close, middle)
+
+
+def _k_boll_open_expand(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    _boll(df, cond)
+    width_col = _boll_columns(cond)[3]
+    if width_col not in df.columns:
+        return _false(df)
+    width = _col(df, width_col)
+    return _warmup(width > _prev(width) * 1.05, 1)
+
+
+def _k_boll_open_shrink(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    _boll(df, cond)
+    width_col = _boll_columns(cond)[3]
+    if width_col not in df.columns:
+        return _false(df)
+    width = _col(df, width_col)
+    return _warmup(width < _prev(width) * 0.95, 1)
+
+
+# BBI 多空指标
+def _k_bbi_price_cross_up(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _cross_up(_col(df, "close"), _col(df, "bbi"))
+
+
+def _k_bbi_price_cross_down(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _cross_down(_col(df, "close"), _col(df, "bbi"))
+
+
+# CCI 顺势指标（params.period，默认 14）
+def _cci_columns(cond: Condition) -> Tuple[str, ...]:
+    return (cci_column(_int_param(cond, "period", 14)),)
+
+
+def _k_cci_below_neg100(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _col(df, _cci_columns(cond)[0]) < -100.0
+
+
+def _k_cci_above_100(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    return _col(df, _cci_columns(cond)[0]) > 100.0
+
+
+# 均线系统 (MA，交叉信号可用 params.fast / params.slow、价格相对均线可用 params.period 覆盖默认周期)
+def _ma_cross_columns(fast: int, slow: int) -> ColumnResolver:
+    def columns(cond: Condition) -> Tuple[str, ...]:
+        return ma_column(_int_param(cond, "fast", fast)), ma_column(_int_param(cond, "slow", slow))
+
+    return columns
+
+
+def _ma_price_columns(period: int) -> ColumnResolver:
+    def columns(cond: Condition) -> Tuple[str, ...]:
+        return (ma_column(_int_param(cond, "period", period)),)
+
+    return columns
+
+
+def _ma_cross_kernel(fast: int, slow: int, golden: bool) -> SignalKernel:
+    resolve_columns = _ma_cross_columns(fast, slow)
+
+    def kernel(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+        fast_col, slow_col = resolve_columns(cond)
+        if not _has(df, fast_col, slow_col):
+            return _false(df)
+        cross = _cross_up if golden else _cross_down
+        return cross(_col(df, fast_col), _col(df, slow_col))
+
+    return kernel
+
+
+def _ma_price_kernel(period: int, above: bool) -> SignalKernel:
+    resolve_columns = _ma_price_columns(period)
+
+    def kernel(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+        close = _col(df, "close")
+        ma_col = resolve_columns(cond)[0]
+        if ma_col not in df.columns:
+            return _false(df)
+        ma = _col(df, ma_col)
+        return close > ma if above else close < ma
+
+    return kernel
+
+
+def _ma_arrange_kernel(bullish: bool) -> SignalKernel:
+    def kernel(df: pd.DataFrame, cond: Condition) -> np.ndarray:
+        if not _has(df, "ma5", "ma10", "ma20"):
+            return _false(df)
+        ma5, ma10, ma20 = _col(df, "ma5"), _col(df, "ma10"), _col(df, "ma20")
+        if bullish:
+            return (ma5 > ma10) & (ma10 > ma20)
+        return (ma5 < ma10) & (ma10 < ma20)
+
+    return kernel
+
+
+# SignalType -> (所属指标, 向量化计算函数)
+SIGNAL_KERNELS: Dict[SignalType, Tuple[IndicatorType, SignalKernel]] = {
+    SignalType.RSI_OVERSOLD: (IndicatorType.RSI, _k_rsi_oversold),
+    SignalType.RSI_OVERBOUGHT: (IndicatorType.RSI, _k_rsi_overbought),
+    SignalType.RSI_GOLDEN_CROSS: (IndicatorType.RSI, _k_rsi_golden_cross),
+    SignalType.RSI_DEAD_CROSS: (IndicatorType.RSI, _k_rsi_dead_cross),
+    SignalType.RSI_LOW_GOLDEN: (IndicatorType.RSI, _k_rsi_low_golden),
+    SignalType.RSI_CROSS_30_UP: (IndicatorType.RSI, _k_rsi_cross_30_up),
+    SignalType.RSI_CROSS_70_DOWN: (IndicatorType.RSI, _k_rsi_cross_70_down),
+    SignalType.RSI_TURN_UP: (IndicatorType.RSI, _k_rsi_turn_up),
+    SignalType.RSI_TURN_DOWN: (IndicatorType.RSI, _k_rsi_turn_down),
+    SignalType.MACD_GOLDEN_CROSS: (IndicatorType.MACD, _k_macd_golden_cross),
+    SignalType.MACD_DEAD_CROSS: (IndicatorType.MACD, _k_macd_dead_cross),
+    SignalType.MACD_ABOVE_ZERO: (IndicatorType.MACD, _k_macd_above_zero),
+    SignalType.MACD_BELOW_ZERO: (IndicatorType.MACD, _k_macd_below_zero),
+    SignalType.MACD_LOW_GOLDEN: (IndicatorType.MACD, _k_macd_low_golden),
+    SignalType.MACD_BULLISH_ARRANGE: (IndicatorType.MACD, _k_macd_bullish_arrange),
+    SignalType.MACD_BEARISH_ARRANGE: (IndicatorType.MACD, _k_macd_bearish_arrange),
+    SignalType.CANDLE_BAREFOOT_BULLISH: (IndicatorType.CANDLE, _k_candle_barefoot_bullish),
+    SignalType.CANDLE_BALD_BULLISH: (IndicatorType.CANDLE, _k_candle_bald_bullish),
+    SignalType.CANDLE_BAREFOOT_BEARISH: (IndicatorType.CANDLE, _k_candle_barefoot_bearish),
+    SignalType.CANDLE_BALD_BEARISH: (IndicatorType.CANDLE, _k_candle_bald_bearish),
+    SignalType.CANDLE_DOJI: (IndicatorType.CANDLE, _k_candle_doji),
+    SignalType.CANDLE_BIG_YANG: (IndicatorType.CANDLE, _k_candle_big_yang),
+    SignalType.CANDLE_BIG_YIN: (IndicatorType.CANDLE, _k_candle_big_yin),
+    SignalType.CANDLE_LONG_UPPER_SHADOW: (IndicatorType.CANDLE, _k_candle_long_upper_shadow),
+    SignalType.CANDLE_SHOOTING_STAR: (IndicatorType.CANDLE, _k_candle_long_upper_shadow),
+    SignalType.CANDLE_BULLISH_ENGULFING: (IndicatorType.CANDLE, _k_candle_bullish_engulfing),
+    SignalType.CANDLE_BEARISH_ENGULFING: (IndicatorType.CANDLE, _k_candle_bearish_engulfing),
+    SignalType.CANDLE_MORNING_STAR: (IndicatorType.CANDLE, _k_candle_morning_star),
+    SignalType.CANDLE_EVENING_STAR: (IndicatorType.CANDLE, _k_candle_evening_star),
+    SignalType.CANDLE_THREE_RED_SOLDIERS: (IndicatorType.CANDLE, _k_candle_three_red_soldiers),
+    SignalType.CANDLE_FOUR_CROWS: (IndicatorType.CANDLE, _k_candle_four_crows),
+    SignalType.KDJ_GOLDEN_CROSS: (IndicatorType.KDJ, _k_kdj_golden_cross),
+    SignalType.KDJ_DEAD_CROSS: (IndicatorType.KDJ, _k_kdj_dead_cross),
+    SignalType.KDJ_OVERSOLD: (IndicatorType.KDJ, _k_kdj_oversold),
+    SignalType.KDJ_OVERBOUGHT: (IndicatorType.KDJ, _k_kdj_overbought),
+    SignalType.KDJ_LOW_GOLDEN: (IndicatorType.KDJ, _k_kdj_low_golden),
+    SignalType.KDJ_BULLISH_ARRANGE: (IndicatorType.KDJ, _k_kdj_bullish_arrange),
+    SignalType.KDJ_BEARISH_ARRANGE: (IndicatorType.KDJ, _k_kdj_bearish_arrange),
+    SignalType.KDJ_TURN_UP: (IndicatorType.KDJ, _k_kdj_turn_up),
+    SignalType.KDJ_TURN_DOWN: (IndicatorType.KDJ, _k_kdj_turn_down),
+    SignalType.BOLL_BREAK_UPPER: (IndicatorType.BOLL, _k_boll_break_upper),
+    SignalType.BOLL_BREAK_LOWER: (IndicatorType.BOLL, _k_boll_break_lower),
+    SignalType.BOLL_BREAK_MIDDLE: (IndicatorType.BOLL, _k_boll_break_middle),
+    SignalType.BOLL_BREAK_MIDDLE_DOWN: (IndicatorType.BOLL, _k_boll_break_middle_down),
+    SignalType.BOLL_BREAK_UPPER_DOWN: (IndicatorType.BOLL, _k_boll_break_upper_down),
+    # 与逐 Bar 版本保持一致：跌破下轨与 BOLL_BREAK_LOWER 判定相同
+    SignalType.BOLL_BREAK_LOWER_DOWN: (IndicatorType.BOLL, _k_boll_break_lower),
+    SignalType.BOLL_OPEN_EXPAND: (IndicatorType.BOLL, _k_boll_open_expand),
+    SignalType.BOLL_OPEN_SHRINK: (IndicatorType.BOLL, _k_boll_open_shrink),
+    SignalType.BBI_PRICE_CROSS_UP: (IndicatorType.BBI, _k_bbi_price_cross_up),
+    SignalType.BBI_PRICE_CROSS_DOWN: (IndicatorType.BBI, _k_bbi_price_cross_down),
+    SignalType.CCI_BELOW_NEG100: (IndicatorType.CCI, _k_cci_below_neg100),
+    SignalType.CCI_ABOVE_100: (IndicatorType.CCI, _k_cci_above_100),
+    SignalType.MA_GOLDEN_CROSS: (IndicatorType.MA, _ma_cross_kernel(5, 10, golden=True)),
+    SignalType.MA_MA5_CROSS_MA10: (IndicatorType.MA, _ma_cross_kernel(5, 10, golden=True)),
+    SignalType.MA_DEAD_CROSS: (IndicatorType.MA, _ma_cross_kernel(5, 10, golden=False)),
+    SignalType.MA_MA5_DEAD_CROSS_MA10: (IndicatorType.MA, _ma_cross_kernel(5, 10, golden=False)),
+    SignalType.MA_MA5_CROSS_MA20: (IndicatorType.MA, _ma_cross_kernel(5, 20, golden=True)),
+    SignalType.MA_MA5_DEAD_CROSS_MA20: (IndicatorType.MA, _ma_cross_kernel(5, 20, golden=False)),
+    SignalType.MA_MA5_CROSS_MA30: (IndicatorType.MA, _ma_cross_kernel(5, 30, golden=True)),
+    SignalType.MA_MA5_DEAD_CROSS_MA30: (IndicatorType.MA, _ma_cross_kernel(5, 30, golden=False)),
+    SignalType.MA_MA3_CROSS_MA15: (IndicatorType.MA, _ma_cross_kernel(3, 15, golden=True)),
+    SignalType.MA_MA3_DEAD_CROSS_MA15: (IndicatorType.MA, _ma_cross_kernel(3, 15, golden=False)),
+    SignalType.MA_PRICE_ABOVE_MA5: (IndicatorType.MA, _ma_price_kernel(5, above=True)),
+    SignalType.MA_PRICE_ABOVE_MA10: (IndicatorType.MA, _ma_price_kernel(10, above=True)),
+    SignalType.MA_PRICE_ABOVE_MA20: (IndicatorType.MA, _ma_price_kernel(20, above=True)),
+    SignalType.MA_PRICE_ABOVE_MA30: (IndicatorType.MA, _ma_price_kernel(30, above=True)),
+    SignalType.MA_PRICE_ABOVE_MA60: (IndicatorType.MA, _ma_price_kernel(60, above=True)),
+    SignalType.MA_PRICE_BELOW_MA5: (IndicatorType.MA, _ma_price_kernel(5, above=False)),
+    SignalType.MA_PRICE_BELOW_MA10: (IndicatorType.MA, _ma_price_kernel(10, above=False)),
+    SignalType.MA_PRICE_BELOW_MA20: (IndicatorType.MA, _ma_price_kernel(20, above=False)),
+    SignalType.MA_PRICE_BELOW_MA30: (IndicatorType.MA, _ma_price_kernel(30, above=False)),
+    SignalType.MA_PRICE_BELOW_MA60: (IndicatorType.MA, _ma_price_kernel(60, above=False)),
+    SignalType.MA_BULLISH_ARRANGE_5_10_20: (IndicatorType.MA, _ma_arrange_kernel(bullish=True)),
+    SignalType.MA_BEARISH_ARRANGE_5_10_20: (IndicatorType.MA, _ma_arrange_kernel(bullish=False)),
+}
+
+
+def _fixed_columns(*columns: str) -> ColumnResolver:
+    return lambda cond: columns
+
+
+# SignalType -> 根据条件参数解析该信号所需的指标列（K 线原始 OHLC 列不在此列出），供 compute_indicators 按需计算
+SIGNAL_COLUMNS: Dict[SignalType, ColumnResolver] = {
+    SignalType.RSI_OVERSOLD: _rsi_columns,
+    SignalType.RSI_OVERBOUGHT: _rsi_columns,
+    SignalType.RSI_GOLDEN_CROSS: _rsi_pair_columns,
+    SignalType.RSI_DEAD_CROSS: _rsi_pair_columns,
+    SignalType.RSI_LOW_GOLDEN: _rsi_pair_columns,
+    SignalType.RSI_CROSS_30_UP: _rsi_columns,
+    SignalType.RSI_CROSS_70_DOWN: _rsi_columns,
+    SignalType.RSI_TURN_UP: _rsi_columns,
+    SignalType.RSI_TURN_DOWN: _rsi_columns,
+    **{sig: _macd_columns for sig, (ind, _) in SIGNAL_KERNELS.items() if ind == IndicatorType.MACD},
+    **{sig: _fixed_columns() for sig, (ind, _) in SIGNAL_KERNELS.items() if ind == IndicatorType.CANDLE},
+    **{sig: _kdj_columns for sig, (ind, _) in SIGNAL_KERNELS.items() if ind == IndicatorType.KDJ},
+    **{sig: _boll_columns for sig, (ind, _) in SIGNAL_KERNELS.items() if ind == IndicatorType.BOLL},
+    SignalType.BBI_PRICE_CROSS_UP: _fixed_columns("bbi"),
+    SignalType.BBI_PRICE_CROSS_DOWN: _fixed_columns("bbi"),
+    SignalType.CCI_BELOW_NEG100: _cci_columns,
+    SignalType.CCI_ABOVE_100: _cci_columns,
+    SignalType.MA_GOLDEN_CROSS: _ma_cross_columns(5, 10),
+    SignalType.MA_DEAD_CROSS: _ma_cross_columns(5, 10),
+    SignalType.MA_MA5_CROSS_MA10: _ma_cross_columns(5, 10),
+    SignalType.MA_MA5_DEAD_CROSS_MA10: _ma_cross_columns(5, 10),
+    SignalType.MA_MA5_CROSS_MA20: _ma_cross_columns(5, 20),
+    SignalType.MA_MA5_DEAD_CROSS_MA20: _ma_cross_columns(5, 20),
+    SignalType.MA_MA5_CROSS_MA30: _ma_cross_columns(5, 30),
+    SignalType.MA_MA5_DEAD_CROSS_MA30: _ma_cross_columns(5, 30),
+    SignalType.MA_MA3_CROSS_MA15: _ma_cross_columns(3, 15),
+    SignalType.MA_MA3_DEAD_CROSS_MA15: _ma_cross_columns(3, 15),
+    SignalType.MA_PRICE_ABOVE_MA5: _ma_price_columns(5),
+    SignalType.MA_PRICE_ABOVE_MA10: _ma_price_columns(10),
+    SignalType.MA_PRICE_ABOVE_MA20: _ma_price_columns(20),
+    SignalType.MA_PRICE_ABOVE_MA30: _ma_price_columns(30),
+    SignalType.MA_PRICE_ABOVE_MA60: _ma_price_columns(60),
+    SignalType.MA_PRICE_BELOW_MA5: _ma_price_columns(5),
+    SignalType.MA_PRICE_BELOW_MA10: _ma_price_columns(10),
+    SignalType.MA_PRICE_BELOW_MA20: _ma_price_columns(20),
+    SignalType.MA_PRICE_BELOW_MA30: _ma_price_columns(30),
+    SignalType.MA_PRICE_BELOW_MA60: _ma_price_columns(60),
+    SignalType.MA_BULLISH_ARRANGE_5_10_20: _fixed_columns("ma5", "ma10", "ma20"),
+    SignalType.MA_BEARISH_ARRANGE_5_10_20: _fixed_columns("ma5", "ma10", "ma20"),
+}
+
+
+def signal_columns(signal_type: SignalType, cond: Condition) -> Tuple[str, ...]:
+    """条件所需的指标列；参数非法（无法转成数字）时返回空元组，由信号计算阶段按缺列处理"""
+    resolver = SIGNAL_COLUMNS.get(signal_type)
+    if resolver is None:
+        return ()
     try:
-        # RSI 指标体系
-        if indicator_type == IndicatorType.RSI:
-            rsi_col = "rsi" if "rsi" in df.columns else "rsi14"
-            rsi_val = float(df[rsi_col].iloc[idx]) if rsi_col in df.columns else 50.0
-
-            if signal_type == SignalType.RSI_OVERSOLD:
-                threshold = float(cond.get("params", {}).get("threshold") or cond.get("threshold", 30))
-                return rsi_val < threshold
-
-            if signal_type == SignalType.RSI_OVERBOUGHT:
-                threshold = float(cond.get("params", {}).get("threshold") or cond.get("threshold", 70))
-                return rsi_val > threshold
-
-            if signal_type == SignalType.RSI_GOLDEN_CROSS:
-                if idx == 0 or "rsi6" not in df.columns or "rsi12" not in df.columns:
-                    return False
-                prev_6 = float(df["rsi6"].iloc[idx - 1])
-                prev_12 = float(df["rsi12"].iloc[idx - 1])
-                curr_6 = float(df["rsi6"].iloc[idx])
-                curr_12 = float(df["rsi12"].iloc[idx])
-                return prev_6 <= prev_12 and curr_6 > curr_12
-
-            if signal_type == SignalType.RSI_DEAD_CROSS:
-                if idx == 0 or "rsi6" not in df.columns or "rsi12" not in df.columns:
-                    return False
-                prev_6 = float(df["rsi6"].iloc[idx - 1])
-                prev_12 = float(df["rsi12"].iloc[idx - 1])
-                curr_6 = float(df["rsi6"].iloc[idx])
-                curr_12 = float(df["rsi12"].iloc[idx])
-                return prev_6 >= prev_12 and curr_6 < curr_12
-
-            if signal_type == SignalType.RSI_LOW_GOLDEN:
-                if idx == 0 or "rsi6" not in df.columns or "rsi12" not in df.columns:
-                    return False
-                curr_6 = float(df["rsi6"].iloc[idx])
-                curr_12 = float(df["rsi12"].iloc[idx])
-                prev_6 = float(df["rsi6"].iloc[idx - 1])
-                prev_12 = float(df["rsi12"].iloc[idx - 1])
-                return curr_6 < 40 and prev_6 <= prev_12 and curr_6 > curr_12
-
-            if signal_type == SignalType.RSI_CROSS_30_UP:
-                if idx == 0:
-                    return False
-                prev_rsi = float(df[rsi_col].iloc[idx - 1])
-                return prev_rsi <= 30.0 and rsi_val > 30.0
-
-            if signal_type == SignalType.RSI_CROSS_70_DOWN:
-                if idx == 0:
-                    return False
-                prev_rsi = float(df[rsi_col].iloc[idx - 1])
-                return prev_rsi >= 70.0 and rsi_val < 70.0
-
-            if signal_type == SignalType.RSI_TURN_UP:
-                if idx < 2:
-                    return False
-                r0 = float(df[rsi_col].iloc[idx])
-                r1 = float(df[rsi_col].iloc[idx - 1])
-                r2 = float(df[rsi_col].iloc[idx - 2])
-                return r0 > r1 and r1 <= r2
-
-            if signal_type == SignalType.RSI_TURN_DOWN:
-                if idx < 2:
-                    return False
-                r0 = float(df[rsi_col].iloc[idx])
-                r1 = float(df[rsi_col].iloc[idx - 1])
-                r2 = float(df[rsi_col].iloc[idx - 2])
-                return r0 < r1 and r1 >= r2
-
-        # MACD 指标体系
-        if indicator_type == IndicatorType.MACD:
-            macd = df["macd"]
-            signal = df["macd_signal"]
-            hist = df["macd_hist"] if "macd_hist" in df.columns else (macd - signal)
-
-            if signal_type == SignalType.MACD_GOLDEN_CROSS:
-                if idx == 0:
-                    return False
-                prev_diff = macd.iloc[idx - 1] - signal.iloc[idx - 1]
-                curr_diff = macd.iloc[idx] - signal.iloc[idx]
-                return prev_diff <= 0 and curr_diff > 0
-
-            if signal_type == SignalType.MACD_DEAD_CROSS:
-                if idx == 0:
-                    return False
-                prev_diff = macd.iloc[idx - 1] - signal.iloc[idx - 1]
-                curr_diff = macd.iloc[idx] - signal.iloc[idx]
-                return prev_diff >= 0 and curr_diff < 0
-
-            if signal_type == SignalType.MACD_ABOVE_ZERO:
-                return float(macd.iloc[idx]) > 0
-
-            if signal_type == SignalType.MACD_BELOW_ZERO:
-                return float(macd.iloc[idx]) < 0
-
-            if signal_type == SignalType.MACD_LOW_GOLDEN:
-                if idx == 0:
-                    return False
-                prev_diff = macd.iloc[idx - 1] - signal.iloc[idx - 1]
-                curr_diff = macd.iloc[idx] - signal.iloc[idx]
-                return float(macd.iloc[idx]) < 0 and prev_diff <= 0 and curr_diff > 0
-
-            if signal_type == SignalType.MACD_BULLISH_ARRANGE:
-                return float(macd.iloc[idx]) > float(signal.iloc[idx]) and float(hist.iloc[idx]) > 0
-
-            if signal_type == SignalType.MACD_BEARISH_ARRANGE:
-                return float(macd.iloc[idx]) < float(signal.iloc[idx]) and float(hist.iloc[idx]) < 0
-
-        # K线形态 (CANDLE)
-        if indicator_type == IndicatorType.CANDLE:
-            open_price = float(df["open"].iloc[idx])
-            close_price = float(df["close"].iloc[idx])
-            high_price = float(df["high"].iloc[idx])
-            low_price = float(df["low"].iloc[idx])
-            bar_range = max(high_price - low_price, 1e-6)
-            body = abs(close_price - open_price)
-            
-            # 光脚阳线 (开盘即低点，无下影线)
-            if signal_type == SignalType.CANDLE_BAREFOOT_BULLISH:
-                is_bullish = close_price > open_price
-                lower_shadow = open_price - low_price
-                return is_bullish and (lower_shadow / bar_range < 0.08)
-
-            # 光头阳线 (收盘即高点，无上影线)
-            if signal_type == SignalType.CANDLE_BALD_BULLISH:
-                is_bullish = close_price > open_price
-                upper_shadow = high_price - close_price
-                return is_bullish and (upper_shadow / bar_range < 0.08)
-
-            # 光脚阴线 (收盘即低点，无下影线)
-            if signal_type == SignalType.CANDLE_BAREFOOT_BEARISH:
-                is_bearish = close_price < open_price
-                lower_shadow = close_price - low_price
-                return is_bearish and (lower_shadow / bar_range < 0.08)
-
-            # 光头阴线 (开盘即高点，无上影线)
-            if signal_type == SignalType.CANDLE_BALD_BEARISH:
-                is_bearish = close_price < open_price
-                upper_shadow = high_price - open_price
-                return is_bearish and (upper_shadow / bar_range < 0.08)
-
-            # 十字星
-            if signal_type == SignalType.CANDLE_DOJI:
-                return body / bar_range < 0.1
-
-            # 大阳线
-            if signal_type == SignalType.CANDLE_BIG_YANG:
-                return close_price > open_price and (body / bar_range > 0.65)
-
-            # 大阴线
-            if signal_type == SignalType.CANDLE_BIG_YIN:
-                return open_price > close_price and (body / bar_range > 0.65)
-
-            # 长上影线 / 射击之星
-            if signal_type in (SignalType.CANDLE_LONG_UPPER_SHADOW, SignalType.CANDLE_SHOOTING_STAR):
-                upper_shadow = high_price - max(open_price, close_price)
-                return upper_shadow > max(body * 2.0, bar_range * 0.5)
-
-            # 看涨吞没
-            if signal_type == SignalType.CANDLE_BULLISH_ENGULFING:
-                if idx == 0:
-                    return False
-                prev_open = float(df["open"].iloc[idx - 1])
-                prev_close = float(df["close"].iloc[idx - 1])
-                is_prev_bearish = prev_close < prev_open
-                is_curr_bullish = close_price > open_price
-                engulfing = close_price >= prev_open and open_price <= prev_close
-                return is_prev_bearish and is_curr_bullish and engulfing
-
-            # 看跌吞没
-            if signal_type == SignalType.CANDLE_BEARISH_ENGULFING:
-                if idx == 0:
-                    return False
-                prev_open = float(df["open"].iloc[idx - 1])
-                prev_close = float(df["close"].iloc[idx - 1])
-                is_prev_bullish = prev_close > prev_open
-                is_curr_bearish = close_price < open_price
-                engulfing = close_price <= prev_open and open_price >= prev_close
-                return is_prev_bullish and is_curr_bearish and engulfing
-
-            # 早晨之星
-            if signal_type == SignalType.CANDLE_MORNING_STAR:
-                if idx < 2:
-                    return False
-                o1, c1 = float(df["open"].iloc[idx-2]), float(df["close"].iloc[idx-2])
-                o2, c2 = float(df["open"].iloc[idx-1]), float(df["close"].iloc[idx-1])
-                o3, c3 = float(df["open"].iloc[idx]), float(df["close"].iloc[idx])
-                return (c1 < o1) and (abs(c2 - o2) < abs(c1 - o1) * 0.4) and (c3 > o3 and c3 > (o1 + c1) / 2)
-
-            # 黄昏之星
-            if signal_type == SignalType.CANDLE_EVENING_STAR:
-                if idx < 2:
-                    return False
-                o1, c1 = float(df["open"].iloc[idx-2]), float(df["close"].iloc[idx-2])
-                o2, c2 = float(df["open"].iloc[idx-1]), float(df["close"].iloc[idx-1])
-                o3, c3 = float(df["open"].iloc[idx]), float(df["close"].iloc[idx])
-                return (c1 > o1) and (abs(c2 - o2) < abs(c1 - o1) * 0.4) and (c3 < o3 and c3 < (o1 + c1) / 2)
-
-            # 红三兵
-            if signal_type == SignalType.CANDLE_THREE_RED_SOLDIERS:
-                if idx < 2:
-                    return False
-                c1, o1 = float(df["close"].iloc[idx-2]), float(df["open"].iloc[idx-2])
-                c2, o2 = float(df["close"].iloc[idx-1]), float(df["open"].iloc[idx-1])
-                c3, o3 = float(df["close"].iloc[idx]), float(df["open"].iloc[idx])
-                return (c1 > o1) and (c2 > o2 and c2 > c1) and (c3 > o3 and c3 > c2)
-
-            # 连续阴线 (四只乌鸦 / 三只乌鸦)
-            if signal_type == SignalType.CANDLE_FOUR_CROWS:
-                if idx < 2:
-                    return False
-                c1, o1 = float(df["close"].iloc[idx-2]), float(df["open"].iloc[idx-2])
-                c2, o2 = float(df["close"].iloc[idx-1]), float(df["open"].iloc[idx-1])
-                c3, o3 = float(df["close"].iloc[idx]), float(df["open"].iloc[idx])
-                return (c1 < o1) and (c2 < o2 and c2 < c1) and (c3 < o3 and c3 < c2)
-
-        # KDJ 指标体系
-        if indicator_type == IndicatorType.KDJ:
-            k = float(df["kdj_k"].iloc[idx])
-            d = float(df["kdj_d"].iloc[idx])
-            j = float(df["kdj_j"].iloc[idx])
-            
-            if signal_type == SignalType.KDJ_GOLDEN_CROSS:
-                if idx == 0:
-                    return False
-                prev_k = float(df["kdj_k"].iloc[idx - 1])
-                prev_d = float(df["kdj_d"].iloc[idx - 1])
-                return prev_k <= prev_d and k > d
-            
-            if signal_type == SignalType.KDJ_DEAD_CROSS:
-                if idx == 0:
-                    return False
-                prev_k = float(df["kdj_k"].iloc[idx - 1])
-                prev_d = float(df["kdj_d"].iloc[idx - 1])
-                return prev_k >= prev_d and k < d
-            
-            if signal_type == SignalType.KDJ_OVERSOLD:
-                threshold = float(cond.get("params", {}).get("threshold", 20))
-                return j < threshold or k < threshold
-            
-            if signal_type == SignalType.KDJ_OVERBOUGHT:
-                threshold = float(cond.get("params", {}).get("threshold", 80))
-                return j > threshold or k > threshold
-
-            if signal_type == SignalType.KDJ_LOW_GOLDEN:
-                if idx == 0:
-                    return False
-                prev_k = float(df["kdj_k"].iloc[idx - 1])
-                prev_d = float(df["kdj_d"].iloc[idx - 1])
-                return k < 35 and prev_k <= prev_d and k > d
-
-            if signal_type == SignalType.KDJ_BULLISH_ARRANGE:
-                return k > d and j > k
-
-            if signal_type == SignalType.KDJ_BEARISH_ARRANGE:
-                return k < d and j < k
-
-            if signal_type == SignalType.KDJ_TURN_UP:
-                if idx < 2:
-                    return False
-                j0 = float(df["kdj_j"].iloc[idx])
-                j1 = float(df["kdj_j"].iloc[idx - 1])
-                j2 = float(df["kdj_j"].iloc[idx - 2])
-                return j0 > j1 and j1 <= j2
-
-            if signal_type == SignalType.KDJ_TURN_DOWN:
-                if idx < 2:
-                    return False
-                j0 = float(df["kdj_j"].iloc[idx])
-                j1 = float(df["kdj_j"].iloc[idx - 1])
-                j2 = float(df["kdj_j"].iloc[idx - 2])
-                return j0 < j1 and j1 >= j2
-
-        # 布林带 (BOLL)
-        if indicator_type == IndicatorType.BOLL:
-            close = float(df["close"].iloc[idx])
-            upper = float(df["boll_upper"].iloc[idx])
-            middle = float(df["boll_middle"].iloc[idx])
-            lower = float(df["boll_lower"].iloc[idx])
-            width = float(df["boll_width"].iloc[idx]) if "boll_width" in df.columns else (upper - lower) / middle
-            
-            if signal_type == SignalType.BOLL_BREAK_UPPER:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_upper = float(df["boll_upper"].iloc[idx - 1])
-                return prev_close <= prev_upper and close > upper
-            
-            if signal_type == SignalType.BOLL_BREAK_LOWER:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_lower = float(df["boll_lower"].iloc[idx - 1])
-                return prev_close >= prev_lower and close < lower
-
-            if signal_type == SignalType.BOLL_BREAK_MIDDLE:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_middle = float(df["boll_middle"].iloc[idx - 1])
-                return prev_close <= prev_middle and close > middle
-
-            if signal_type == SignalType.BOLL_BREAK_MIDDLE_DOWN:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_middle = float(df["boll_middle"].iloc[idx - 1])
-                return prev_close >= prev_middle and close < middle
-
-            if signal_type == SignalType.BOLL_BREAK_UPPER_DOWN:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_upper = float(df["boll_upper"].iloc[idx - 1])
-                return prev_close >= prev_upper and close < upper
-
-            if signal_type == SignalType.BOLL_BREAK_LOWER_DOWN:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_lower = float(df["boll_lower"].iloc[idx - 1])
-                return prev_close >= prev_lower and close < lower
-
-            if signal_type == SignalType.BOLL_OPEN_EXPAND:
-                if idx == 0 or "boll_width" not in df.columns:
-                    return False
-                prev_w = float(df["boll_width"].iloc[idx - 1])
-                return width > prev_w * 1.05
-
-            if signal_type == SignalType.BOLL_OPEN_SHRINK:
-                if idx == 0 or "boll_width" not in df.columns:
-                    return False
-                prev_w = float(df["boll_width"].iloc[idx - 1])
-                return width < prev_w * 0.95
-
-        # BBI 多空指标
-        if indicator_type == IndicatorType.BBI:
-            close = float(df["close"].iloc[idx])
-            bbi = float(df["bbi"].iloc[idx])
-            
-            if signal_type == SignalType.BBI_PRICE_CROSS_UP:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_bbi = float(df["bbi"].iloc[idx - 1])
-                return prev_close <= prev_bbi and close > bbi
-            
-            if signal_type == SignalType.BBI_PRICE_CROSS_DOWN:
-                if idx == 0:
-                    return False
-                prev_close = float(df["close"].iloc[idx - 1])
-                prev_bbi = float(df["bbi"].iloc[idx - 1])
-                return prev_close >= prev_bbi and close < bbi
-
-        # CCI 顺势指标
-        if indicator_type == IndicatorType.CCI:
-            cci = float(df["cci"].iloc[idx])
-            
-            if signal_type == SignalType.CCI_BELOW_NEG100:
-                return cci < -100.0
-            
-            if signal_type == SignalType.CCI_ABOVE_100:
-                return cci > 100.0
-
-        # 均线系统 (MA)
-        if indicator_type == IndicatorType.MA:
-            close = float(df["close"].iloc[idx])
-            
-            # 通用均线金叉 / 死叉（默认 MA5 上穿/下穿 MA10 或 MA20）
-            if signal_type in (SignalType.MA_GOLDEN_CROSS, SignalType.MA_MA5_CROSS_MA10):
-                if idx == 0 or "ma5" not in df.columns or "ma10" not in df.columns:
-                    return False
-                p5, p10 = float(df["ma5"].iloc[idx - 1]), float(df["ma10"].iloc[idx - 1])
-                c5, c10 = float(df["ma5"].iloc[idx]), float(df["ma10"].iloc[idx])
-                return p5 <= p10 and c5 > c10
-
-            if signal_type in (SignalType.MA_DEAD_CROSS, SignalType.MA_MA5_DEAD_CROSS_MA10):
-                if idx == 0 or "ma5" not in df.columns or "ma10" not in df.columns:
-                    return False
-                p5, p10 = float(df["ma5"].iloc[idx - 1]), float(df["ma10"].iloc[idx - 1])
-                c5, c10 = float(df["ma5"].iloc[idx]), float(df["ma10"].iloc[idx])
-                return p5 >= p10 and c5 < c10
-
-            if signal_type == SignalType.MA_MA5_CROSS_MA20:
-                if idx == 0 or "ma5" not in df.columns or "ma20" not in df.columns:
-                    return False
-                p5, p20 = float(df["ma5"].iloc[idx - 1]), float(df["ma20"].iloc[idx - 1])
-                c5, c20 = float(df["ma5"].iloc[idx]), float(df["ma20"].iloc[idx])
-                return p5 <= p20 and c5 > c20
-
-            if signal_type == SignalType.MA_MA5_DEAD_CROSS_MA20:
-                if idx == 0 or "ma5" not in df.columns or "ma20" not in df.columns:
-                    return False
-                p5, p20 = float(df["ma5"].iloc[idx - 1]), float(df["ma20"].iloc[idx - 1])
-                c5, c20 = float(df["ma5"].iloc[idx]), float(df["ma20"].iloc[idx])
-                return p5 >= p20 and c5 < c20
-
-            if signal_type == SignalType.MA_MA5_CROSS_MA30:
-                if idx == 0 or "ma5" not in df.columns or "ma30" not in df.columns:
-                    return False
-                p5, p30 = float(df["ma5"].iloc[idx - 1]), float(df["ma30"].iloc[idx - 1])
-                c5, c30 = float(df["ma5"].iloc[idx]), float(df["ma30"].iloc[idx])
-                return p5 <= p30 and c5 > c30
-
-            if signal_type == SignalType.MA_MA5_DEAD_CROSS_MA30:
-                if idx == 0 or "ma5" not in df.columns or "ma30" not in df.columns:
-                    return False
-                p5, p30 = float(df["ma5"].iloc[idx - 1]), float(df["ma30"].iloc[idx - 1])
-                c5, c30 = float(df["ma5"].iloc[idx]), float(df["ma30"].iloc[idx])
-                return p5 >= p30 and c5 < c30
-
-            if signal_type == SignalType.MA_MA3_CROSS_MA15:
-                if idx == 0 or "ma3" not in df.columns or "ma15" not in df.columns:
-                    return False
-                p3, p15 = float(df["ma3"].iloc[idx - 1]), float(df["ma15"].iloc[idx - 1])
-                c3, c15 = float(df["ma3"].iloc[idx]), float(df["ma15"].iloc[idx])
-                return p3 <= p15 and c3 > c15
-
-            if signal_type == SignalType.MA_MA3_DEAD_CROSS_MA15:
-                if idx == 0 or "ma3" not in df.columns or "ma15" not in df.columns:
-                    return False
-                p3, p15 = float(df["ma3"].iloc[idx - 1]), float(df["ma15"].iloc[idx - 1])
-                c3, c15 = float(df["ma3"].iloc[idx]), float(df["ma15"].iloc[idx])
-                return p3 >= p15 and c3 < c15
-
-            # 价格突破均线
-            if signal_type == SignalType.MA_PRICE_ABOVE_MA5 and "ma5" in df.columns:
-                return close > float(df["ma5"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_ABOVE_MA10 and "ma10" in df.columns:
-                return close > float(df["ma10"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_ABOVE_MA20 and "ma20" in df.columns:
-                return close > float(df["ma20"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_ABOVE_MA30 and "ma30" in df.columns:
-                return close > float(df["ma30"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_ABOVE_MA60 and "ma60" in df.columns:
-                return close > float(df["ma60"].iloc[idx])
-            
-            if signal_type == SignalType.MA_PRICE_BELOW_MA5 and "ma5" in df.columns:
-                return close < float(df["ma5"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_BELOW_MA10 and "ma10" in df.columns:
-                return close < float(df["ma10"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_BELOW_MA20 and "ma20" in df.columns:
-                return close < float(df["ma20"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_BELOW_MA30 and "ma30" in df.columns:
-                return close < float(df["ma30"].iloc[idx])
-            if signal_type == SignalType.MA_PRICE_BELOW_MA60 and "ma60" in df.columns:
-                return close < float(df["ma60"].iloc[idx])
-            
-            # 多头/空头排列
-            if signal_type == SignalType.MA_BULLISH_ARRANGE_5_10_20 and "ma5" in df.columns and "ma10" in df.columns and "ma20" in df.columns:
-                ma5 = float(df["ma5"].iloc[idx])
-                ma10 = float(df["ma10"].iloc[idx])
-                ma20 = float(df["ma20"].iloc[idx])
-                return ma5 > ma10 > ma20
-            
-            if signal_type == SignalType.MA_BEARISH_ARRANGE_5_10_20 and "ma5" in df.columns and "ma10" in df.columns and "ma20" in df.columns:
-                ma5 = float(df["ma5"].iloc[idx])
-                ma10 = float(df["ma10"].iloc[idx])
-                ma20 = float(df["ma20"].iloc[idx])
-                return ma5 < ma10 < ma20
-
-    except (KeyError, IndexError, ValueError):
-        return False
+        return resolver(cond)
+    except (TypeError, ValueError):
+        return ()
 
-    return False
 
+def evaluate_condition_series(cond: Condition, df: pd.DataFrame) -> np.ndarray:
+    """对整段 K 线一次性计算单个条件，返回与 df 等长的布尔数组（条件带 timeframe 时在大周期上计算）"""
+    resolved = _resolve_condition(cond)
+    if resolved is None:
+        return _false(df)
+    indicator_type, signal_type = resolved
 
+    entry = SIGNAL_KERNELS.get(signal_type)
+    if entry is None or entry[0] != indicator_type:
+        return _false(df)
+    return CompiledCondition(indicator_type, signal_type, entry[1], cond, condition_timeframe(cond)).series(df)
 
-import json
 
+def _run_kernel(kernel: SignalKernel, df: pd.DataFrame, cond: Condition) -> np.ndarray:
+    try:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.asarray(kernel(df, cond), dtype=bool)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return _false(df)
 
-def align_multi_timeframe_indicators(
-    df_base: pd.DataFrame, df_higher: pd.DataFrame, higher_tf: str
-) -> pd.DataFrame:
-    """将大周期 K 线计算的指标前向填充对齐到小周期主 DataFrame 中，避免未来函数"""
-    if df_higher is None or df_higher.empty or df_base is None or df_base.empty:
-        return df_base
 
+def _higher_frame(df: pd.DataFrame, timeframe: str, signal_type: SignalType, cond: Condition) -> Optional[pd.DataFrame]:
+    """条件所在周期的大周期 K 线（由 df 重采样并缓存，已按需计算指标）；无法重采样时返回 None"""
     from app.services.backtest_engine import compute_indicators
-    df_h_ind = compute_indicators(df_higher.copy())
-    suffix = f"_{higher_tf.upper()}"
+    from app.services.multi_timeframe import TIMEFRAME_DELTAS, higher_timeframe_cache
+
+    if timeframe not in TIMEFRAME_DELTAS or df.empty or "ts" not in df.columns:
+        return None
+    higher = higher_timeframe_cache.get(df, timeframe)
+    if higher is None or higher.empty:
+        return None
+    compute_indicators(higher, required=signal_columns(signal_type, cond))
+    return higher
+
 
+def _on_higher_close(signal: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """大周期信号映射回基础周期：只在大周期 Bar 收盘后首次可见的那根基础 K 线上取该 Bar 的信号"""
+    first = (rows >= 0) & (rows != np.r_[-1, rows[:-1]])
+    result = np.zeros(len(rows), dtype=bool)
+    result[first] = signal[rows[first]]
+    return result
+
+
+
+import json
 
+
+def merge_higher_timeframe(
+    df_base: pd.DataFrame, df_higher: pd.DataFrame, higher_tf: str
+) -> pd.DataFrame:
+    """将已算好指标的大周期 DataFrame 按时间向后匹配合并到小周期主 DataFrame，大周期列名加 _{higher_tf} 后缀"""
     # 保留 ts 字段，将其余指标列添加后缀
-    rename_map = {col: f"{col}{suffix}" for col in df_h_ind.columns if col != "ts"}
-    df_h_ind = df_h_ind.rename(columns=rename_map)
+    rename_map = {col: timeframe_column(col, higher_tf) for col in df_higher.columns if col != "ts"}
+    df_h_ind = df_higher.rename(columns=rename_map)
 
     # 转换 ts 为 datetime 并排序
     df_base = df_base.copy()
@@ -695,6 +937,18 @@ def align_multi_timeframe_indicators(
     return merged
 
 
+def align_multi_timeframe_indicators(
+    df_base: pd.DataFrame, df_higher: pd.DataFrame, higher_tf: str
+) -> pd.DataFrame:
+    """将大周期 K 线计算的指标前向填充对齐到小周期主 DataFrame 中，避免未来函数"""
+    if df_higher is None or df_higher.empty or df_base is None or df_base.empty:
+        return df_base
+
+    from app.services.backtest_engine import compute_indicators
+    df_h_ind = compute_indicators(df_higher.copy())
+    return merge_higher_timeframe(df_base, df_h_ind, higher_tf.upper())
+
+
 def normalize_rule_set(rule_set: Any) -> dict:
     """规范化策略规则 JSON，兼容做多/做空/平多/平空与老版 buy_groups/sell_groups"""
     if isinstance(rule_set, str):
@@ -740,68 +994,247 @@ def normalize_rule_set(rule_set: Any) -> dict:
     }
 
 
-def evaluate_group(group: ConditionGroup, df: pd.DataFrame, idx: int, target_side: Side) -> bool:
+def _group_logic(group: ConditionGroup) -> LogicOp:
     raw_logic = group.get("logic") or group.get("group_logic") or "AND"
     try:
-        logic = LogicOp(str(raw_logic).strip().upper())
+        return LogicOp(str(raw_logic).strip().upper())
     except Exception:
-        logic = LogicOp.AND
+        return LogicOp.AND
 
-    results: List[bool] = []
-    conditions = group.get("conditions") or []
-    for cond in conditions:
-        results.append(evaluate_condition(cond, df, idx))
 
+def evaluate_group(group: ConditionGroup, df: pd.DataFrame, idx: int, target_side: Side) -> bool:
+    """单个条件组在第 idx 根 Bar 上的取值（经 CompiledRuleSet 求值）；target_side 仅为兼容老版调用保留"""
+    return compile_rule_set({"open_long_groups": [group]}).side_at("open_long", df, idx)
+
+
+def evaluate_group_series(group: ConditionGroup, df: pd.DataFrame) -> np.ndarray:
+    """整段序列版本的 evaluate_group：组内条件按 AND/OR 合并为一个布尔数组"""
+    logic = _group_logic(group)
+
+    results = [evaluate_condition_series(cond, df) for cond in group.get("conditions") or []]
     if not results:
-        return False
+        return _false(df)
 
     if logic == LogicOp.AND:
-        return all(results)
-    return any(results)
+        return np.logical_and.reduce(results)
+    return np.logical_or.reduce(results)
+
+
+@dataclass
+class RuleSetSignals:
+    """策略规则在整段 K 线上的信号数组，下标与 df 行号一一对应"""
+    open_long: np.ndarray
+    close_long: np.ndarray
+    open_short: np.ndarray
+    close_short: np.ndarray
+
+
+@dataclass(frozen=True)
+class CompiledCondition:
+    indicator_type: IndicatorType
+    signal_type: SignalType
+    kernel: SignalKernel
+    cond: Condition  # 原始条件（阈值等参数仍从中读取）
+    timeframe: Optional[str] = None  # 大周期条件的周期（如 "4H"），None 表示基础周期
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        """基础周期 df 上所需的指标列；大周期条件的指标在重采样出的大周期 K 线上计算，不占用基础周期的列"""
+        if self.timeframe is not None:
+            return ()
+        return signal_columns(self.signal_type, self.cond)
+
+    def series(self, df: pd.DataFrame) -> np.ndarray:
+        """整段序列求值，返回与 df 等长的布尔数组"""
+        if self.timeframe is None:
+            return _run_kernel(self.kernel, df, self.cond)
+        from app.services.multi_timeframe import higher_timeframe_rows
+
+        higher = _higher_frame(df, self.timeframe, self.signal_type, self.cond)
+        if higher is None:
+            return _false(df)
+        rows = higher_timeframe_rows(df, higher, self.timeframe)
+        return _on_higher_close(_run_kernel(self.kernel, higher, self.cond), rows)
+
+    def at(self, df: pd.DataFrame, idx: int) -> bool:
+        """第 idx 根 Bar 上的取值，只在尾部少量 Bar 上计算"""
+        if self.timeframe is None:
+            tail = df.iloc[max(0, idx - _TAIL_BARS + 1) : idx + 1]
+            return bool(_run_kernel(self.kernel, tail, self.cond)[-1])
+        from app.services.multi_timeframe import higher_timeframe_rows
+
+        higher = _higher_frame(df, self.timeframe, self.signal_type, self.cond)
+        if higher is None:
+            return False
+        rows = higher_timeframe_rows(df.iloc[max(0, idx - 1) : idx + 1], higher, self.timeframe)
+        bar = int(rows[-1])
+        if bar < 0 or (len(rows) > 1 and rows[0] == bar):
+            return False
+        tail = higher.iloc[max(0, bar - _TAIL_BARS + 1) : bar + 1]
+        return bool(_run_kernel(self.kernel, tail, self.cond)[-1])
+
+
+# 四个方向及其在规范化规则中的分组键
+RULE_SIDES: Tuple[Tuple[str, Side], ...] = (
+    ("open_long", Side.OPEN_LONG),
+    ("close_long", Side.CLOSE_LONG),
+    ("open_short", Side.OPEN_SHORT),
+    ("close_short", Side.CLOSE_SHORT),
+)
+
+# 无法识别的条件在分组中以 -1 占位，恒为 False
+_NEVER = -1
+
+# 单根 Bar 求值时截取的尾部窗口长度（信号计算最多回看前 2 根 Bar）
+_TAIL_BARS = 8
+
+
+def _condition_key(resolved: Tuple[IndicatorType, SignalType], cond: Condition) -> Tuple[Any, ...]:
+    params = json.dumps(cond.get("params"), sort_keys=True, default=str)
+    threshold = json.dumps(cond.get("threshold"), default=str)
+    return resolved[0], resolved[1], params, threshold, condition_timeframe(cond)
+
+
+class CompiledRuleSet:
+    """预编译的策略规则：一次完成规范化与枚举解析，并对四个方向中重复出现的条件去重"""
+
+    def __init__(self, rule_set: Any) -> None:
+        self.source = normalize_rule_set(rule_set)
+        self.conditions: List[CompiledCondition] = []
+        self.sides: Dict[str, List[Tuple[LogicOp, Tuple[int, ...]]]] = {}
+
+        index_by_key: Dict[Tuple[Any, ...], int] = {}
+        for side, _ in RULE_SIDES:
+            groups = self.source.get(f"{side}_groups") or []
+            compiled_groups: List[Tuple[LogicOp, Tuple[int, ...]]] = []
+            for group in groups:
+                indices: List[int] = []
+                for cond in group.get("conditions") or []:
+                    indices.append(self._register(cond, index_by_key))
+                compiled_groups.append((_group_logic(group), tuple(indices)))
+            self.sides[side] = compiled_groups
+
+    @property
+    def required_columns(self) -> List[str]:
+        """规则实际用到的指标列，传给 compute_indicators(required=...) 以跳过无关指标"""
+        columns: Dict[str, None] = {}
+        for c in self.conditions:
+            columns.update(dict.fromkeys(c.columns))
+        return list(columns)
+
+    @property
+    def timeframes(self) -> List[str]:
+        """规则引用的大周期（去重、保持出现顺序）"""
+        return list(dict.fromkeys(c.timeframe for c in self.conditions if c.timeframe is not None))
+
+    def _register(self, cond: Condition, index_by_key: Dict[Tuple[Any, ...], int]) -> int:
+        resolved = _resolve_condition(cond)
+        if resolved is None:
+            return _NEVER
+        entry = SIGNAL_KERNELS.get(resolved[1])
+        if entry is None or entry[0] != resolved[0]:
+            return _NEVER
+
+        key = _condition_key(resolved, cond)
+        if key not in index_by_key:
+            index_by_key[key] = len(self.conditions)
+            self.conditions.append(
+                CompiledCondition(resolved[0], resolved[1], entry[1], cond, condition_timeframe(cond))
+            )
+        return index_by_key[key]
+
+    @staticmethod
+    def _combine(groups: List[Tuple[LogicOp, Tuple[int, ...]]], results: List[Any], never: Any) -> Any:
+        """按 AND/OR 合并组内条件结果，多个组之间为 OR 关系（标量与数组通用）"""
+        group_results = []
+        for logic, indices in groups:
+            values = [results[i] if i != _NEVER else never for i in indices]
+            if not values:
+                group_results.append(never)
+            elif logic == LogicOp.AND:
+                group_results.append(np.logical_and.reduce(values))
+            else:
+                group_results.append(np.logical_or.reduce(values))
+        if not group_results:
+            return never
+        return np.logical_or.reduce(group_results)
+
+    def evaluate(self, df: pd.DataFrame, timer: Optional[PhaseTimer] = None) -> RuleSetSignals:
+        """整段序列求值：每个去重后的条件只计算一次，结果在四个方向间共享；
+        传入 timer 时按 SignalType 记录各条件的求值次数与耗时"""
+        results: List[np.ndarray] = []
+        for c in self.conditions:
+            if timer is None:
+                results.append(c.series(df))
+                continue
+            start = time.perf_counter()
+            results.append(c.series(df))
+            timer.count_signal(c.signal_type.value, time.perf_counter() - start)
+        never = _false(df)
+        return RuleSetSignals(
+            **{side: np.asarray(self._combine(self.sides[side], results, never), dtype=bool) for side, _ in RULE_SIDES}
+        )
+
+    def evaluate_at(self, df: pd.DataFrame, idx: int) -> Dict[str, bool]:
+        """单根 Bar 求值（实盘等只关心最新一根的场景），只在尾部少量 Bar 上计算，每个条件同样只计算一次"""
+        results = [c.at(df, idx) for c in self.conditions]
+        return {side: bool(self._combine(self.sides[side], results, False)) for side, _ in RULE_SIDES}
+
+    def side_at(self, side: str, df: pd.DataFrame, idx: int) -> bool:
+        memo: Dict[int, bool] = {}
+        for logic, indices in self.sides[side]:
+            values = []
+            for i in indices:
+                if i == _NEVER:
+                    values.append(False)
+                    continue
+                if i not in memo:
+                    memo[i] = self.conditions[i].at(df, idx)
+                values.append(memo[i])
+            if values and (all(values) if logic == LogicOp.AND else any(values)):
+                return True
+        return False
+
+
+def compile_rule_set(rule_set: Any) -> CompiledRuleSet:
+    """构建（或直接复用已构建的）CompiledRuleSet，每个策略只需编译一次"""
+    if isinstance(rule_set, CompiledRuleSet):
+        return rule_set
+    return CompiledRuleSet(rule_set)
+
+
+def compile_signals(rule_set: Any, df: pd.DataFrame) -> RuleSetSignals:
+    """一次性编译整段 K 线的开多/平多/开空/平空信号（df 需已计算好指标）"""
+    return compile_rule_set(rule_set).evaluate(df)
+
+
+def _should(rule_set: Any, df: pd.DataFrame, idx: int, side: str) -> bool:
+    if isinstance(rule_set, RuleSetSignals):
+        return bool(getattr(rule_set, side)[idx])
+    # 原始规则同样先编译：与回测共用同一套求值逻辑（指标参数、条件周期均生效）
+    return compile_rule_set(rule_set).side_at(side, df, idx)
 
 
 def should_open_long(rule_set: Any, df: pd.DataFrame, idx: int) -> bool:
-    """判断是否触发开多买入信号"""
-    norm = normalize_rule_set(rule_set)
-    groups = norm.get("open_long_groups") or norm.get("buy_groups") or []
-    for group in groups:
-        if evaluate_group(group, df, idx, Side.OPEN_LONG):
-            return True
-    return False
+    """判断是否触发开多买入信号（支持原始规则、CompiledRuleSet 与 RuleSetSignals）"""
+    return _should(rule_set, df, idx, "open_long")
 
 
 def should_close_long(rule_set: Any, df: pd.DataFrame, idx: int) -> bool:
-    """判断是否触发平多卖出信号"""
-    norm = normalize_rule_set(rule_set)
-    groups = norm.get("close_long_groups") or norm.get("sell_groups") or []
-    for group in groups:
-        if evaluate_group(group, df, idx, Side.CLOSE_LONG):
-            return True
-    return False
+    """判断是否触发平多卖出信号（支持原始规则、CompiledRuleSet 与 RuleSetSignals）"""
+    return _should(rule_set, df, idx, "close_long")
 
 
 def should_open_short(rule_set: Any, df: pd.DataFrame, idx: int) -> bool:
-    """判断是否触发开空卖出信号"""
-    norm = normalize_rule_set(rule_set)
-    groups = norm.get("open_short_groups") or []
-    for group in groups:
-        if evaluate_group(group, df, idx, Side.OPEN_SHORT):
-            return True
-    return False
+    """判断是否触发开空卖出信号（支持原始规则、CompiledRuleSet 与 RuleSetSignals）"""
+    return _should(rule_set, df, idx, "open_short")
 
 
 def should_close_short(rule_set: Any, df: pd.DataFrame, idx: int) -> bool:
-    """判断是否触发平空买入信号"""
-    norm = normalize_rule_set(rule_set)
-    groups = norm.get("close_short_groups") or []
-    for group in groups:
-        if evaluate_group(group, df, idx, Side.CLOSE_SHORT):
-            return True
-    return False
+    """判断是否触发平空买入信号（支持原始规则、CompiledRuleSet 与 RuleSetSignals）"""
+    return _should(rule_set, df, idx, "close_short")
 
 
 # 兼容老版调用
 should_buy = should_open_long
 should_sell = should_close_long
-
-
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# 分阶段耗时统计：
+#   - PhaseTimer 记录一次运行中各阶段的墙钟时间与本线程 CPU 时间（同名阶段多次进入时累加），
+#     结果以 timings 字段附在回测 / 寻优 / 组合结果上
+#   - 条件求值按 SignalType 计数并计时，便于找出开销大的条件
+#   - PhaseHistograms 按运行类型（backtest / optimizer / portfolio）把各阶段耗时汇总为进程级直方图，
+#     通过 /dashboard/timings 查看
+
+PHASE_KLINE_QUERY = "kline_query"  # 数据库读取 K 线
+PHASE_DATAFRAME_BUILD = "dataframe_build"  # 查询结果转为 DataFrame
+PHASE_INDICATORS = "indicators"  # compute_indicators
+PHASE_SIGNALS = "signals"  # 规则条件求值
+PHASE_SIMULATION = "simulation"  # 逐 Bar 撮合主循环
+PHASE_STATISTICS = "statistics"  # 绩效指标计算
+PHASE_SERIALIZATION = "serialization"  # 结果序列化为 JSON
+PHASE_EVALUATION = "evaluation"  # 寻优：全部参数组合的回测（含各组合的指标、信号与撮合）
+PHASE_RANKING = "ranking"  # 寻优：排序与汇总
+
+# 直方图桶上界(ms)，最后一个桶收纳更大的值
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class PhaseTimer:
+    """单次运行的分阶段计时器（非线程安全，每次运行各用一个）"""
+
+    def __init__(self, timings: Optional[Dict[str, Any]] = None) -> None:
+        self.phases: Dict[str, List[float]] = {}  # 阶段 -> [墙钟秒, CPU 秒]
+        self.signal_types: Dict[str, List[float]] = {}  # SignalType -> [求值次数, 墙钟秒]
+        if timings:
+            self.merge(timings)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def add(self, name: str, wall: float, cpu: float) -> None:
+        entry = self.phases.setdefault(name, [0.0, 0.0])
+        entry[0] += wall
+        entry[1] += cpu
+
+    def count_signal(self, signal_type: str, wall: float) -> None:
+        entry = self.signal_types.setdefault(signal_type, [0, 0.0])
+        entry[0] += 1
+        entry[1] += wall
+
+    def merge(self, timings: Dict[str, Any]) -> None:
+        """累加另一次运行的 to_dict() 结果"""
+        for name, value in (timings.get("phases") or {}).items():
+            self.add(name, value["wall_ms"] / 1000.0, value["cpu_ms"] / 1000.0)
+        for signal_type, value in (timings.get("signal_types") or {}).items():
+            entry = self.signal_types.setdefault(signal_type, [0, 0.0])
+            entry[0] += value["count"]
+            entry[1] += value["wall_ms"] / 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "phases": {
+                name: {"wall_ms": round(wall * 1000.0, 3), "cpu_ms": round(cpu * 1000.0, 3)}
+                for name, (wall, cpu) in self.phases.items()
+            },
+            "total_wall_ms": round(sum(wall for wall, _ in self.phases.values()) * 1000.0, 3),
+        }
+        if self.signal_types:
+            data["signal_types"] = {
+                signal_type: {"count": int(count), "wall_ms": round(wall * 1000.0, 3)}
+                for signal_type, (count, wall) in self.signal_types.items()
+            }
+        return data
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def observe(self, value_ms: float) -> None:
+        self.count += 1
+        self.sum_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value_ms)] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in HISTOGRAM_BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum_ms, 3),
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class PhaseHistograms:
+    """进程级耗时直方图：运行类型 -> 阶段 -> 墙钟耗时分布，另按 SignalType 汇总求值次数与耗时"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[str, _Histogram]] = {}
+        self._signal_types: Dict[str, List[float]] = {}
+
+    def record(self, kind: str, timings: Dict[str, Any]) -> None:
+        """记录一次运行的 PhaseTimer.to_dict() 结果"""
+        with self._lock:
+            phases = self._histograms.setdefault(kind, {})
+            for name, value in (timings.get("phases") or {}).items():
+                phases.setdefault(name, _Histogram()).observe(value["wall_ms"])
+            if "total_wall_ms" in timings:
+                phases.setdefault("total", _Histogram()).observe(timings["total_wall_ms"])
+            for signal_type, value in (timings.get("signal_types") or {}).items():
+                entry = self._signal_types.setdefault(signal_type, [0, 0.0])
+                entry[0] += value["count"]
+                entry[1] += value["wall_ms"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bucket_bounds_ms": list(HISTOGRAM_BUCKETS_MS),
+                "runs": {
+                    kind: {name: hist.to_dict() for name, hist in phases.items()}
+                    for kind, phases in self._histograms.items()
+                },
+                "signal_types": {
+                    signal_type: {
+                        "count": int(count),
+                        "wall_ms": round(wall_ms, 3),
+                        "mean_ms": round(wall_ms / count, 4) if count else 0.0,
+                    }
+                    for signal_type, (count, wall_ms) in sorted(
+                        self._signal_types.items(), key=lambda item: item[1][1], reverse=True
+                    )
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._signal_types.clear()
+
+
+phase_histograms = PhaseHistograms()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.models import BacktestTrade
+
+# 回测成交记录：循环内只向平行列表追加数值，交易明细 dict 与 ORM 对象只在 API 边界按需生成，
+# 参数寻优中大量一次性回测不再构造 SQLAlchemy 对象。
+
+LONG = 1
+SHORT = -1
+
+# 平仓原因编码，与 trades_list 中的 exit_reason 一一对应
+EXIT_REASONS = ("STOP_LOSS", "TAKE_PROFIT", "TRAILING_STOP", "SIGNAL_CLOSE_LONG", "SIGNAL_CLOSE_SHORT")
+EXIT_REASON_CODES: Dict[str, int] = {reason: code for code, reason in enumerate(EXIT_REASONS)}
+
+
+def bar_datetime(raw_ts: Any) -> datetime:
+    return raw_ts if isinstance(raw_ts, datetime) else datetime.fromisoformat(str(raw_ts))
+
+
+class TradeLog:
+    """按列保存开仓成交与已平仓交易（每笔一个下标），回测结束后可整体转为 NumPy 数组"""
+
+    __slots__ = (
+        "ts_values",
+        "open_idx",
+        "open_side",
+        "open_price",
+        "open_qty",
+        "open_fee",
+        "entry_idx",
+        "exit_idx",
+        "side",
+        "entry_price",
+        "exit_price",
+        "qty",
+        "exit_fee",
+        "total_fee",
+        "pnl",
+        "pnl_pct",
+        "reason",
+        "_dicts",
+    )
+
+    def __init__(self, ts_values: Sequence[Any]) -> None:
+        self.ts_values = ts_values  # K 线时间列，仅在生成明细时按下标取用
+        # 开仓成交
+        self.open_idx: List[int] = []
+        self.open_side: List[int] = []
+        self.open_price: List[float] = []
+        self.open_qty: List[float] = []
+        self.open_fee: List[float] = []
+        # 已平仓交易
+        self.entry_idx: List[int] = []
+        self.exit_idx: List[int] = []
+        self.side: List[int] = []
+        self.entry_price: List[float] = []
+        self.exit_price: List[float] = []
+        self.qty: List[float] = []
+        self.exit_fee: List[float] = []
+        self.total_fee: List[float] = []
+        self.pnl: List[float] = []
+        self.pnl_pct: List[float] = []
+        self.reason: List[int] = []
+        self._dicts: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self.pnl)
+
+    def record_open(self, idx: int, side: int, price: float, qty: float, fee: float) -> None:
+        self.open_idx.append(idx)
+        self.open_side.append(side)
+        self.open_price.append(price)
+        self.open_qty.append(qty)
+        self.open_fee.append(fee)
+
+    def record_close(
+        self,
+        entry_idx: int,
+        exit_idx: int,
+        side: int,
+        entry_price: float,
+        exit_price: float,
+        qty: float,
+        exit_fee: float,
+        total_fee: float,
+        pnl: float,
+        pnl_pct: float,
+        reason: str,
+    ) -> None:
+        self.entry_idx.append(entry_idx)
+        self.exit_idx.append(exit_idx)
+        self.side.append(side)
+        self.entry_price.append(entry_price)
+        self.exit_price.append(exit_price)
+        self.qty.append(qty)
+        self.exit_fee.append(exit_fee)
+        self.total_fee.append(total_fee)
+        self.pnl.append(pnl)
+        self.pnl_pct.append(pnl_pct)
+        self.reason.append(EXIT_REASON_CODES[reason])
+        self._dicts = None
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """已平仓交易的平行数组"""
+        return {
+            "entry_idx": np.asarray(self.entry_idx, dtype=np.int64),
+            "exit_idx": np.asarray(self.exit_idx, dtype=np.int64),
+            "side": np.asarray(self.side, dtype=np.int8),
+            "entry_price": np.asarray(self.entry_price, dtype=np.float64),
+            "exit_price": np.asarray(self.exit_price, dtype=np.float64),
+            "qty": np.asarray(self.qty, dtype=np.float64),
+            "exit_fee": np.asarray(self.exit_fee, dtype=np.float64),
+            "total_fee": np.asarray(self.total_fee, dtype=np.float64),
+            "pnl": np.asarray(self.pnl, dtype=np.float64),
+            "pnl_pct": np.asarray(self.pnl_pct, dtype=np.float64),
+            "reason": np.asarray(self.reason, dtype=np.int8),
+        }
+
+    def rounded_pnls(self) -> np.ndarray:
+        """与 trades_list 中一致的盈亏（保留两位小数），用于胜率、盈亏比等统计"""
+        return np.fromiter((round(p, 2) for p in self.pnl), dtype=np.float64, count=len(self.pnl))
+
+    def _iso(self, idx: int) -> str:
+        return bar_datetime(self.ts_values[idx]).isoformat()
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """逐笔交易明细（trades_list），首次调用时生成并缓存"""
+        if self._dicts is None:
+            self._dicts = [
+                {
+                    "id": i + 1,
+                    "position_side": "LONG" if self.side[i] == LONG else "SHORT",
+                    "entry_time": self._iso(self.entry_idx[i]),
+                    "entry_price": round(self.entry_price[i], 4),
+                    "exit_time": self._iso(self.exit_idx[i]),
+                    "exit_price": round(self.exit_price[i], 4),
+                    "qty": round(self.qty[i], 4),
+                    "pnl": round(self.pnl[i], 2),
+                    "pnl_pct": round(self.pnl_pct[i], 2),
+                    "fee": round(self.total_fee[i], 2),
+                    "exit_reason": EXIT_REASONS[self.reason[i]],
+                    "holding_bars": self.exit_idx[i] - self.entry_idx[i],
+                }
+                for i in range(len(self.pnl))
+            ]
+        return self._dicts
+
+    def to_orm(self, backtest_id: int = 0) -> List[BacktestTrade]:
+        """按时间顺序生成开仓 / 平仓成交的 BacktestTrade 行（同一根 Bar 不会既平仓又开仓）"""
+        fills = []
+        for i, idx in enumerate(self.open_idx):
+            side = "BUY" if self.open_side[i] == LONG else "SELL"  # 开空为卖出开仓
+            fills.append((idx, side, self.open_price[i], self.open_qty[i], self.open_fee[i], 0.0))
+        for i, idx in enumerate(self.exit_idx):
+            side = "SELL" if self.side[i] == LONG else "BUY"  # 平空为买入平仓
+            fills.append((idx, side, self.exit_price[i], self.qty[i], self.exit_fee[i], self.pnl[i]))
+        fills.sort(key=lambda fill: fill[0])
+
+        return [
+            BacktestTrade(
+                backtest_id=backtest_id,
+                side=side,
+                ts=bar_datetime(self.ts_values[idx]),
+                price=price,
+                qty=qty,
+                fee=fee,
+                pnl=pnl,
+            )
+            for idx, side, price, qty, fee, pnl in fills
+        ]
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from app.services.backtest_engine import adopt_indicator_columns
+from app.services.equity_curve import DISPLAY_MAX_POINTS, EquityCurve, downsample_curves
+from app.services.metrics import annualize_return, compute_metrics, is_saturated, periods_per_year
+from app.services.optimizer import (
+    backtest_combination,
+    compute_search_indicators,
+    run_grid_search,
+    sample_combinations,
+    slice_klines,
+)
+from app.services.param_search import ParamSpace
+from app.services.shared_klines import SharedKlines, SharedKlinesSpec, attach_shared_klines
+from app.services.strategy_engine import CompiledRuleSet, compile_rule_set
+
+# 滚动前推（walk-forward）寻优：
+#   - K 线区间切成 n_folds 个相邻的测试折，每个测试折之前的一段为训练折（rolling 固定长度 / anchored 从头起算）
+#   - 训练折与测试折之间可留出 purge_bars 根 K 线的隔离带，避免训练末尾的持仓与指标窗口泄漏到测试折
+#   - 各训练折独立寻优（多进程按折并行），最优参数在紧随其后的测试折上回测，样本外净值按折首尾相接
+#   - 指标在完整区间上只计算一次，各折直接截取
+
+MIN_FOLD_BARS = 30
+
+
+@dataclass
+class WalkForwardFold:
+    index: int
+    train_start: int  # 训练折 [train_start, train_stop)
+    train_stop: int
+    test_start: int  # 测试折 [test_start, test_stop)
+    test_stop: int
+
+
+def make_folds(
+    n_bars: int,
+    n_folds: int,
+    train_test_ratio: float = 3.0,
+    anchored: bool = False,
+    purge_bars: int = 0,
+) -> List[WalkForwardFold]:
+    """划分训练 / 测试折：测试折等长且首尾相接铺满区间末尾，rolling 模式的训练折长度约为测试折的 train_test_ratio 倍"""
+    if n_folds < 1:
+        raise ValueError("n_folds 必须大于 0")
+    if train_test_ratio <= 0:
+        raise ValueError("train_test_ratio 必须大于 0")
+    purge_bars = max(0, purge_bars)
+    test_bars = int((n_bars - purge_bars) // (train_test_ratio + n_folds))
+    train_bars = n_bars - purge_bars - n_folds * test_bars
+    if test_bars < MIN_FOLD_BARS or train_bars < MIN_FOLD_BARS:
+        raise ValueError(f"K 线数量（{n_bars}）不足以划分 {n_folds} 折，请缩小折数或扩大时间范围")
+
+    folds = []
+    for k in range(n_folds):
+        test_start = n_bars - (n_folds - k) * test_bars
+        train_stop = test_start - purge_bars
+        folds.append(
+            WalkForwardFold(
+                index=k,
+                train_start=0 if anchored else train_stop - train_bars,
+                train_stop=train_stop,
+                test_start=test_start,
+                test_stop=test_start + test_bars,
+            )
+        )
+    return folds
+
+
+# 子进程状态：由 _init_fold_worker 在每个工作进程中初始化一次
+_fold_worker_state: Dict[str, Any] = {}
+
+
+def _init_fold_worker(spec: SharedKlinesSpec, source: Dict[str, Any], search_kwargs: Dict[str, Any]) -> None:
+    shm, df = attach_shared_klines(spec)
+    adopt_indicator_columns(df)
+    _fold_worker_state.update(shm=shm, df=df, source=source, search_kwargs=search_kwargs)
+
+
+def _optimize_fold(
+    df: pd.DataFrame,
+    source: Dict[str, Any],
+    fold: WalkForwardFold,
+    search_kwargs: Dict[str, Any],
+) -> Dict[str, Any]:
+    """在训练折上寻优，返回最优结果与评估的组合数"""
+    result = run_grid_search(
+        df=slice_klines(df, fold.train_start, fold.train_stop),
+        base_rule_set=source,
+        **search_kwargs,
+    )
+    return {"best_result": result["best_result"], "evaluated_combinations": result["evaluated_combinations"]}
+
+
+def _optimize_fold_in_worker(fold: WalkForwardFold) -> Tuple[int, Dict[str, Any]]:
+    state = _fold_worker_state
+    return fold.index, _optimize_fold(state["df"], state["source"], fold, state["search_kwargs"])
+
+
+def _bar_iso(df: pd.DataFrame, i: int) -> str:
+    return pd.Timestamp(df["ts"].iat[i]).isoformat()
+
+
+def run_walk_forward(
+    df: pd.DataFrame,
+    base_rule_set: Union[Dict[str, Any], CompiledRuleSet],
+    param_grid: Dict[str, List[Any]],
+    initial_balance: float = 10000.0,
+    n_folds: int = 5,
+    train_test_ratio: float = 3.0,
+    anchored: bool = False,
+    purge_bars: int = 0,
+    workers: Optional[int] = None,
+    max_combinations: int = 100,
+    search_mode: str = "grid",
+    n_samples: Optional[int] = None,
+    seed: Optional[int] = None,
+    halving_eta: int = 3,
+) -> Dict[str, Any]:
+    """滚动前推寻优：逐折训练寻优、样本外测试，并拼接样本外净值曲线
+
+    workers 为按折并行的进程数：None 时取 min(CPU 核数, 折数)，1 为在当前线程串行执行（折内寻优始终串行）。
+    寻优参数（max_combinations / search_mode / n_samples / seed / halving_eta）与 run_grid_search 相同。
+    """
+    start_time = time.time()
+    base_compiled = compile_rule_set(base_rule_set)
+    folds = make_folds(len(df), n_folds, train_test_ratio, anchored, purge_bars)
+
+    # 全部候选组合的指标在完整区间上一次算好，训练折 / 测试折直接截取
+    space = ParamSpace(param_grid)
+    budget = max_combinations if search_mode == "grid" or not n_samples else n_samples
+    compute_search_indicators(df, base_compiled, sample_combinations(space, search_mode, budget, seed))
+
+    search_kwargs: Dict[str, Any] = {
+        "param_grid": param_grid,
+        "initial_balance": initial_balance,
+        "max_combinations": max_combinations,
+        "workers": 1,
+        "search_mode": search_mode,
+        "n_samples": n_samples,
+        "seed": seed,
+        "top_k": 1,
+        "halving_eta": halving_eta,
+    }
+    if workers is None:
+        workers = max(1, min(os.cpu_count() or 1, len(folds)))
+
+    fold_results: Dict[int, Dict[str, Any]] = {}
+    if workers <= 1:
+        for fold in folds:
+            fold_results[fold.index] = _optimize_fold(df, base_compiled.source, fold, search_kwargs)
+    else:
+        with SharedKlines(df) as shared:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_fold_worker,
+                initargs=(shared.spec, base_compiled.source, search_kwargs),
+            ) as pool:
+                for index, fold_result in pool.map(_optimize_fold_in_worker, folds):
+                    fold_results[index] = fold_result
+
+    # 各折最优参数在测试折上回测，净值按上一折期末资金等比缩放后首尾相接
+    timeframe = df.attrs.get("timeframe")
+    per_year = periods_per_year(timeframe)
+    capital = initial_balance
+    bench_capital = initial_balance
+    equity_parts: List[np.ndarray] = []
+    bench_parts: List[np.ndarray] = []
+    ts_parts: List[np.ndarray] = []
+    pnl_parts: List[np.ndarray] = []
+    in_market_bars = 0.0
+    fold_rows: List[Dict[str, Any]] = []
+    train_annual: List[float] = []
+    utc = False
+    for fold in folds:
+        best = fold_results[fold.index]["best_result"]
+        params = best["params"] if best else {}
+        test_df = slice_klines(df, fold.test_start, fold.test_stop)
+        bt_res = backtest_combination(test_df, base_compiled, params, initial_balance)
+
+        scale = capital / initial_balance
+        equity_parts.append(bt_res.equity_curve.equity * scale)
+        bench_parts.append(bt_res.benchmark_curve.equity * (bench_capital / initial_balance))
+        ts_parts.append(bt_res.equity_curve.ts)
+        pnl_parts.append(bt_res.trade_log.rounded_pnls() * scale)
+        in_market_bars += bt_res.exposure / 100.0 * len(test_df)
+        utc = bt_res.equity_curve.utc
+        capital = float(equity_parts[-1][-1]) if len(equity_parts[-1]) else capital
+        bench_capital = float(bench_parts[-1][-1]) if len(bench_parts[-1]) else bench_capital
+
+        train_bars = fold.train_stop - fold.train_start
+        train_return = best["total_return"] if best else 0.0
+        if train_return > -100.0:
+            train_annual.append(annualize_return(1.0 + train_return / 100.0, max(1, train_bars - 1), per_year))
+        fold_rows.append(
+            {
+                "fold": fold.index + 1,
+                "train_start": _bar_iso(df, fold.train_start),
+                "train_end": _bar_iso(df, fold.train_stop - 1),
+                "test_start": _bar_iso(df, fold.test_start),
+                "test_end": _bar_iso(df, fold.test_stop - 1),
+                "train_bars": train_bars,
+                "test_bars": fold.test_stop - fold.test_start,
+                "best_params": params,
+                "train_score": best["score"] if best else None,
+                "train_total_return": round(train_return, 2),
+                "train_sharpe_ratio": best["sharpe_ratio"] if best else None,
+                "evaluated_combinations": fold_results[fold.index]["evaluated_combinations"],
+                "test_total_return": round(bt_res.total_return, 2),
+                "test_benchmark_return": round(bt_res.benchmark_return, 2),
+                "test_sharpe_ratio": round(bt_res.sharpe_ratio, 3),
+                "test_max_drawdown": round(bt_res.max_drawdown, 2),
+                "test_win_rate": round(bt_res.win_rate, 2),
+                "test_trade_count": bt_res.trade_count,
+            }
+        )
+
+    equity_curve = EquityCurve(ts=np.concatenate(ts_parts), equity=np.concatenate(equity_parts), utc=utc)
+    benchmark_curve = equity_curve.with_equity(np.concatenate(bench_parts))
+    oos = compute_metrics(equity_curve.equity, np.concatenate(pnl_parts), initial_balance, timeframe)
+    oos.exposure = in_market_bars / len(equity_curve) * 100.0 if len(equity_curve) else 0.0
+
+    # 前推效率：样本外年化收益 / 样本内（训练折最优）平均年化收益；
+    # 短周期小折的年化收益会溢出（被截断为最大浮点数），此时比值没有意义，不计算效率
+    efficiency: Optional[float] = None
+    if train_annual and not is_saturated(oos.annual_return) and not any(is_saturated(v) for v in train_annual):
+        mean_train_annual = float(np.mean(train_annual))
+        if mean_train_annual > 0:
+            ratio = oos.annual_return / mean_train_annual
+            efficiency = None if is_saturated(ratio) else round(ratio, 3)
+
+    display_eq, display_bench = downsample_curves(equity_curve, benchmark_curve, DISPLAY_MAX_POINTS)
+    return {
+        "n_folds": len(folds),
+        "anchored": anchored,
+        "purge_bars": purge_bars,
+        "workers": workers,
+        "elapsed_seconds": round(time.time() - start_time, 2),
+        "oos_metrics": {k: round(v, 3) if isinstance(v, float) else v for k, v in oos.to_dict().items()},
+        "oos_benchmark_return": round((bench_capital - initial_balance) / initial_balance * 100.0, 2),
+        "walk_forward_efficiency": efficiency,
+        "folds": fold_rows,
+        "equity_curve": display_eq.to_points(),
+        "benchmark_curve": display_bench.to_points(),
+        "equity_points_total": len(equity_curve),
+    }
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Dict, Tuple
 
 import pandas as pd
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -17,20 +17,54 @@ from app.models import (
 )
 from app.core.config import settings
 from app.services.backtest_engine import compute_indicators
-from app.services.strategy_engine import (
-    StrategyRuleSet,
-    should_buy,
-    should_sell,
-    should_open_long,
-    should_close_long,
-    should_open_short,
-    should_close_short,
-)
+from app.services.kline_coverage import bar_delta
+from app.services.kline_ingest import decode_candles
+from app.services.kline_store import PRICE_COLUMNS, load_klines_before
+from app.services.multi_timeframe import tag_klines
+from app.services.okx_client import OkxClient
+from app.services.strategy_engine import CompiledRuleSet, compile_rule_set
 
 
 
 scheduler = AsyncIOScheduler()
 
+# 本地已同步的 K 线中，最多再取这么多根接在交易所最新 K 线之前，用于指标预热
+LIVE_LOOKBACK_BARS = 500
+
+# 每个策略的规则只编译一次：strategy_id -> (config_json, CompiledRuleSet)，配置变更时自动重建
+_compiled_rule_sets: Dict[int, Tuple[str, CompiledRuleSet]] = {}
+
+
+def _get_compiled_rule_set(strategy: Strategy) -> CompiledRuleSet:
+    cached = _compiled_rule_sets.get(strategy.id)
+    if cached is None or cached[0] != strategy.config_json:
+        cached = (strategy.config_json, compile_rule_set(json.loads(strategy.config_json)))
+        _compiled_rule_sets[strategy.id] = cached
+    return cached[1]
+
+
+def _live_kline_frame(db: Any, symbol_id: int, timeframe: str, rows: list) -> pd.DataFrame:
+    """交易所返回的最新 K 线（不带时区的 UTC 时间，按时间升序）；本地已同步且与之首尾相接的历史 K 线接在前面用于指标预热"""
+    page = decode_candles(rows)
+    fresh = pd.DataFrame(
+        {
+            "ts": (page.ts * 1000).view("datetime64[us]"),
+            "open": page.open,
+            "high": page.high,
+            "low": page.low,
+            "close": page.close,
+            "volume": page.volume,
+        }
+    )
+    if len(fresh):
+        first_ts = fresh["ts"].iloc[0].to_pydatetime()
+        history = load_klines_before(db, symbol_id, timeframe, first_ts, LIVE_LOOKBACK_BARS)
+        delta = bar_delta(timeframe)
+        if len(history) and delta is not None and history["ts"].iloc[-1] + delta == first_ts:
+            fresh = pd.concat([history[["ts", *PRICE_COLUMNS]], fresh], ignore_index=True)
+    tag_klines(fresh, symbol_id, timeframe)
+    return fresh
+
 
 async def _run_strategy_instance(instance_id: int) -> None:
     """执行实盘策略实例（使用.env中的OKX配置）"""
@@ -61,39 +95,28 @@ async def _run_strategy_instance(instance_id: int) -> None:
         )
 
         try:
-            # 使用实例的timeframe
-            candles_resp = await client.get_candles(symbol.inst_id, instance.timeframe, limit=200)
+            compiled = _get_compiled_rule_set(strategy)
+
+            # 使用实例的timeframe；规则引用大周期时多取一些 K 线，保证重采样后的大周期指标有足够预热
+            limit = 300 if compiled.timeframes else 200
+            candles_resp = await client.get_candles(symbol.inst_id, instance.timeframe, limit=limit)
             rows = candles_resp.get("data", []) if isinstance(candles_resp, dict) else []
             if not rows:
                 return
 
-            parsed = []
-            for item in rows:
-                ts_ms = int(item[0])
-                ts = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
-                parsed.append(
-                    {
-                        "ts": ts,
-                        "open": float(item[1]),
-                        "high": float(item[2]),
-                        "low": float(item[3]),
-                        "close": float(item[4]),
-                        "volume": float(item[5]),
-                    }
-                )
-
-            df = pd.DataFrame(parsed).sort_values("ts").reset_index(drop=True)
-            df = compute_indicators(df)
+            df = _live_kline_frame(db, symbol.id, instance.timeframe, rows)
+            df = compute_indicators(df, required=compiled.required_columns)
 
-            rule_set: StrategyRuleSet = json.loads(strategy.config_json)
             idx = len(df) - 1
             if idx < 0:
                 return
 
-            open_long_sig = should_open_long(rule_set, df, idx) or should_buy(rule_set, df, idx)
-            close_long_sig = should_close_long(rule_set, df, idx) or should_sell(rule_set, df, idx)
-            open_short_sig = should_open_short(rule_set, df, idx)
-            close_short_sig = should_close_short(rule_set, df, idx)
+            # 实盘只关心最新一根 Bar，每个去重条件只计算一次
+            signals = compiled.evaluate_at(df, idx)
+            open_long_sig = signals["open_long"]
+            close_long_sig = signals["close_long"]
+            open_short_sig = signals["open_short"]
+            close_short_sig = signals["close_short"]
 
             trades = (
                 db.query(LiveTrade)
@@ -279,6 +279,19 @@ const BacktestsPage: React.FC = () => {
       })
   }
 
+  // 轮询回测状态，直到 FINISHED / FAILED / CANCELLED
+  const waitForBacktest = async (id: number): Promise<BacktestRow> => {
+    for (;;) {
+      await new Promise(resolve => setTimeout(resolve, 1000))
+      const progress = await api.get<{ status: string; progress: number }>(`/backtests/${id}/progress`)
+      if (progress.data.status !== 'PENDING' && progress.data.status !== 'RUNNING') {
+        const res = await api.get<BacktestRow>(`/backtests/${id}`)
+        return res.data
+      }
+      setRows(prev => prev.map(r => (r.id === id ? { ...r, status: progress.data.status } : r)))
+    }
+  }
+
   // 运行回测
   const handleRun = () => {
     form
@@ -300,13 +313,23 @@ const BacktestsPage: React.FC = () => {
         return api.post<BacktestRow>('/backtests/', payload)
       })
       .then(res => {
-        if (res) {
-          setRows(prev => [res.data, ...prev])
-          message.success('回测已完成！')
-          // 自动弹出回测结果
-          setCurrentResult(res.data)
-          setResultModal(true)
+        if (!res) return
+        // 回测在后台任务队列中执行，轮询直到结束
+        setRows(prev => [res.data, ...prev])
+        return waitForBacktest(res.data.id)
+      })
+      .then(row => {
+        if (!row) return
+        setRows(prev => prev.map(r => (r.id === row.id ? row : r)))
+        if (row.status !== 'FINISHED') {
+          const error = parseResult(row) as { error?: string } | null
+          message.error('回测失败: ' + (error?.error || row.status))
+          return
         }
+        message.success('回测已完成！')
+        // 自动弹出回测结果
+        setCurrentResult(row)
+        setResultModal(true)
       })
       .catch(err => {
         message.error('回测失败: ' + (err.response?.data?.detail || err.message))
@@ -706,6 +729,7 @@ const BacktestsPage: React.FC = () => {
                   RUNNING: 'processing',
                   PENDING: 'default',
                   FAILED: 'error',
+                  CANCELLED: 'warning',
                 }
                 return <Tag color={colorMap[status] || 'default'}>{status}</Tag>
               },
@@ -0,0 +1,44 @@
+import itertools
+from dataclasses import fields
+
+import pytest
+
+from app.services.backtest_engine import run_backtest
+from app.services.batch_backtest import ExitParams, run_exit_sweep
+from app.services.metrics import PerformanceMetrics
+from test_strategy_engine import _klines
+
+RULE_SET = {
+    "open_long_groups": [{"logic": "AND", "conditions": [{"indicator_type": "MACD", "signal_type": "MACD_GOLDEN_CROSS"}]}],
+    "close_long_groups": [{"logic": "AND", "conditions": [{"indicator_type": "RSI", "signal_type": "RSI_OVERBOUGHT", "params": {"threshold": 65}}]}],
+    "open_short_groups": [{"logic": "AND", "conditions": [{"indicator_type": "MACD", "signal_type": "MACD_DEAD_CROSS"}]}],
+    "close_short_groups": [{"logic": "AND", "conditions": [{"indicator_type": "RSI", "signal_type": "RSI_OVERSOLD", "params": {"threshold": 35}}]}],
+}
+
+EXIT_GRID = [
+    ExitParams(stop_loss, take_profit, trailing)
+    for stop_loss, take_profit, trailing in itertools.product((None, 1.5, 4.0), (None, 2.0, 6.0), (None, 1.0, 3.0))
+]
+
+
+@pytest.mark.parametrize("fee_rate, slippage_pct", [(0.0, 0.0), (0.001, 0.0005)])
+def test_exit_sweep_matches_run_backtest(fee_rate, slippage_pct):
+    # 批量状态机手工复刻了 run_backtest 的逐笔算术，逐组合比对全部统计指标
+    df = _klines(3000, seed=3)
+    sweep = run_exit_sweep(df, RULE_SET, EXIT_GRID, fee_rate=fee_rate, slippage_pct=slippage_pct)
+
+    assert len(sweep.metrics) == len(EXIT_GRID)
+    for params, metrics in zip(EXIT_GRID, sweep.metrics):
+        result = run_backtest(
+            df,
+            RULE_SET,
+            stop_loss_pct=params.stop_loss_pct,
+            take_profit_pct=params.take_profit_pct,
+            trailing_stop_pct=params.trailing_stop_pct,
+            fee_rate=fee_rate,
+            slippage_pct=slippage_pct,
+        )
+        assert result.trade_count > 0
+        for f in fields(PerformanceMetrics):
+            assert getattr(metrics, f.name) == getattr(result, f.name), (params, f.name)
+        assert sweep.benchmark_return == result.benchmark_return
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.kline_coverage import coverage_intervals, missing_intervals, record_coverage
+from app.services.kline_ingest import KlinePage, bulk_insert_klines
+
+T0 = datetime(2024, 1, 1)
+HOUR = timedelta(hours=1)
+
+
+def _h(n: int) -> datetime:
+    return T0 + n * HOUR
+
+
+def test_overlapping_intervals_merge(db):
+    record_coverage(db, 1, "1H", _h(0), _h(10))
+    record_coverage(db, 1, "1H", _h(5), _h(20))
+    record_coverage(db, 1, "1H", _h(30), _h(40))
+    record_coverage(db, 1, "1H", _h(25), _h(45))  # 完全包含 [30, 40]
+    assert coverage_intervals(db, 1, "1H") == [(_h(0), _h(20)), (_h(25), _h(45))]
+    assert missing_intervals(db, 1, "1H", _h(0), _h(50)) == [(_h(21), _h(24)), (_h(46), _h(50))]
+
+
+def test_adjacent_intervals_merge_only_when_one_step_apart(db):
+    record_coverage(db, 1, "1H", _h(0), _h(10))
+    record_coverage(db, 1, "1H", _h(11), _h(20))  # 下一根 K 线紧接着：合并
+    record_coverage(db, 1, "1H", _h(22), _h(30))  # 中间缺 _h(21) 一根：不合并
+    assert coverage_intervals(db, 1, "1H") == [(_h(0), _h(20)), (_h(22), _h(30))]
+    assert missing_intervals(db, 1, "1H", _h(0), _h(30)) == [(_h(21), _h(21))]
+    assert missing_intervals(db, 1, "1H", _h(2), _h(18)) == []
+
+
+def test_empty_coverage_is_rebuilt_from_klines(db):
+    hours = np.r_[np.arange(0, 10), np.arange(15, 20)]
+    ms = int((T0 - datetime(1970, 1, 1)).total_seconds() * 1000) + hours * 3_600_000
+    close = hours.astype(float)
+    bulk_insert_klines(db, 1, "1H", KlinePage(ms, close, close, close, close, close))
+    db.commit()
+
+    assert coverage_intervals(db, 1, "1H") == [(_h(0), _h(9)), (_h(15), _h(19))]
+    assert missing_intervals(db, 1, "1H", _h(0), _h(25)) == [(_h(10), _h(14)), (_h(20), _h(25))]
+
+
+def test_coverage_end_is_capped_to_closed_bars(db):
+    now = datetime.utcnow()
+    record_coverage(db, 1, "1H", now - 10 * HOUR, now + 5 * HOUR)
+    after = datetime.utcnow()
+    [(start, end)] = coverage_intervals(db, 1, "1H")
+    assert start == now - 10 * HOUR
+    # 最新一根未收盘的 K 线不算已同步：终点不晚于当前时间减一根 K 线
+    assert now - HOUR <= end <= after - HOUR
+
+    record_coverage(db, 1, "1H", now - HOUR / 2, now + HOUR)  # 整段都未收盘：不登记
+    assert coverage_intervals(db, 1, "1H") == [(start, end)]
@@ -0,0 +1,45 @@
+from app.models import Kline
+from app.services.kline_ingest import bulk_insert_klines, decode_candles
+
+BASE_MS = 1704067200000
+
+
+def _rows(minutes) -> list:
+    # OKX candles 接口格式：字符串数组，从新到旧
+    return [
+        [str(BASE_MS + m * 60000), str(100 + m), str(101 + m), str(99 + m), str(100.5 + m), "3", "0", "0", "1"]
+        for m in sorted(minutes, reverse=True)
+    ]
+
+
+def test_inserting_the_same_page_twice_skips_existing_rows(db):
+    page = decode_candles(_rows(range(0, 100)))
+    assert bulk_insert_klines(db, 1, "1m", page) == 100
+    db.commit()
+    assert bulk_insert_klines(db, 1, "1m", page) == 0
+    db.commit()
+    assert db.query(Kline).count() == 100
+
+
+def test_overlapping_page_inserts_only_new_rows(db):
+    bulk_insert_klines(db, 1, "1m", decode_candles(_rows(range(0, 100))))
+    db.commit()
+
+    page = decode_candles(_rows(range(80, 130)))
+    inserted = bulk_insert_klines(db, 1, "1m", page)
+    db.commit()
+    # sync_klines 中的已存在条数 = 页面条数 - 实际插入条数
+    assert inserted == 30
+    assert len(page) - inserted == 20
+
+    closes = [row.close for row in db.query(Kline).order_by(Kline.ts)]
+    assert closes == [100.5 + m for m in range(0, 130)]
+
+
+def test_same_timestamps_in_another_timeframe_are_inserted(db):
+    page = decode_candles(_rows(range(0, 10)))
+    assert bulk_insert_klines(db, 1, "1m", page) == 10
+    assert bulk_insert_klines(db, 1, "5m", page) == 10
+    assert bulk_insert_klines(db, 2, "1m", page) == 10
+    db.commit()
+    assert db.query(Kline).count() == 30
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.services.kline_ingest import KlinePage, bulk_insert_klines
+from app.services.kline_store import NpyKlineStore, load_klines_before
+
+BASE_MS = 1704067200000
+
+
+def _page(minutes: np.ndarray) -> KlinePage:
+    values = minutes.astype(float)
+    return KlinePage(BASE_MS + minutes * 60000, values, values + 1, values - 1, values, values * 2)
+
+
+def _sync(db, store: NpyKlineStore, minutes: np.ndarray) -> None:
+    # 与 sync_klines 相同的顺序：先写库并提交，再追加到列存
+    page = _page(minutes)
+    bulk_insert_klines(db, 1, "1m", page)
+    db.commit()
+    store.append(db, 1, "1m", page)
+
+
+def _generation(root) -> Optional[Path]:
+    """磁盘上 CURRENT 指向的代目录；尚无列存文件时为 None"""
+    pointer = Path(root) / "1" / "1m" / "CURRENT"
+    if not pointer.exists():
+        return None
+    return pointer.parent / pointer.read_text().strip()
+
+
+def _assert_aligned(db, store: NpyKlineStore, expected_minutes: np.ndarray) -> None:
+    columns = store.read_columns(db, 1, "1m")
+    minutes = (columns["ts"].view(np.int64) // 1000 - BASE_MS) // 60000
+    np.testing.assert_array_equal(minutes, expected_minutes)
+    np.testing.assert_array_equal(columns["close"], minutes.astype(float))
+    np.testing.assert_array_equal(columns["volume"], minutes * 2.0)
+
+
+def test_backfill_switches_to_a_new_generation(db, tmp_path):
+    store = NpyKlineStore(str(tmp_path / "store"))
+    _sync(db, store, np.arange(100, 200))
+    first = _generation(store.root)
+    assert first is not None and first.is_dir()
+
+    _sync(db, store, np.arange(150, 260))  # 重叠 + 尾部：原地追加
+    assert _generation(store.root) == first
+    _assert_aligned(db, store, np.arange(100, 260))
+
+    _sync(db, store, np.arange(0, 120))  # 回补历史：新的一代
+    second = _generation(store.root)
+    assert second != first and second.is_dir() and not first.exists()
+    _assert_aligned(db, store, np.arange(0, 260))
+
+
+def test_reader_keeps_its_generation_after_replacement(db, tmp_path):
+    store = NpyKlineStore(str(tmp_path / "store"))
+    _sync(db, store, np.arange(100, 200))
+    before = store.read_columns(db, 1, "1m")
+    _sync(db, store, np.arange(0, 50))
+    assert len(before["ts"]) == 100
+    np.testing.assert_array_equal(before["close"], np.arange(100, 200, dtype=float))
+    _assert_aligned(db, store, np.r_[np.arange(0, 50), np.arange(100, 200)])
+
+
+def test_drop_reexports_from_database(db, tmp_path):
+    store = NpyKlineStore(str(tmp_path / "store"))
+    _sync(db, store, np.arange(0, 100))
+    store.drop(1, "1m")
+    assert _generation(store.root) is None
+
+    _assert_aligned(db, store, np.arange(0, 100))
+    assert _generation(store.root) is not None
+
+
+def _minute(minute: float) -> datetime:
+    return datetime.fromtimestamp(BASE_MS / 1000, tz=timezone.utc) + timedelta(minutes=minute)
+
+
+def test_load_klines_before_returns_bars_strictly_before(db):
+    bulk_insert_klines(db, 1, "1m", _page(np.arange(0, 100)))
+    db.commit()
+
+    def minutes(before: datetime, count: int) -> list:
+        df = load_klines_before(db, 1, "1m", before, count)
+        return df["close"].astype(int).tolist()
+
+    assert minutes(_minute(50), 10) == list(range(40, 50))
+    assert minutes(_minute(50.5), 10) == list(range(41, 51))
+    assert minutes(_minute(5), 10) == list(range(0, 5))
+    assert minutes(_minute(0), 10) == []
+    assert minutes(_minute(50), 0) == []
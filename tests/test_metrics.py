@@ -0,0 +1,27 @@
+import math
+
+import numpy as np
+
+from app.services.metrics import annualize_return, compute_metrics, is_saturated
+
+
+def test_short_profitable_run_does_not_overflow():
+    # 60 根 1m Bar 盈利 30%：复利外推到一年会溢出浮点数
+    metrics = compute_metrics(np.linspace(10000, 13000, 60), np.array([3000.0]), 10000.0, "1m")
+    assert math.isfinite(metrics.annual_return)
+    assert is_saturated(metrics.annual_return)
+    assert math.isfinite(metrics.calmar_ratio)
+
+
+def test_annualize_return_matches_power_formula():
+    expected = (1.3 ** (365 / 5999) - 1.0) * 100.0
+    assert math.isclose(annualize_return(1.3, 5999, 365.0), expected, rel_tol=1e-12)
+    assert annualize_return(0.5, 10, 365.0) > -100.0
+    assert annualize_return(0.0, 10, 365.0) == 0.0
+    assert annualize_return(1.1, 0, 365.0) == 0.0
+
+
+def test_small_walk_forward_fold_annualization_does_not_overflow():
+    # MIN_FOLD_BARS=30 的 1m 训练折：1.1 ** (525600 / 29) 溢出
+    assert is_saturated(annualize_return(1.1, 29, 525600.0))
+    assert not is_saturated(annualize_return(1.1, 525600, 525600.0))
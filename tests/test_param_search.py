@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.services.optimizer import sample_combinations
+from app.services.param_search import (
+    ParamSpace,
+    TopK,
+    halving_rungs,
+    latin_hypercube_combinations,
+    random_combinations,
+)
+
+SPACE = ParamSpace({"fast": list(range(5, 25)), "slow": list(range(20, 60, 2)), "threshold": [20, 25, 30, 35]})
+
+
+@pytest.mark.parametrize("search_mode", ["random", "lhs", "halving"])
+def test_fixed_seed_reproduces_samples(search_mode):
+    first = sample_combinations(SPACE, search_mode, 50, seed=7)
+    assert first == sample_combinations(SPACE, search_mode, 50, seed=7)
+    assert first != sample_combinations(SPACE, search_mode, 50, seed=8)
+
+
+@pytest.mark.parametrize("n", [10, 200, 1000])
+def test_random_samples_are_distinct(n):
+    samples = list(random_combinations(SPACE, n, seed=1))
+    assert len(samples) == n
+    assert len({tuple(s.values()) for s in samples}) == n
+
+
+def test_random_returns_whole_grid_when_budget_exceeds_it():
+    small = ParamSpace({"a": [1, 2], "b": [3, 4, 5]})
+    assert list(random_combinations(small, 10, seed=1)) == [
+        {"a": a, "b": b} for a in (1, 2) for b in (3, 4, 5)
+    ]
+
+
+def test_lhs_covers_every_stratum_once():
+    n = 10
+    space = ParamSpace({"a": list(range(10)), "b": list(range(20)), "c": list(range(40))})
+    samples = list(latin_hypercube_combinations(space, n, seed=3))
+    assert len(samples) == n
+    for key, values in zip(space.keys, space.values):
+        # 每个维度的 n 层各被抽中一次：取值所在层的编号恰好是 0..n-1 的一个排列
+        strata = sorted(values.index(s[key]) * n // len(values) for s in samples)
+        assert strata == list(range(n))
+
+
+def test_halving_rungs_shrink_candidates_and_grow_bars():
+    assert halving_rungs(27, 8100, 3, 100) == [(27, 300), (9, 900), (3, 2700), (1, 8100)]
+    rungs = halving_rungs(50, 5000, 3, 200)
+    assert rungs[0][0] == 50 and rungs[-1][1] == 5000
+    assert all(a[0] >= b[0] and a[1] < b[1] for a, b in zip(rungs, rungs[1:]))
+    assert all(bars >= 200 for _, bars in rungs)
+
+
+def test_topk_keeps_best_from_unordered_input():
+    scores = list(np.random.default_rng(0).normal(size=500))
+    order = list(range(len(scores)))
+    random.Random(0).shuffle(order)
+
+    board = TopK(5)
+    for index in order:
+        board.push(index, {"score": scores[index], "index": index})
+
+    ranked = board.ranked()
+    expected = sorted(range(len(scores)), key=lambda i: -scores[i])[:5]
+    assert [row["index"] for row in ranked] == expected
+    assert [row["rank"] for row in ranked] == [1, 2, 3, 4, 5]
+    assert board.count == len(scores)
+
+
+def test_topk_prefers_lower_index_on_ties():
+    board = TopK(2)
+    for index in (3, 1, 2, 0):
+        board.push(index, {"score": 1.0, "index": index})
+    assert [row["index"] for row in board.ranked()] == [0, 1]
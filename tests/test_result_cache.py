@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.models import Kline
+from app.services.kline_ingest import KlinePage, bulk_insert_klines
+from app.services.result_cache import query_fingerprint
+
+BASE_MS = 1704067200000
+
+
+def _seed(db, n: int = 500) -> None:
+    close = 40000.0 + np.arange(n, dtype=float)
+    page = KlinePage(BASE_MS + np.arange(n) * 60000, close, close + 5, close - 5, close, np.full(n, 2.0))
+    bulk_insert_klines(db, 1, "1m", page)
+    db.commit()
+
+
+def _fingerprint(db) -> dict:
+    return query_fingerprint(db, 1, "1m", None, None)
+
+
+def _bar(db, index: int) -> Kline:
+    return db.query(Kline).order_by(Kline.ts).offset(index).first()
+
+
+def test_fingerprint_is_stable_for_unchanged_data(db):
+    _seed(db)
+    assert _fingerprint(db) == _fingerprint(db)
+
+
+def test_fingerprint_changes_on_small_correction(db):
+    _seed(db)
+    before = _fingerprint(db)
+    _bar(db, 250).close += 0.01
+    db.commit()
+    assert _fingerprint(db) != before
+
+
+def test_fingerprint_changes_on_cancelling_edits(db):
+    _seed(db)
+    before = _fingerprint(db)
+    _bar(db, 10).close += 1.0
+    _bar(db, 400).close -= 1.0
+    db.commit()
+    assert _fingerprint(db) != before
+
+
+def test_fingerprint_changes_when_a_bar_is_rewritten(db):
+    _seed(db)
+    before = _fingerprint(db)
+    bar = _bar(db, 250)
+    values = {name: getattr(bar, name) for name in ("symbol_id", "timeframe", "ts", "open", "high", "low", "close", "volume")}
+    db.delete(bar)
+    db.commit()
+    db.add(Kline(**values))
+    db.commit()
+    assert _fingerprint(db) != before
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.rolling import rolling_mad, rolling_max, rolling_mean, rolling_min, rolling_std
+
+
+def _series_with_gaps() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    values = 50000.0 + np.cumsum(rng.normal(size=20000))
+    values[[0, 5, 9000, 9001, 15000, -1]] = np.nan
+    values[12000:12030] = np.nan
+    return values
+
+
+def _exact_std(values: np.ndarray, window: int) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    for i in range(len(values)):
+        chunk = values[max(0, i - window + 1) : i + 1]
+        chunk = chunk[~np.isnan(chunk)]
+        if len(chunk):
+            out[i] = chunk.std()
+    return out
+
+
+def test_nan_only_affects_windows_that_contain_it():
+    # 单个 NaN 不能扩散到整个前缀和分块：NaN 位置与 pandas rolling(min_periods=1) 完全一致
+    values = _series_with_gaps()
+    for window in (1, 3, 20):
+        expected = pd.Series(values).rolling(window, min_periods=1)
+        for actual, reference in (
+            (rolling_mean(values, window), expected.mean()),
+            (rolling_std(values, window), expected.std(ddof=0)),
+            (rolling_min(values, window), expected.min()),
+            (rolling_max(values, window), expected.max()),
+        ):
+            reference = reference.to_numpy()
+            np.testing.assert_array_equal(np.isnan(actual), np.isnan(reference))
+            np.testing.assert_allclose(actual, reference, rtol=0, atol=1e-3, equal_nan=True)
+
+
+def test_std_with_nan_matches_exact_window_std():
+    values = _series_with_gaps()
+    np.testing.assert_allclose(rolling_std(values, 14), _exact_std(values, 14), rtol=0, atol=1e-4, equal_nan=True)
+
+
+def _pandas_mad(values: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    rolling = pd.Series(values).rolling(window, min_periods=min_periods)
+    return rolling.apply(lambda x: np.abs(x - x.mean()).mean(), raw=True).to_numpy()
+
+
+@pytest.mark.parametrize("with_nan", [False, True])
+def test_mad_matches_pandas_apply(with_nan):
+    values = _series_with_gaps()
+    if not with_nan:
+        values = np.nan_to_num(values, nan=50000.0)
+    for window in (1, 3, 14, 20):
+        actual = rolling_mad(values, window)
+        # 完整窗口与 rolling(window) 一致，前 window-1 根与 min_periods=1 一致；含 NaN 的窗口为 NaN
+        full = _pandas_mad(values, window, window)
+        np.testing.assert_allclose(actual[window - 1 :], full[window - 1 :], rtol=0, atol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(actual, _pandas_mad(values, window, 1), rtol=0, atol=1e-9, equal_nan=True)
+        assert np.isnan(actual).any() == with_nan
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.backtest_engine import compute_indicators
+from app.services.multi_timeframe import TIMEFRAME_DELTAS, resample_klines, tag_klines
+from app.services.strategy_engine import compile_rule_set, evaluate_condition_series, should_open_long
+
+
+def _klines(n: int = 550, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+    spread = np.abs(rng.normal(0.0, 0.005, n)) * close
+    df = pd.DataFrame(
+        {
+            "ts": pd.date_range("2024-01-01", periods=n, freq="h"),
+            "open": np.r_[close[0], close[:-1]],
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "volume": rng.uniform(1.0, 10.0, n),
+        }
+    )
+    tag_klines(df, "TEST", "1H")
+    return df
+
+
+def _assert_raw_matches_compiled(rule_set: dict, bars: int = 80) -> None:
+    compiled = compile_rule_set(rule_set)
+    df = compute_indicators(_klines(), required=compiled.required_columns)
+    signals = compiled.evaluate(df)
+    raw = [should_open_long(rule_set, df, idx) for idx in range(len(df) - bars, len(df))]
+    expected = signals.open_long[len(df) - bars :].tolist()
+    assert raw == expected
+    assert any(expected) and not all(expected)
+
+
+def test_raw_rule_set_uses_indicator_params():
+    rule_set = {
+        "open_long_groups": [
+            {
+                "logic": "AND",
+                "conditions": [
+                    {"indicator_type": "RSI", "signal_type": "RSI_OVERSOLD", "params": {"period": 30, "threshold": 50}}
+                ],
+            }
+        ]
+    }
+    _assert_raw_matches_compiled(rule_set)
+
+
+@pytest.mark.parametrize(
+    "indicator_type, signal_type",
+    [
+        ("RSI", "RSI_TURN_UP"),
+        ("KDJ", "KDJ_TURN_UP"),
+        ("CANDLE", "CANDLE_THREE_RED_SOLDIERS"),
+        ("CANDLE", "CANDLE_MORNING_STAR"),
+        ("MACD", "MACD_ABOVE_ZERO"),
+    ],
+)
+def test_condition_timeframe_fires_on_higher_timeframe_bars(indicator_type, signal_type):
+    # 真值：基础 K 线重采样到 4H 后不带 timeframe 计算同一条件，信号只在对应 4H Bar 收盘的 1H K 线上触发
+    cond = {"indicator_type": indicator_type, "signal_type": signal_type, "params": {}}
+    rule_set = {"open_long_groups": [{"logic": "AND", "conditions": [dict(cond, timeframe="4H")]}]}
+    df = _klines(4000)
+
+    higher = compute_indicators(resample_klines(df, "4H", TIMEFRAME_DELTAS["1H"]))
+    fired = evaluate_condition_series(cond, higher)
+    expected = pd.to_datetime(higher["ts"][fired]).dt.tz_localize(None).tolist()
+    assert expected
+
+    compiled = compile_rule_set(rule_set)
+    df = compute_indicators(df, required=compiled.required_columns)
+    signals = compiled.evaluate(df)
+    assert df["ts"][signals.open_long].tolist() == expected
+
+    raw = [should_open_long(rule_set, df, idx) for idx in range(len(df) - 80, len(df))]
+    assert raw == signals.open_long[-80:].tolist()